@@ -0,0 +1,11 @@
+"""
+Benchmarks for the Dwitter request paths.
+
+The benchmarks run against a throwaway test database (just like `manage.py test` does), so your own
+`db.sqlite3` is never touched. Run them from the `week-3` directory, for example:
+
+    python -m benchmarks.request_paths --users 50 --roots 200 --fanout 3 --depth 2 --output before.json
+    python -m benchmarks.compare before.json after.json
+
+Every benchmark writes its results as JSON, so that runs (e.g. before and after a change) can be compared.
+"""
@@ -0,0 +1,53 @@
+"""
+Compare two benchmark result files (e.g. before and after a change).
+
+    python -m benchmarks.compare before.json after.json
+
+Prints every numeric result present in both files, with the relative change.
+"""
+import argparse
+import json
+
+# these keys describe the run rather than measure it
+SKIPPED_KEYS = {"environment", "dataset", "benchmark"}
+
+
+def flatten(results, prefix=""):
+    """
+    Flatten nested result dicts into {"path / to / value": number}.
+    """
+    flat = {}
+    for key, value in results.items():
+        if not prefix and key in SKIPPED_KEYS:
+            continue
+        name = f"{prefix} / {key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before", help="baseline results (JSON)")
+    parser.add_argument("after", help="new results (JSON)")
+    args = parser.parse_args(argv)
+
+    with open(args.before) as before_file, open(args.after) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+    if before.get("dataset") != after.get("dataset"):
+        print("warning: the two runs used different datasets")
+
+    before, after = flatten(before), flatten(after)
+    width = max((len(name) for name in before if name in after), default=0)
+    for name, old in before.items():
+        if name not in after:
+            continue
+        new = after[name]
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"{name:<{width}}  {old:>12}  {new:>12}  {change:>8}")
+
+
+if __name__ == "__main__":
+    main()
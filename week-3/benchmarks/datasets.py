@@ -0,0 +1,57 @@
+"""
+Seed configurable datasets for the benchmarks.
+
+A dataset is made of `users` users, `roots` root tweets (tweets that are not replies), and a reply tree under
+each root where every tweet gets `fanout` replies, down to `depth` levels of replies.
+"""
+import random
+from dataclasses import dataclass, asdict
+
+# all the seeded users share this password (so that the login benchmarks can use it)
+PASSWORD = "bench-password-123"
+
+
+@dataclass
+class Dataset:
+    users: int = 50
+    roots: int = 200
+    fanout: int = 2
+    depth: int = 2
+    seed: int = 0
+
+    @property
+    def tweets(self):
+        # roots * (1 + fanout + fanout^2 + ... + fanout^depth)
+        return self.roots * sum(self.fanout**level for level in range(self.depth + 1))
+
+    def as_dict(self):
+        return dict(asdict(self), tweets=self.tweets)
+
+
+def seed(dataset, batch_size=1000):
+    """
+    Populate the (test) database with the given dataset and return the list of created users.
+
+    Everything is created with bulk_create, level by level (see dwitter/apps/tweets/seeding.py, which generates
+    less regular, more realistic datasets for `manage.py seed_dwitter`).
+    """
+    from dwitter.apps.tweets.models import Tweet
+    from dwitter.apps.tweets.seeding import create_users
+
+    rng = random.Random(dataset.seed)
+    users = create_users(dataset.users, PASSWORD, batch_size=batch_size)
+
+    level = Tweet.objects.bulk_create(
+        [Tweet(user=rng.choice(users), text=f"root tweet {i}") for i in range(dataset.roots)],
+        batch_size=batch_size,
+    )
+    for depth in range(1, dataset.depth + 1):
+        level = Tweet.objects.bulk_create(
+            [
+                Tweet(user=rng.choice(users), reply_to=parent, text=f"reply {i} at depth {depth}")
+                for parent in level
+                for i in range(dataset.fanout)
+            ],
+            batch_size=batch_size,
+        )
+    return users
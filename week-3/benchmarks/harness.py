@@ -0,0 +1,140 @@
+"""
+Shared helpers for the benchmarks: django setup, a throwaway test database, timing and result files.
+"""
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+# the benchmarks are run from the week-3 directory (next to manage.py), make sure the project is importable
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+if str(PROJECT_DIR) not in sys.path:
+    sys.path.insert(0, str(PROJECT_DIR))
+
+
+def setup_django():
+    """
+    Configure django (like manage.py does) and return the django module.
+    """
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "dwitter.settings")
+    # the benchmarks post many tweets in a row, which the write throttles would reject
+    os.environ.setdefault("WRITE_THROTTLE_USER_RATE", "None")
+    os.environ.setdefault("WRITE_THROTTLE_GLOBAL_RATE", "None")
+    import django
+
+    django.setup()
+    return django
+
+
+@contextmanager
+def test_database(verbosity=0):
+    """
+    Create a throwaway test database (see https://docs.djangoproject.com/en/4.1/topics/testing/advanced/#django.test.utils.setup_databases)
+    and tear it down when the benchmark is done.
+    """
+    from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=verbosity, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=verbosity)
+        teardown_test_environment()
+
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(values, scale=1.0, digits=3):
+    """
+    Summarize a list of samples (min, mean, percentiles and max), scaled by `scale` (e.g. 1000 for seconds -> ms).
+    """
+    values = sorted(v * scale for v in values)
+    if not values:
+        return {}
+    return {
+        "min": round(values[0], digits),
+        "mean": round(sum(values) / len(values), digits),
+        "p50": round(percentile(values, 0.50), digits),
+        "p90": round(percentile(values, 0.90), digits),
+        "p99": round(percentile(values, 0.99), digits),
+        "max": round(values[-1], digits),
+    }
+
+
+def measure(call, iterations, warmup=2, memory_iterations=5):
+    """
+    Measure a request path, `call` is a function that issues a single request and returns the response.
+
+    Latency is measured without tracing memory allocations (tracemalloc slows down python considerably), and the
+    memory per request (peak of traced allocations) is measured in a separate, shorter pass.
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    for _ in range(warmup):
+        call()
+
+    latencies, queries, statuses = [], [], {}
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = call()
+            latencies.append(time.perf_counter() - start)
+        queries.append(len(captured.captured_queries))
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    peaks = []
+    for _ in range(min(memory_iterations, iterations)):
+        gc.collect()
+        tracemalloc.start()
+        call()
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return {
+        "iterations": iterations,
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "latency_ms": summarize(latencies, scale=1000),
+        "queries": summarize(queries, digits=2),
+        "memory_peak_kb": summarize(peaks, scale=1 / 1024, digits=1),
+    }
+
+
+def environment():
+    """
+    Describe the environment the benchmark was run in (stored next to the results).
+    """
+    import django
+
+    return {
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def write_results(results, output=None):
+    """
+    Write the results as JSON to `output` (a path), or print them when no output is given.
+    """
+    text = json.dumps(results, indent=2, sort_keys=False)
+    if output:
+        Path(output).write_text(text + "\n")
+        print(f"results written to {output}")
+    else:
+        print(text)
@@ -0,0 +1,73 @@
+"""
+Benchmark the API renderers: bytes and encode time per page of serialized tweets.
+
+    python -m benchmarks.renderers --page-sizes 5 20 100 --fanout 3 --depth 2 --output renderers.json
+
+The tweets are serialized once (with the serializer used by the tweets API), and then every page is encoded
+`--iterations` times with each renderer.
+"""
+import argparse
+import time
+
+from .harness import setup_django, test_database, summarize, environment, write_results
+from .datasets import Dataset, seed
+
+
+def renderer_classes():
+    from rest_framework.renderers import JSONRenderer
+    from dwitter import renderers
+
+    classes = {"rest_framework.JSONRenderer": JSONRenderer}
+    if renderers.orjson is not None:
+        classes["FastJSONRenderer"] = renderers.FastJSONRenderer
+    if renderers.msgpack is not None:
+        classes["MessagePackRenderer"] = renderers.MessagePackRenderer
+    return classes
+
+
+def serialized_page(page_size):
+    """
+    The data the tweets API would render for a page of `page_size` tweets.
+    """
+    from dwitter.apps.tweets.models import Tweet
+    from dwitter.apps.tweets.serializers import TweetViewSerializer
+
+    page = Tweet.objects.filter(reply_to=None).order_by("id")[:page_size]
+    return TweetViewSerializer(page, many=True).data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[5, 20, 100], help="number of root tweets per page")
+    parser.add_argument("--users", type=int, default=Dataset.users, help="number of users to seed")
+    parser.add_argument("--fanout", type=int, default=Dataset.fanout, help="number of replies for each tweet")
+    parser.add_argument("--depth", type=int, default=Dataset.depth, help="depth of the reply trees")
+    parser.add_argument("--iterations", type=int, default=200, help="number of encodings per page and renderer")
+    parser.add_argument("--output", help="write the results (JSON) to this file instead of printing them")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    dataset = Dataset(users=args.users, roots=max(args.page_sizes), fanout=args.fanout, depth=args.depth)
+    results = {"benchmark": "renderers", "environment": environment(), "dataset": dataset.as_dict(), "pages": {}}
+    with test_database():
+        seed(dataset)
+        classes = renderer_classes()
+        for page_size in args.page_sizes:
+            data = serialized_page(page_size)
+            page_results = results["pages"][f"{page_size} tweets"] = {}
+            for name, renderer_class in classes.items():
+                renderer = renderer_class()
+                encoded = renderer.render(data, renderer.media_type, {})
+                durations = []
+                for _ in range(args.iterations):
+                    start = time.perf_counter()
+                    renderer.render(data, renderer.media_type, {})
+                    durations.append(time.perf_counter() - start)
+                page_results[name] = {"bytes": len(encoded), "encode_ms": summarize(durations, scale=1000, digits=4)}
+                print(f"{page_size} tweets, {name}: {len(encoded)} bytes, {page_results[name]['encode_ms']['p50']} ms")
+    write_results(results, args.output)
+    return results
+
+
+if __name__ == "__main__":
+    main()
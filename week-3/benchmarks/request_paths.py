@@ -0,0 +1,96 @@
+"""
+Benchmark the main Dwitter request paths: latency percentiles, queries per request and memory per request.
+
+    python -m benchmarks.request_paths --users 50 --roots 200 --fanout 3 --depth 2 --iterations 30 --output run.json
+
+Benchmarked paths:
+    * `TweetsListView` (the HTML index page)
+    * `TweetsAPIViewSet` list, retrieve and create
+    * `AccountsAPIViewSet` login and retrieve
+    * signup (`AccountsAPIViewSet` create)
+"""
+import argparse
+import itertools
+
+from .harness import setup_django, test_database, measure, environment, write_results
+from .datasets import Dataset, PASSWORD, seed
+
+
+def scenarios(users):
+    """
+    Build the benchmarked request paths, as a dict of name -> function issuing a single request.
+    """
+    from django.test import Client
+    from rest_framework.authtoken.models import Token
+    from dwitter.apps.tweets.models import Tweet
+
+    user = users[0]
+    # the html views use session authentication, and the apis use token authentication
+    session_client = Client()
+    session_client.force_login(user)
+    api_client = Client(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=user).key}")
+    anonymous_client = Client()
+
+    root = Tweet.objects.filter(reply_to=None).order_by("id").first()
+    signup_counter = itertools.count()
+
+    def signup():
+        index = next(signup_counter)
+        return anonymous_client.post(
+            "/api/accounts/",
+            {
+                "username": f"signup{index}",
+                "password": PASSWORD,
+                "password2": PASSWORD,
+                "first_name": "Bench",
+                "last_name": "Mark",
+                "email": f"signup{index}@example.com",
+            },
+            content_type="application/json",
+        )
+
+    return {
+        "TweetsListView": lambda: session_client.get("/"),
+        "TweetsAPIViewSet.list": lambda: api_client.get("/api/tweets/"),
+        "TweetsAPIViewSet.retrieve": lambda: api_client.get(f"/api/tweets/{root.pk}/"),
+        "TweetsAPIViewSet.create": lambda: api_client.post(
+            "/api/tweets/", {"text": "benchmark tweet"}, content_type="application/json"
+        ),
+        "AccountsAPIViewSet.login": lambda: anonymous_client.post(
+            "/api/accounts/login/",
+            {"username": user.username, "password": PASSWORD},
+            content_type="application/json",
+        ),
+        "AccountsAPIViewSet.retrieve": lambda: api_client.get(f"/api/accounts/{user.username}/"),
+        "AccountsAPIViewSet.create (signup)": signup,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=Dataset.users, help="number of users to seed")
+    parser.add_argument("--roots", type=int, default=Dataset.roots, help="number of root tweets to seed")
+    parser.add_argument("--fanout", type=int, default=Dataset.fanout, help="number of replies for each tweet")
+    parser.add_argument("--depth", type=int, default=Dataset.depth, help="depth of the reply trees")
+    parser.add_argument("--seed", type=int, default=Dataset.seed, help="random seed for the dataset")
+    parser.add_argument("--iterations", type=int, default=30, help="number of measured requests per path")
+    parser.add_argument("--only", nargs="*", help="only run the paths whose names contain any of these strings")
+    parser.add_argument("--output", help="write the results (JSON) to this file instead of printing them")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    dataset = Dataset(users=args.users, roots=args.roots, fanout=args.fanout, depth=args.depth, seed=args.seed)
+    results = {"benchmark": "request_paths", "environment": environment(), "dataset": dataset.as_dict(), "paths": {}}
+    with test_database():
+        users = seed(dataset)
+        for name, call in scenarios(users).items():
+            if args.only and not any(part in name for part in args.only):
+                continue
+            print(f"benchmarking {name} ...")
+            results["paths"][name] = measure(call, iterations=args.iterations)
+    write_results(results, args.output)
+    return results
+
+
+if __name__ == "__main__":
+    main()
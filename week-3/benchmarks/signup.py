@@ -0,0 +1,90 @@
+"""
+Benchmark signups: signups per second through the signup API (`AccountsAPIViewSet.create`), and through the
+SignupSerializer alone (validation and saving, without the request/response handling).
+
+    python -m benchmarks.signup --iterations 50 --output signup.json
+    python -m benchmarks.signup --fast-hasher  # leave out the password hashing, to see what the rest costs
+
+Password hashing (PBKDF2, see https://docs.djangoproject.com/en/4.1/topics/auth/passwords/) is made slow on purpose,
+and takes most of the time of a signup. With `--fast-hasher` the passwords are hashed with a fast (insecure) hasher,
+so that the cost of everything else (validation, password validators, queries) shows up.
+"""
+import argparse
+import itertools
+import time
+
+from .harness import setup_django, test_database, summarize, environment, write_results
+from .datasets import PASSWORD
+
+
+def signup_data(index):
+    return {
+        "username": f"signup{index}",
+        "password": PASSWORD,
+        "password2": PASSWORD,
+        "first_name": "Bench",
+        "last_name": "Mark",
+        "email": f"signup{index}@example.com",
+    }
+
+
+def run(name, call, iterations):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    durations, queries = [], []
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            call()
+            durations.append(time.perf_counter() - start)
+        queries.append(len(captured.captured_queries))
+    result = {
+        "iterations": iterations,
+        "signups_per_second": round(iterations / sum(durations), 2),
+        "latency_ms": summarize(durations, scale=1000),
+        "queries": summarize(queries, digits=2),
+    }
+    print(f"{name}: {result['signups_per_second']} signups/s, {result['queries']['p50']} queries per signup")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=30, help="number of signups per benchmark")
+    parser.add_argument("--fast-hasher", action="store_true", help="hash the passwords with a fast (insecure) hasher")
+    parser.add_argument("--output", help="write the results (JSON) to this file instead of printing them")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.test import Client
+    from django.test.utils import override_settings
+    from dwitter.apps.accounts.serializers import SignupSerializer
+
+    hashers = ["django.contrib.auth.hashers.MD5PasswordHasher"] if args.fast_hasher else None
+    results = {"benchmark": "signup", "environment": environment(), "fast_hasher": args.fast_hasher, "paths": {}}
+    counter = itertools.count()
+
+    def api_signup():
+        response = client.post("/api/accounts/", signup_data(next(counter)), content_type="application/json")
+        assert response.status_code == 201, response.content
+
+    def serializer_signup():
+        serializer = SignupSerializer(data=signup_data(next(counter)))
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+    # (the hashing pool's worker processes don't see overridden settings, so the fast hasher is used in this process)
+    fast_settings = {"PASSWORD_HASHERS": hashers, "PASSWORD_HASHING_WORKERS": 0} if hashers else {}
+    with test_database(), override_settings(**fast_settings):
+        client = Client()
+        # the first signup loads the password validators (e.g. the common passwords list), it's not measured
+        api_signup()
+        results["paths"]["AccountsAPIViewSet.create (signup)"] = run("API", api_signup, args.iterations)
+        results["paths"]["SignupSerializer"] = run("SignupSerializer", serializer_signup, args.iterations)
+    write_results(results, args.output)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark the startup of a worker: the time from starting a fresh python process to the response of its first request
+(importing django and the project, setting it up, loading the urls, and handling the request), for a few paths.
+
+    python -m benchmarks.startup --runs 10 --output startup.json
+
+Every run is a new process (like a new worker of a web server), the processes import nothing beforehand.
+See also `python manage.py startup_profile`, which shows what the startup time is spent on.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from .harness import PROJECT_DIR, setup_django, summarize, environment, write_results
+
+PATHS = {
+    "login page (html)": "/accounts/login/",
+    "index (redirect to login)": "/",
+    "API root": "/api/",
+}
+
+# run in the fresh process: set django up, then issue the first request (the timings are sent back as JSON)
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {project_dir!r})
+from benchmarks.harness import setup_django
+setup_django()
+setup = time.perf_counter()
+from django.test import Client
+response = Client().get({path!r})
+done = time.perf_counter()
+print(json.dumps({{"setup": setup - start, "first_request": done - setup, "status": response.status_code}}))
+"""
+
+
+def run_once(path):
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD.format(project_dir=str(PROJECT_DIR), path=path)],
+        cwd=PROJECT_DIR,
+        env={**os.environ, "DEBUG": os.environ.get("DEBUG", "True")},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = time.perf_counter() - start
+    timings = json.loads(output.stdout.strip().splitlines()[-1])
+    return total, timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10, help="number of fresh processes per path")
+    parser.add_argument("--output", help="write the results (JSON) to this file instead of printing them")
+    args = parser.parse_args(argv)
+
+    setup_django()  # (only for the environment's description, the measured processes are separate)
+    results = {"benchmark": "startup", "environment": environment(), "paths": {}}
+    for name, path in PATHS.items():
+        totals, setups, first_requests, statuses = [], [], [], {}
+        for _ in range(args.runs):
+            total, timings = run_once(path)
+            totals.append(total)
+            setups.append(timings["setup"])
+            first_requests.append(timings["first_request"])
+            statuses[timings["status"]] = statuses.get(timings["status"], 0) + 1
+        results["paths"][name] = {
+            "path": path,
+            "runs": args.runs,
+            "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+            "time_to_first_response_ms": summarize(totals, scale=1000),
+            "setup_ms": summarize(setups, scale=1000),
+            "first_request_ms": summarize(first_requests, scale=1000),
+        }
+        print(f"{name}: {results['paths'][name]['time_to_first_response_ms']['p50']} ms to the first response (p50)")
+    write_results(results, args.output)
+    return results
+
+
+if __name__ == "__main__":
+    main()
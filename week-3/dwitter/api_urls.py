@@ -0,0 +1,38 @@
+"""
+The urls of the APIs, included at /api/ by dwitter/urls.py.
+"""
+from django.urls import include, path
+from dwitter.apps.accounts import api_views as accounts_api_views  # ADDITION
+from dwitter.apps.accounts import async_views as accounts_async_views  # ADDITION
+from dwitter.apps.tweets import api_views as tweets_api_views  # ADDITION
+from dwitter.apps.notifications import api_views as notifications_api_views  # ADDITION
+
+# Session 3: adding a base router for the APIs and connecting APIs to our django app urls (at /api/)
+from rest_framework import routers
+
+# Routers provide an easy way of automatically determining the URL conf.
+# we can use the DefaultRouter to create a default router that will register all our viewsets with it
+# see https://www.django-rest-framework.org/api-guide/routers/#defaultrouter for more info
+#
+router = routers.DefaultRouter()
+router.get_api_root_view().cls.__name__ = (
+    "Dwitter API"  # customize the name of the root view (shown in the browsable API)
+)
+router.get_api_root_view().cls.__doc__ = "Fully browsable API for the Dwitter project."  # customize the description of the root view (shown in the browsable API)
+
+# ADDITION: connect the rest viewsets to the router using router.register
+router.register("accounts", accounts_api_views.AccountsAPIViewSet, basename="accounts")
+router.register("tweets", tweets_api_views.TweetsAPIViewSet, basename="tweets")
+router.register("notifications", notifications_api_views.NotificationsAPIViewSet, basename="notifications")
+
+urlpatterns = [
+    # rest framework urls
+    path(
+        "auth/", include("rest_framework.urls", namespace="rest_framework")
+    ),  # ADDITION: include the rest framework urls (e.g.: for session auth in browsable api)
+    # ADDITION: login and signup are handled by async views (that hash passwords in worker processes, see accounts/async_views.py)
+    # they come before the router's urls, which they shadow
+    path("accounts/login/", accounts_async_views.login, name="accounts-login-async"),
+    path("accounts/", accounts_async_views.signup, name="accounts-signup-async"),
+    path("", include(router.urls)),  # ADDITION: include the api urls
+]
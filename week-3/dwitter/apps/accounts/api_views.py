@@ -0,0 +1,123 @@
+# Session 3: Addin Accounts APIs with Django REST Framework
+# (these used to live in views.py, they are imported lazily with the rest of the APIs, see dwitter/api_urls.py)
+import rest_framework
+from rest_framework import viewsets as drf_viewsets
+from rest_framework import mixins as drf_mixins
+from rest_framework.authtoken.serializers import AuthTokenSerializer
+from . import serializers, permissions, authentication
+from ..tweets import serializers as tweets_serializers, pagination as tweets_pagination
+from ..tweets.models import Tweet
+import django
+from django.contrib.auth import get_user_model
+
+
+class AccountsAPIViewSet(
+    drf_viewsets.GenericViewSet,
+    drf_mixins.CreateModelMixin,  # for model creation (signup)
+    drf_mixins.RetrieveModelMixin,  # for model retrieval (profile)
+    drf_mixins.UpdateModelMixin,  # for model update (profile update)
+):
+    # the docstring is used to generate the documentation for the API
+    """
+    API for user information management and retrieval
+
+    * **Login** [ [login](/api/accounts/login/) | `POST` ]: obtain a valid authentication token by sending valid credentials
+    * **Logout** [ [logout](/api/accounts/logout/) | `POST`]: invalidate currently owned authentication token
+    * **Retrieve User** [ `<username>` | `GET`, `PUT` ]: obtain user information (by looking up username) or update user information
+    * **Tweets** [ `<username>/tweets/` | `GET` ]: the tweets of the user, newest first, paginated with `cursor` (follow the `next` link) and `limit`;
+      only the tweets that are not replies unless `with_replies=true`, and they accept the `fields` and `expand` of the tweets API
+    """
+
+    lookup_field = "username"  # the field to use to look up the user (in this case, the username)
+    lookup_url_kwarg = "username"  # the url parameter to use to look up the user (in this case, the username)
+    authentication_classes = [
+        rest_framework.authentication.SessionAuthentication,
+        authentication.TokenAuthentication,  # token authentication that counts token lookups (see accounts/authentication.py)
+    ]  # the authentication classes to use for this viewset
+
+    queryset = get_user_model().objects.all()  # the queryset to use to look up the user
+
+    # the following function is used to get the serializer class to use for the view
+    # we override it to use different serializers for different rest_framework.decorators.actions
+    def get_serializer_class(self):
+        if self.action == "create":  # if the action is create (signup)
+            return serializers.SignupSerializer
+        if self.action in ["retrieve", "update"]:
+            if self.request.user.is_staff or (
+                "username" in self.request.parser_context["kwargs"]  # if retrieving/updating a specific user
+                and self.request.user.username == self.request.parser_context["kwargs"]["username"]
+            ):
+                # if the user is staff or the user is looking up their own profile
+                # they should be able to see and edit everything
+                return serializers.UserSerializer
+            else:
+                # otherwise, they should only be able to see and edit their own profile
+                return serializers.RestrictedUserSerializer
+        elif self.action == "login":
+            return AuthTokenSerializer
+        elif self.action == "logout":
+            # we don't need a serializer for the logout action
+            # (we just need to invalidate the token, and send a success response)
+            # so it suffices to return a dummy serializer (base django rest framework serializer)
+            return rest_framework.serializers.Serializer
+        return serializers.UserSerializer
+
+    # we override this function to use different permissions for different actions
+    def get_permissions(self):
+        """
+        Instantiates and returns the list of permissions that this view requires.
+        """
+        if self.action in ["create", "login"]:
+            # if the action is create (signup) or login (obtain token) then we don't need any permissions
+            permission_list = [rest_framework.permissions.AllowAny]
+        elif self.action in ["update", "partial_update"]:  # if the action is update/partial_update (profile update)
+            permission_list = [permissions.IsSelfOrAdmin, rest_framework.permissions.IsAuthenticated]
+        elif self.action in ["retrieve", "logout", "tweets"]:
+            permission_list = [rest_framework.permissions.IsAuthenticated]
+        else:
+            permission_list = [rest_framework.permissions.AllowAny]
+        return [permission() for permission in permission_list]
+
+    @rest_framework.decorators.action(methods=["POST"], detail=False)
+    def login(self, request, format=None):
+        """
+        Obtain an authentication token by providing valid credentials.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data["user"]
+        token, created = rest_framework.authtoken.models.Token.objects.get_or_create(user=user)
+        return rest_framework.response.Response({"token": token.key})
+
+    @rest_framework.decorators.action(methods=["POST"], detail=False)
+    def logout(self, request, format=None):
+        """
+        Invalidate the currently owned authentication token.
+
+        **Permissions** :
+
+        * _Authentication_ is required
+        """
+        django.shortcuts.get_object_or_404(rest_framework.authtoken.models.Token, user=request.user).delete()
+        return rest_framework.response.Response(status=rest_framework.status.HTTP_202_ACCEPTED)
+
+    # ADDITION: the timeline of a user, read with keyset pagination (newest first, see tweets/keyset.py)
+    # from the (user, created_at, id) indexes of the tweets (see TweetManager.posted_by in tweets/models.py)
+    @rest_framework.decorators.action(methods=["GET"], detail=True)
+    def tweets(self, request, username=None):
+        """
+        The tweets of the user, newest first, paginated with `cursor` (see the `next` link) and `limit`.
+        The replies of the user are listed too with `with_replies=true`.
+        """
+        user = django.shortcuts.get_object_or_404(get_user_model().objects.values("id"), username=username)
+        with_replies = request.query_params.get("with_replies", "").lower() in ("1", "true", "yes")
+        read_options = tweets_serializers.read_options(request.query_params, expand_replies=False)
+        values = tweets_serializers.read_values(read_options["fields"])
+        if "created_at" not in values:
+            values += ("created_at",)  # (the pages are ordered by created_at)
+        paginator = tweets_pagination.TimelinePagination()
+        page = paginator.paginate_queryset(
+            Tweet.objects.posted_by(user["id"], with_replies).values(*values), request, self
+        )
+        serializer = tweets_serializers.TweetReadSerializer(page, many=True, context={"read_options": read_options})
+        return paginator.get_paginated_response(serializer.data)
@@ -0,0 +1,144 @@
+"""
+Async versions of the login and signup APIs (AccountsAPIViewSet.login and AccountsAPIViewSet.create, see api_views.py).
+
+Logging in and signing up both hash a password, which takes tens of milliseconds of CPU. These views hash (and check)
+the passwords in a pool of worker processes (see hashing.py) and await the result, so while a burst of logins is being
+hashed the server keeps handling other requests (e.g. reading tweets). Under ASGI (e.g. `uvicorn dwitter.asgi:application`)
+that's what lets a single worker keep serving reads during a login storm, see https://docs.djangoproject.com/en/4.1/topics/async/
+
+The views take the same requests and give the same responses as the rest framework actions: they parse the bodies and
+render the responses with the viewset's parsers and (negotiated) renderers. They are routed in front of the router's urls
+(see dwitter/api_urls.py), and hand the requests they don't handle (the browsable API's forms, and the users logged in
+with a session, whose requests need rest framework's CSRF check) over to the rest framework views.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import APIException, NotAcceptable
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from . import api_views, hashing, serializers
+
+# the rest framework views, for the requests these views don't handle
+drf_login = api_views.AccountsAPIViewSet.as_view({"post": "login"})
+drf_signup = api_views.AccountsAPIViewSet.as_view({"post": "create"})
+
+
+def api_request(request):
+    # the request as rest framework sees it: its body is parsed with the viewset's parsers (JSON, forms, ...)
+    view = api_views.AccountsAPIViewSet
+    return Request(request, parsers=[parser() for parser in view.parser_classes], negotiator=view.content_negotiation_class())
+
+
+def negotiate(drf_request):
+    # the viewset's renderer for the request (JSON, MessagePack, ...), chosen like rest framework does (see dwitter/renderers.py)
+    view = api_views.AccountsAPIViewSet
+    renderers = [renderer() for renderer in view.renderer_classes]
+    try:
+        return view.content_negotiation_class().select_renderer(drf_request, renderers)
+    except NotAcceptable:  # (like rest framework, fall back to the first renderer)
+        return renderers[0], renderers[0].media_type
+
+
+def api_response(drf_request, data, status=200, headers=None):
+    # rendered by the negotiated renderer, like the responses of the rest framework views
+    response = Response(data, status=status, headers=headers)
+    response.accepted_renderer, response.accepted_media_type = negotiate(drf_request)
+    response.renderer_context = {"request": drf_request}
+    patch_vary_headers(response, ["Accept"])
+    return response.render()
+
+
+def overloaded_response(drf_request):
+    return api_response(
+        drf_request,
+        {"detail": "Too many logins and signups at the moment, please try again later."},
+        status=503,
+        headers={"Retry-After": "1"},
+    )
+
+
+async def handled(request, drf_request):
+    # only the POSTs of the clients that are not logged in with a session (e.g. the token clients) are handled here:
+    # the browsable API, other methods and the session users (rest framework checks their POSTs for a CSRF token, see
+    # https://www.django-rest-framework.org/api-guide/authentication/#sessionauthentication) are left to rest framework
+    if request.method != "POST" or negotiate(drf_request)[0].format == "api":
+        return False
+    user = await request.auser()
+    return not user.is_authenticated
+
+
+def required_errors(data, fields):
+    # the errors rest framework gives for missing fields
+    return {field: ["This field is required."] for field in fields if not data.get(field)}
+
+
+# the views are exempt from django's CSRF check like rest framework's views are: they only handle the requests that
+# are not authenticated with a session (see handled above), which a forged cross-site request can't take advantage of
+@csrf_exempt
+async def login(request):
+    """
+    Obtain an authentication token by providing valid credentials (see AccountsAPIViewSet.login).
+    """
+    drf_request = api_request(request)
+    if not await handled(request, drf_request):
+        return await sync_to_async(drf_login)(request)
+    try:
+        data = drf_request.data
+    except APIException as error:  # (e.g. a JSON parse error, or an unsupported media type)
+        return api_response(drf_request, {"detail": error.detail}, status=error.status_code)
+    errors = required_errors(data, ("username", "password"))
+    if errors:
+        return api_response(drf_request, errors, status=400)
+
+    # the same checks as django's ModelBackend (used by rest framework's AuthTokenSerializer)
+    User = get_user_model()
+    user = await User._default_manager.filter(**{User.USERNAME_FIELD: data["username"]}).afirst()
+    try:
+        if user is None:
+            # hash the password anyway, so that the response time doesn't tell whether the username exists
+            await hashing.make_password(data["password"])
+            correct = False
+        else:
+
+            async def upgrade_password(password_hash):
+                user.password = password_hash
+                await user.asave(update_fields=["password"])
+
+            correct = await hashing.check_password(data["password"], user.password, setter=upgrade_password)
+    except hashing.HashingOverloaded:
+        return overloaded_response(drf_request)
+    if not correct or user.is_active is False:
+        return api_response(drf_request, {"non_field_errors": ["Unable to log in with provided credentials."]}, status=400)
+
+    token, created = await Token.objects.aget_or_create(user=user)
+    return api_response(drf_request, {"token": token.key})
+
+
+@csrf_exempt
+async def signup(request):
+    """
+    Create an account (see AccountsAPIViewSet.create and the SignupSerializer).
+    """
+    drf_request = api_request(request)
+    if not await handled(request, drf_request):
+        return await sync_to_async(drf_signup)(request)
+    try:
+        data = drf_request.data
+    except APIException as error:
+        return api_response(drf_request, {"detail": error.detail}, status=error.status_code)
+
+    serializer = serializers.SignupSerializer(data=data)
+    # the validation runs queries (e.g. is the username taken?), so it runs in a thread
+    if not await sync_to_async(serializer.is_valid)():
+        return api_response(drf_request, serializer.errors, status=400)
+    try:
+        password_hash = await hashing.make_password(serializer.validated_data["password"])
+    except hashing.HashingOverloaded:
+        return overloaded_response(drf_request)
+    user = serializer.form.save(commit=False, password_hash=password_hash)
+    await user.asave()
+    return api_response(drf_request, serializer.data, status=201)
@@ -0,0 +1,19 @@
+from rest_framework import authentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from ..monitoring import metrics
+
+
+class TokenAuthentication(authentication.TokenAuthentication):
+    """
+    Rest framework's token authentication, counting the token lookups (and their results) in the metrics registry.
+    """
+
+    def authenticate_credentials(self, key):
+        try:
+            credentials = super().authenticate_credentials(key)
+        except AuthenticationFailed:
+            metrics.token_auth_lookups.inc("failure")
+            raise
+        metrics.token_auth_lookups.inc("success")
+        return credentials
@@ -23,7 +23,7 @@ class SignupForm(UserCreationForm):
     # So we can use this form in our signup view to create a new user (see dwitter/apps/accounts/views.py)
 
     # ADDITION: override the save method to save the first_name, last_name, and email fields
-    def save(self, commit=True):
+    def save(self, commit=True, password_hash=None):
         # We override the save method to save the first_name, last_name, and email fields
         # We do this because the UserCreationForm doesn't save these fields 
         # by default and doesn't account for field additions (i.e it doesn't know about the first_name, last_name, and email fields)
@@ -33,7 +33,14 @@ class SignupForm(UserCreationForm):
         # then we can set the instance's first_name, last_name, and email fields manually and then save it
         # if commit (the argument to this method) is True
         
-        user = super().save(commit=False)
+        # ADDITION: the password can also be given already hashed (password_hash), e.g. by the async signup view
+        # which hashes passwords off the request thread (see hashing.py), in which case it's not hashed again here
+        if password_hash is None:
+            user = super().save(commit=False)
+        else:
+            # (forms.ModelForm.save is what UserCreationForm.save calls before hashing the password)
+            user = forms.ModelForm.save(self, commit=False)
+            user.password = password_hash
         # self.cleaned_data is a dictionary of the form data that has been cleaned and validated
         # we can access the first_name, last_name,
         # and email fields from this dictionary and set them on the user instance
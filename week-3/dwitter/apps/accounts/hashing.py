@@ -0,0 +1,123 @@
+"""
+Password hashing off the request thread, in a bounded pool of worker processes.
+
+Hashing a password (PBKDF2 with hundreds of thousands of iterations, see https://docs.djangoproject.com/en/4.1/topics/auth/passwords/)
+takes tens of milliseconds of CPU, and holds the GIL all along: a burst of logins would stall every other request of the worker.
+So the login and signup views (see async_views.py) hash and check passwords in worker processes, and await the result,
+which leaves the worker free to serve other requests (e.g. reading tweets) in the meantime.
+
+* The pool has PASSWORD_HASHING_WORKERS processes, so at most that many passwords are hashed at the same time.
+* At most PASSWORD_HASHING_MAX_QUEUE hashes wait for a worker, more are rejected with HashingOverloaded (the views respond 503).
+* The time the hashes wait for a worker is recorded in the dwitter_password_hashing_queue_seconds metric (see /metrics).
+
+With PASSWORD_HASHING_WORKERS = 0 the passwords are hashed in a thread of the server instead (which doesn't block the event
+loop, but still holds the GIL).
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import hashers
+
+from ..monitoring import metrics
+
+
+class HashingOverloaded(Exception):
+    """
+    Too many passwords are already waiting to be hashed.
+    """
+
+
+_executor = None
+_lock = threading.Lock()
+# the hashes submitted to the pool that are not done yet (being hashed, or waiting for a worker)
+_pending = 0
+
+
+def _init_worker(settings_module):
+    # the workers are spawned (fresh python processes), so django has to be set up in them (for the PASSWORD_HASHERS setting)
+    os.environ["DJANGO_SETTINGS_MODULE"] = settings_module
+    import django
+
+    django.setup(set_prefix=False)
+
+
+def _make_password(password):
+    # (run in a worker) returns the hash, and when the worker started hashing it (to measure the queue time)
+    return hashers.make_password(password), time.time()
+
+
+def _check_password(password, encoded):
+    # (run in a worker) the setter (that upgrades outdated hashes) is called by the caller, see check_password below
+    return hashers.check_password(password, encoded), time.time()
+
+
+def get_executor():
+    """
+    The pool of hashing processes, started on first use (None when PASSWORD_HASHING_WORKERS is 0).
+    """
+    global _executor
+    workers = getattr(settings, "PASSWORD_HASHING_WORKERS", 0)
+    if not workers:
+        return None
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                # "spawn" rather than "fork": forking a process with threads (e.g. the server's) is unsafe
+                # see https://docs.python.org/3/library/multiprocessing.html#contexts-and-start-methods
+                _executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(os.environ.get("DJANGO_SETTINGS_MODULE", "dwitter.settings"),),
+                )
+    return _executor
+
+
+async def _run(function, *args):
+    global _pending
+    executor = get_executor()
+    if executor is None:
+        # (in a thread, hashing in the coroutine would block the event loop, and every other request with it)
+        return (await sync_to_async(function, thread_sensitive=False)(*args))[0]
+    with _lock:
+        if _pending >= settings.PASSWORD_HASHING_WORKERS + getattr(settings, "PASSWORD_HASHING_MAX_QUEUE", 64):
+            raise HashingOverloaded()
+        _pending += 1
+    submitted = time.time()
+    try:
+        result, started = await asyncio.wrap_future(executor.submit(function, *args))
+    finally:
+        with _lock:
+            _pending -= 1
+    metrics.password_hashing_queue_time.observe(max(0.0, started - submitted))
+    return result
+
+
+async def make_password(password):
+    """
+    Hash a password (like django.contrib.auth.hashers.make_password) in the pool.
+    """
+    return await _run(_make_password, password)
+
+
+async def check_password(password, encoded, setter=None):
+    """
+    Check a password against a hash (like django.contrib.auth.hashers.check_password) in the pool.
+    When the password is correct but its hash is outdated (e.g. fewer iterations than the current default), the password
+    is hashed again and `await setter(new_hash)` is called with the new hash, like user.check_password does.
+    """
+    if password is None or not hashers.is_password_usable(encoded):
+        return False
+    correct = await _run(_check_password, password, encoded)
+    if correct and setter is not None:
+        preferred = hashers.get_hasher("default")
+        hasher = hashers.identify_hasher(encoded)
+        if hasher.algorithm != preferred.algorithm or preferred.must_update(encoded):
+            await setter(await make_password(password))
+    return correct
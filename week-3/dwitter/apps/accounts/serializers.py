@@ -25,6 +25,9 @@ class SignupSerializer(serializers.ModelSerializer):
         # and not for reading data
         extra_kwargs = {
             "password": {"write_only": True, "style": {"input_type": "password"}},
+            # ADDITION: the SignupForm validates the username (including its uniqueness), so the serializer doesn't check it
+            # a second time (that would be a second query for the same username on every signup)
+            "username": {"validators": []},
         }
 
     def validate(self, data: dict) -> dict:
@@ -37,7 +40,9 @@ class SignupSerializer(serializers.ModelSerializer):
         # this will validate the data and return True if the data is valid
         # and False if the data is invalid
         if form.is_valid():
-            # if the data is valid, we can return the data
+            # if the data is valid, we keep the (validated) form, so that create() can save it without validating the data again
+            # (validating a signup runs all the password validators, see AUTH_PASSWORD_VALIDATORS in settings.py)
+            self.form = form
             return data
         else:
             # if the data is invalid, we can raise a serializers.ValidationError
@@ -47,14 +52,9 @@ class SignupSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data: dict) -> get_user_model():
         # we can override the create method to add custom logic for creating the user
-        # we can pass the validated data to the SignupForm class
-        # ADDITION: pass the validated data to the SignupForm class and call its save method
-        data = validated_data.copy()
-        data["password1"] = data["password"]
-        form = SignupForm(data=data)
-        # we can then call the save method of the form to create the user
-        # this will create the user and return the user
-        user = form.save(commit=False)
+        # ADDITION: the form has already been validated in validate(), so we just call its save method
+        # this will create the user (and hash its password) and return the user
+        user = self.form.save(commit=False)
         return user
 
     def save(self, **kwargs):
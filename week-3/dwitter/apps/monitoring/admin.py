@@ -0,0 +1,67 @@
+from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from .models import RequestProfile
+from .profiling import flame_graph
+
+
+# Request profiles are created by the ProfilerMiddleware (see middleware.py), so they are read only in the admin site
+class RequestProfileAdmin(admin.ModelAdmin):
+    model = RequestProfile
+    list_display = ("created_at", "method", "path", "view", "status", "duration_ms", "user", "flame_graph_link")
+    list_filter = ("view", "method")
+    search_fields = ("path", "view")
+    list_select_related = ("user",)
+    exclude = ("samples", "queries")
+    readonly_fields = ("flame_graph_link",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    # we add a custom admin view for the flame graph of a profile
+    # see https://docs.djangoproject.com/en/4.1/ref/contrib/admin/#django.contrib.admin.ModelAdmin.get_urls
+    def get_urls(self):
+        return [
+            path(
+                "<path:object_id>/flamegraph/",
+                self.admin_site.admin_view(self.flame_graph_view),
+                name="monitoring_requestprofile_flamegraph",
+            ),
+        ] + super().get_urls()
+
+    @admin.display(description="Flame graph")
+    def flame_graph_link(self, profile):
+        return format_html(
+            '<a href="{}">flame graph</a>', reverse("admin:monitoring_requestprofile_flamegraph", args=[profile.pk])
+        )
+
+    def flame_graph_view(self, request, object_id):
+        profile = get_object_or_404(RequestProfile, pk=object_id)
+        if not self.has_view_permission(request, profile):
+            raise PermissionDenied()
+        boxes = flame_graph(profile.samples)
+        for box in boxes:
+            # positions (in percents) for the template
+            box["left"], box["percent"] = f"{box['offset'] * 100:.3f}", f"{box['width'] * 100:.3f}"
+        context = dict(
+            self.admin_site.each_context(request),
+            title=f"Profile of {profile.method} {profile.path}",
+            opts=self.model._meta,
+            original=profile,
+            profile=profile,
+            boxes=boxes,
+            rows=max((box["depth"] for box in boxes), default=-1) + 1,
+            total_samples=sum(profile.samples.values()),
+            db_time_ms=round(sum(query["duration_ms"] for query in profile.queries), 3),
+        )
+        return TemplateResponse(request, "admin/monitoring/requestprofile/flamegraph.html", context)
+
+
+admin.site.register(RequestProfile, RequestProfileAdmin)
@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+
+
+class MonitoringConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'dwitter.apps.monitoring'
+    # request instrumentation (see middleware.py) and other operational tooling for the project
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from . import instrumentation
+
+        # the queries of every request are observed through a wrapper installed on every database connection
+        # see https://docs.djangoproject.com/en/4.1/ref/signals/#connection-created
+        connection_created.connect(instrumentation.install_execute_wrapper)
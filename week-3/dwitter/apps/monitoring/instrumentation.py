@@ -0,0 +1,205 @@
+"""
+Per-request instrumentation: database queries (count, time and the code location that issued them),
+and named timings (e.g. serialization and template rendering).
+
+The measurements of the request being handled are kept in a context variable (see https://docs.python.org/3/library/contextvars.html)
+so that any code (serializers, templates, ...) can add to them, without having access to the request object.
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+
+# the measurements of the request currently being handled (None when the instrumentation is disabled)
+_current = ContextVar("dwitter_request_measurements", default=None)
+
+# query locations are looked up in the frames between the query and this package (the middleware)
+_MONITORING_DIR = str(Path(__file__).resolve().parent)
+_ORM_DIR = os.path.join("django", "db", "")
+_SITE_PACKAGES = os.path.join("site-packages", "")
+
+
+class RequestMeasurements:
+    """
+    Everything measured while handling a single request.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        # code location -> [number of queries, total time]
+        self.query_locations = {}
+        # timing name -> total time
+        self.timings = {}
+        # names of the timings that are currently running (to avoid counting nested/recursive timings twice)
+        self._active = set()
+
+    @property
+    def duration(self):
+        return time.perf_counter() - self.started
+
+    def add_timing(self, name, duration):
+        self.timings[name] = self.timings.get(name, 0.0) + duration
+
+    def add_query(self, location, duration):
+        self.queries += 1
+        self.db_time += duration
+        stats = self.query_locations.setdefault(location, [0, 0.0])
+        stats[0] += 1
+        stats[1] += duration
+
+
+def current():
+    """
+    Return the measurements of the current request (or None if the instrumentation is disabled).
+    """
+    return _current.get()
+
+
+@contextmanager
+def measuring(measurements):
+    """
+    Make `measurements` the measurements of the current request, for the duration of the block.
+    """
+    token = _current.set(measurements)
+    try:
+        yield measurements
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed(name):
+    """
+    Add the time spent in the block to the `name` timing of the current request.
+
+    Nested blocks with the same name (e.g. a serializer serializing its replies) are only counted once.
+    When the instrumentation is disabled, this does nothing.
+    """
+    measurements = _current.get()
+    if measurements is None or name in measurements._active:
+        yield
+        return
+    measurements._active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        measurements._active.discard(name)
+        measurements.add_timing(name, time.perf_counter() - start)
+
+
+def query_location():
+    """
+    Find the code location that issued the query being executed.
+
+    We walk up the stack (up to the instrumentation middleware) and report the first frame in the project's code
+    (e.g. "dwitter/apps/tweets/serializers.py:52 get_replies"), or if there is none, the first frame outside of
+    django's ORM (e.g. "rest_framework/authentication.py:195 authenticate_credentials").
+    Queries issued while rendering a template are reported at the template line that issued them (e.g. "user_tweets.html:18"),
+    since template lines don't show up as python frames.
+    """
+    from django.template.base import Node
+
+    base_dir = str(settings.BASE_DIR)
+    template_location = fallback = None
+    frame = sys._getframe(1)
+    # skip our own frames (the execute wrapper) first
+    while frame is not None and frame.f_code.co_filename.startswith(_MONITORING_DIR):
+        frame = frame.f_back
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_MONITORING_DIR):
+            break
+        if filename.startswith(base_dir) and _SITE_PACKAGES not in filename:
+            location = f"{Path(filename).relative_to(base_dir)}:{frame.f_lineno} {frame.f_code.co_name}"
+            return f"{template_location} via {location}" if template_location else location
+        if fallback is None and _ORM_DIR not in filename:
+            fallback = f"{filename.rpartition(_SITE_PACKAGES)[2]}:{frame.f_lineno} {frame.f_code.co_name}"
+        if template_location is None:
+            node = frame.f_locals.get("self")
+            # we check type() rather than isinstance() so that lazy objects (e.g. request.user) are not evaluated
+            if issubclass(type(node), Node) and getattr(node, "token", None) is not None and getattr(node, "origin", None):
+                template_location = f"{node.origin.template_name}:{node.token.lineno}"
+        frame = frame.f_back
+    return template_location or fallback or "<unknown>"
+
+
+def query_recorder(measurements):
+    """
+    Create a query observer (see observing_queries) that adds every executed query to `measurements`.
+    """
+
+    def record(sql, params, duration):
+        measurements.add_query(query_location(), duration)
+
+    return record
+
+
+# the functions to call for every query executed by the current request (see observing_queries)
+_query_observers = ContextVar("dwitter_query_observers", default=())
+
+
+@contextmanager
+def observing_queries(observer):
+    """
+    Call `observer(sql, params, duration)` for every query executed in the block.
+
+    Unlike connection.execute_wrapper() (which only wraps the database connection of the current thread), this also
+    sees the queries that the block runs in other threads, e.g. the ORM calls of async views (run with sync_to_async,
+    which carries the context variables over), since the observers are kept in a context variable.
+    """
+    token = _query_observers.set(_query_observers.get() + (observer,))
+    try:
+        yield
+    finally:
+        _query_observers.reset(token)
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    # installed on every database connection (see install_execute_wrapper), calls the observers of the current request
+    # see https://docs.djangoproject.com/en/4.1/topics/db/instrumentation/
+    observers = _query_observers.get()
+    if not observers:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        for observer in observers:
+            observer(sql, params, duration)
+
+
+def install_execute_wrapper(sender, connection, **kwargs):
+    """
+    Receiver of the connection_created signal (see apps.py), installs execute_wrapper on every new database connection.
+    """
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+def view_name(request):
+    """
+    A readable name for the view that handled the request.
+
+    e.g. "TweetsAPIViewSet.list" for rest framework viewsets, "TweetsListView" for class based views
+    and "module.function" for function views.
+    """
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "<unresolved>"
+    func = match.func
+    # rest framework views set `cls` on the view function, and django's class based views set `view_class`
+    view_class = getattr(func, "cls", None) or getattr(func, "view_class", None)
+    if view_class is None:
+        return f"{func.__module__}.{getattr(func, '__qualname__', func.__class__.__name__)}"
+    # viewsets also know which action (list, retrieve, ...) each http method is mapped to
+    actions = getattr(func, "actions", None) or {}
+    action = actions.get(request.method.lower())
+    return f"{view_class.__name__}.{action}" if action else view_class.__name__
@@ -0,0 +1,79 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# run in a fresh python process (with `python -X importtime`): set django up, and issue the first request
+CHILD = """
+import json, os, sys, time
+start = time.perf_counter()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", {settings_module!r})
+import django
+django.setup()
+setup = time.perf_counter()
+from django.test import Client
+response = Client().get({path!r})
+done = time.perf_counter()
+print(json.dumps({{"setup": setup - start, "first_request": done - setup, "status": response.status_code}}))
+"""
+
+
+def parse_importtime(output):
+    """
+    Parse the lines of `python -X importtime` (`import time: self [us] | cumulative | imported package`),
+    return [(module, self seconds, cumulative seconds)].
+    """
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_time, cumulative, name = line[len("import time:") :].split("|")
+        modules.append((name.strip(), int(self_time) / 1e6, int(cumulative) / 1e6))
+    return modules
+
+
+class Command(BaseCommand):
+    help = (
+        "Start a fresh python process that sets django up and handles one request, and report where the time goes: "
+        "the time to the first response, and the modules (and packages) that take the longest to import."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default="/accounts/login/", help="the path of the first request")
+        parser.add_argument("--top", type=int, default=20, help="number of modules and packages to show")
+
+    def handle(self, *args, **options):
+        # see https://docs.python.org/3/using/cmdline.html#cmdoption-X (importtime)
+        settings_module = os.environ.get("DJANGO_SETTINGS_MODULE", "dwitter.settings")
+        child = CHILD.format(settings_module=settings_module, path=options["path"])
+        start = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", child], cwd=settings.BASE_DIR, capture_output=True, text=True
+        )
+        total = time.perf_counter() - start
+        if process.returncode:
+            raise CommandError(f"the profiled process failed:\n{process.stderr[-2000:]}")
+        timings = json.loads(process.stdout.strip().splitlines()[-1])
+        modules = parse_importtime(process.stderr)
+
+        self.stdout.write(f"first request: GET {options['path']} -> {timings['status']}")
+        self.stdout.write(f"  time to the first response: {total * 1000:8.1f} ms (including starting python)")
+        self.stdout.write(f"  django.setup():             {timings['setup'] * 1000:8.1f} ms")
+        self.stdout.write(f"  first request:              {timings['first_request'] * 1000:8.1f} ms")
+        self.stdout.write(f"  importing {len(modules)} modules:     {sum(m[1] for m in modules) * 1000:8.1f} ms")
+
+        packages = defaultdict(float)
+        for name, self_time, cumulative in modules:
+            packages[name.split(".")[0]] += self_time
+        self.stdout.write(self.style.MIGRATE_HEADING("\nimport time per package (ms)"))
+        for name, self_time in sorted(packages.items(), key=lambda item: -item[1])[: options["top"]]:
+            self.stdout.write(f"  {self_time * 1000:8.1f}  {name}")
+
+        self.stdout.write(self.style.MIGRATE_HEADING("\nslowest modules to import, with what they import (ms)"))
+        for name, self_time, cumulative in sorted(modules, key=lambda module: -module[2])[: options["top"]]:
+            self.stdout.write(f"  {cumulative * 1000:8.1f}  {name}")
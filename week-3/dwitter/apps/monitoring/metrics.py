@@ -0,0 +1,193 @@
+"""
+An in-process metrics registry, exposed in the Prometheus text format (see https://prometheus.io/docs/instrumenting/exposition_formats/).
+
+Recording a metric must be cheap, since it happens on every request. So every thread records into its own
+dict of values (no locks, no contention between threads) and the values of all threads are only added up
+when the metrics are scraped. Copying a dict is a single operation under the GIL, so scraping never sees
+a dict while it's being resized.
+
+    from dwitter.apps.monitoring import metrics
+    metrics.token_auth_lookups.inc("success")
+    metrics.http_request_duration.observe(0.012, "TweetsAPIViewSet.list", "GET")
+"""
+import bisect
+import math
+import threading
+
+# default histogram buckets (in seconds), the same as the official prometheus clients
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._local = threading.local()
+        # the values of every thread that has recorded something (only appended to, once per thread)
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def values(self):
+        """
+        The values of the current thread: a dict of (metric name, label values) -> value.
+        """
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._shards.append(values)
+            return values
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        metric.registry = self
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def collect(self):
+        """
+        Add up the values of all threads: {metric name: {label values: value}}.
+        """
+        with self._lock:
+            shards = list(self._shards)
+        collected = {name: {} for name in self._metrics}
+        for shard in shards:
+            for (name, labels), value in shard.copy().items():
+                samples = collected[name]
+                samples[labels] = self._metrics[name].merge(samples.get(labels), value)
+        for name, metric in self._metrics.items():
+            derived = metric.derive(collected)
+            if derived is not None:
+                collected[name] = derived
+        return collected
+
+    def expose(self):
+        """
+        Render all the metrics in the Prometheus text format.
+        """
+        lines = []
+        for name, samples in self.collect().items():
+            metric = self._metrics[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for labels, value in sorted(samples.items()):
+                lines.extend(metric.expose(dict(zip(metric.labels, labels)), value))
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        key + '="' + str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') + '"'
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.registry = None
+
+    def merge(self, total, value):
+        return value if total is None else total + value
+
+    def derive(self, collected):
+        # metrics that are computed from other metrics when scraped return their samples here
+        return None
+
+    def expose(self, labels, value):
+        return [f"{self.name}{format_labels(labels)} {format_value(value)}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        values = self.registry.values()
+        key = (self.name, labels)
+        values[key] = values.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    # gauges are counters that can go down (e.g. requests in flight: +1 when a request starts, -1 when it ends)
+    type = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        values = self.registry.values()
+        key = (self.name, labels)
+        # per bucket (non cumulative) counts, with the +Inf bucket last, followed by the sum of the observed values
+        counts = values.get(key)
+        if counts is None:
+            counts = values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def merge(self, total, value):
+        value = list(value)
+        return value if total is None else [a + b for a, b in zip(total, value)]
+
+    def expose(self, labels, value):
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (math.inf,), value[:-1]):
+            cumulative += count
+            bucket_labels = dict(labels, le=format_value(bound) if bound == math.inf else repr(float(bound)))
+            lines.append(f"{self.name}_bucket{format_labels(bucket_labels)} {cumulative}")
+        lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(value[-1])}")
+        lines.append(f"{self.name}_count{format_labels(labels)} {cumulative}")
+        return lines
+
+
+REGISTRY = Registry()
+
+http_request_duration = REGISTRY.histogram(
+    "dwitter_http_request_duration_seconds", "Latency of the requests, per route (view) and method.", ("route", "method")
+)
+http_requests_in_flight = REGISTRY.gauge("dwitter_http_requests_in_flight", "Number of requests being handled.")
+db_queries = REGISTRY.counter("dwitter_db_queries_total", "Number of database queries, per route (view).", ("route",))
+token_auth_lookups = REGISTRY.counter(
+    "dwitter_token_auth_lookups_total", "Number of authentication token lookups, per result.", ("result",)
+)
+throttled_requests = REGISTRY.counter(
+    "dwitter_throttled_requests_total", "Number of writes rejected by the write throttles, per bucket scope.", ("scope",)
+)
+shed_requests = REGISTRY.counter(
+    "dwitter_shed_requests_total", "Number of low priority writes shed under overload, per reason.", ("reason",)
+)
+password_hashing_queue_time = REGISTRY.histogram(
+    "dwitter_password_hashing_queue_seconds",
+    "Time the password hashes waited for a worker of the hashing pool.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
@@ -0,0 +1,319 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import JsonResponse
+from django.shortcuts import render
+from django.urls import reverse
+
+from . import instrumentation, metrics
+from .profiling import SamplingProfiler
+from .shedding import WRITE_LOAD
+
+logger = logging.getLogger("dwitter.instrumentation")
+
+
+# Our middlewares support both sync (WSGI) and async (ASGI) requests, so that django never has to run async views
+# (e.g. the login and signup views, see accounts/async_views.py) in a thread, or the other way around
+# see https://docs.djangoproject.com/en/4.1/topics/http/middleware/#asynchronous-support
+class HybridMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            # tell django that this middleware is called as a coroutine function
+            markcoroutinefunction(self)
+
+
+class InstrumentationMiddleware(HybridMiddleware):
+    """
+    Measure the database queries (count, time and the code location that issued them), the serialization time
+    and the template rendering time of every request.
+
+    The measurements are sent back as `Server-Timing` headers (see https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Server-Timing,
+    they show up in the network tab of the browser's developer tools) and logged as a structured (JSON) log line
+    on the "dwitter.instrumentation" logger, attributed to the view that handled the request (e.g. `TweetsAPIViewSet.list`).
+
+    The middleware is only used when the INSTRUMENTATION setting is True.
+    see https://docs.djangoproject.com/en/4.1/topics/http/middleware/ for more info on middlewares
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "INSTRUMENTATION", False):
+            # django removes the middleware from the middleware chain when it raises MiddlewareNotUsed
+            raise MiddlewareNotUsed()
+        super().__init__(get_response)
+        self.max_locations = getattr(settings, "INSTRUMENTATION_MAX_LOCATIONS", 10)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with self.measuring() as measurements:
+            response = self.get_response(request)
+        return self.finish(request, response, measurements)
+
+    async def __acall__(self, request):
+        with self.measuring() as measurements:
+            response = await self.get_response(request)
+        return self.finish(request, response, measurements)
+
+    @contextmanager
+    def measuring(self):
+        measurements = instrumentation.RequestMeasurements()
+        with instrumentation.measuring(measurements), instrumentation.observing_queries(
+            instrumentation.query_recorder(measurements)
+        ):
+            yield measurements
+
+    def finish(self, request, response, measurements):
+        response["Server-Timing"] = self.server_timing(measurements)
+        logger.info(json.dumps(self.log_record(request, response, measurements)))
+        return response
+
+    def process_template_response(self, request, response):
+        # template responses (including rest framework responses) are rendered right after the template response
+        # middlewares are called, so we time everything until the rendering is done (post render callbacks)
+        # see https://docs.djangoproject.com/en/4.1/ref/template-response/#post-render-callbacks
+        measurements = instrumentation.current()
+        if measurements is not None:
+            start = time.perf_counter()
+            response.add_post_render_callback(
+                lambda rendered: measurements.add_timing("render", time.perf_counter() - start)
+            )
+        return response
+
+    @staticmethod
+    def server_timing(measurements):
+        metrics = [f'db;dur={measurements.db_time * 1000:.2f};desc="{measurements.queries} queries"']
+        metrics += [f"{name};dur={duration * 1000:.2f}" for name, duration in measurements.timings.items()]
+        metrics.append(f"total;dur={measurements.duration * 1000:.2f}")
+        return ", ".join(metrics)
+
+    def log_record(self, request, response, measurements):
+        # the locations that issued the most queries first
+        locations = sorted(measurements.query_locations.items(), key=lambda item: (-item[1][0], -item[1][1]))
+        return {
+            "view": instrumentation.view_name(request),
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "duration_ms": round(measurements.duration * 1000, 2),
+            "queries": measurements.queries,
+            "db_ms": round(measurements.db_time * 1000, 2),
+            "timings_ms": {name: round(duration * 1000, 2) for name, duration in measurements.timings.items()},
+            "query_locations": [
+                {"location": location, "queries": count, "db_ms": round(duration * 1000, 2)}
+                for location, (count, duration) in locations[: self.max_locations]
+            ],
+        }
+
+
+class MetricsMiddleware(HybridMiddleware):
+    """
+    Record the latency, the number of database queries and the number of requests in flight of every request
+    into the metrics registry (see metrics.py), exposed at /metrics.
+
+    The middleware is only used when the METRICS setting is True.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "METRICS", False):
+            raise MiddlewareNotUsed()
+        super().__init__(get_response)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with self.recording(request):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with self.recording(request):
+            return await self.get_response(request)
+
+    @contextmanager
+    def recording(self, request):
+        queries = [0]
+
+        def count_query(sql, params, duration):
+            queries[0] += 1
+
+        metrics.http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            with instrumentation.observing_queries(count_query):
+                yield
+        finally:
+            metrics.http_requests_in_flight.dec()
+        route = instrumentation.view_name(request)
+        metrics.http_request_duration.observe(time.perf_counter() - start, route, request.method)
+        if queries[0]:
+            metrics.db_queries.inc(route, amount=queries[0])
+
+
+class ProfilerMiddleware(HybridMiddleware):
+    """
+    Profile a request on demand, for staff members only: add `?profile=1` to the url, or send a `X-Profile: 1` header.
+
+    The request is run under a sampling profiler (see profiling.py), and the profile is stored (with the sql log of the request)
+    as a RequestProfile. The response then has an `X-Profile-URL` header linking to the profile's flame graph in the admin site.
+
+    The middleware must come after the authentication middleware (it needs request.user), and is only used when the PROFILER setting is True.
+    Requests are only profiled when they are handled synchronously (e.g. with runserver or a WSGI server): the profiler samples
+    a single thread, and async requests run in several threads (the event loop, and the threads of sync_to_async).
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "PROFILER", False):
+            raise MiddlewareNotUsed()
+        super().__init__(get_response)
+        self.interval = getattr(settings, "PROFILER_INTERVAL", 0.002)
+        self.max_profiles = getattr(settings, "PROFILER_MAX_PROFILES", 100)
+
+    def __call__(self, request):
+        if self.is_async:
+            # (see the docstring, async requests are not profiled)
+            return self.get_response(request)
+        if not self.wants_profile(request):
+            return self.get_response(request)
+
+        queries = []
+
+        def log_query(sql, params, duration):
+            queries.append(
+                {
+                    "sql": sql,
+                    "params": repr(params)[:1000],
+                    "duration_ms": round(duration * 1000, 3),
+                    "location": instrumentation.query_location(),
+                }
+            )
+
+        profiler = SamplingProfiler(self.interval)
+        with instrumentation.observing_queries(log_query):
+            # (the sampled stacks start below this frame)
+            profiler.start()
+            try:
+                response = self.get_response(request)
+                if hasattr(response, "render") and not response.is_rendered:
+                    # profile the rendering of template responses as well
+                    response.render()
+            finally:
+                profiler.stop()
+
+        # rest framework views authenticate (e.g. with tokens) in the view, and set request.user accordingly
+        if request.user.is_staff:
+            profile = self.save(request, response, profiler, queries)
+            response["X-Profile-URL"] = reverse("admin:monitoring_requestprofile_flamegraph", args=[profile.pk])
+        return response
+
+    @staticmethod
+    def wants_profile(request):
+        if not (request.GET.get("profile") or request.headers.get("X-Profile")):
+            return False
+        if request.user.is_authenticated:
+            return request.user.is_staff
+        # requests authenticated with tokens are only authenticated in the view (by rest framework), so the token is
+        # looked up here: only the tokens of (active) staff members turn the profiler on
+        keyword, _, key = request.headers.get("Authorization", "").partition(" ")
+        if keyword != "Token" or not key.strip():
+            return False
+        # (the model is looked up by name, so this module doesn't import rest framework)
+        token_model = apps.get_model("authtoken", "Token")
+        return token_model.objects.filter(key=key.strip(), user__is_active=True, user__is_staff=True).exists()
+
+    def save(self, request, response, profiler, queries):
+        from .models import RequestProfile
+
+        profile = RequestProfile.objects.create(
+            user=request.user,
+            method=request.method,
+            path=request.get_full_path()[:2048],
+            view=instrumentation.view_name(request)[:200],
+            status=response.status_code,
+            duration_ms=round(profiler.duration * 1000, 3),
+            interval=profiler.interval,
+            samples=dict(profiler.samples),
+            queries=queries,
+        )
+        # only keep the latest profiles
+        stale = RequestProfile.objects.values_list("pk", flat=True)[self.max_profiles :]
+        RequestProfile.objects.filter(pk__in=list(stale)).delete()
+        return profile
+
+
+class LoadSheddingMiddleware(HybridMiddleware):
+    """
+    Shed low priority writes when the app is overloaded: respond `503 Service Unavailable` with a `Retry-After` header
+    right away, instead of adding to the pile of writes waiting for the database (see shedding.py).
+
+    Every write (POST, PUT, PATCH, DELETE request) is counted in the write queue depth and its latency is recorded,
+    but only the writes to views with `shed_under_load = True` (e.g. posting tweets) are shed. Reads are never shed.
+
+    The middleware is only used when the LOAD_SHEDDING setting is True, the thresholds are the LOAD_SHEDDING_MAX_WRITES_IN_FLIGHT
+    and LOAD_SHEDDING_MAX_WRITE_P99 (seconds) settings.
+    """
+
+    safe_methods = ("GET", "HEAD", "OPTIONS", "TRACE")
+
+    def __init__(self, get_response):
+        if not getattr(settings, "LOAD_SHEDDING", False):
+            raise MiddlewareNotUsed()
+        super().__init__(get_response)
+        self.max_in_flight = getattr(settings, "LOAD_SHEDDING_MAX_WRITES_IN_FLIGHT", None)
+        self.max_p99 = getattr(settings, "LOAD_SHEDDING_MAX_WRITE_P99", None)
+        self.retry_after = getattr(settings, "LOAD_SHEDDING_RETRY_AFTER", 1)
+        self.load = WRITE_LOAD  # (shared with the write throttles, see tweets/throttling.py)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if request.method in self.safe_methods:
+            return self.get_response(request)
+        with self.tracking(request):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if request.method in self.safe_methods:
+            return await self.get_response(request)
+        with self.tracking(request):
+            return await self.get_response(request)
+
+    @contextmanager
+    def tracking(self, request):
+        self.load.started()
+        start = time.perf_counter()
+        request.shed = False
+        try:
+            yield
+        finally:
+            # shed writes are not recorded (they are fast, and would hide the latency of the writes that went through)
+            self.load.finished(time.perf_counter() - start, record=not request.shed)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method in self.safe_methods:
+            return None
+        # rest framework views set `cls` on the view function, and django's class based views set `view_class`
+        view_class = getattr(view_func, "cls", None) or getattr(view_func, "view_class", None)
+        if not getattr(view_class or view_func, "shed_under_load", False):
+            return None
+        reason = self.load.overload(self.max_in_flight, self.max_p99)
+        if reason is None:
+            return None
+        metrics.shed_requests.inc(reason)
+        request.shed = True
+        message = "The server is overloaded, please try again later."
+        if getattr(view_func, "cls", None) is not None:
+            response = JsonResponse({"detail": message}, status=503)  # the same shape as rest framework's errors
+        else:
+            response = render(request, "generic_message.html", {"content": message}, status=503)
+        response["Retry-After"] = str(self.retry_after)
+        return response
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class RequestProfile(models.Model):
+    # A profiled request (see ProfilerMiddleware in middleware.py), with its sampled stacks and its sql log
+    # The profiles can be browsed (and their flame graphs viewed) in the admin site
+
+    created_at = models.DateTimeField(_("Created at"), auto_now_add=True, db_index=True)
+    # the staff member who requested the profile
+    user = models.ForeignKey(to=settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    method = models.CharField(_("Method"), max_length=10)
+    path = models.CharField(_("Path"), max_length=2048)
+    view = models.CharField(_("View"), max_length=200)
+    status = models.PositiveSmallIntegerField(_("Status"))
+    duration_ms = models.FloatField(_("Duration (ms)"))
+    # sampling interval of the profiler (in seconds)
+    interval = models.FloatField(_("Sampling interval"))
+    # collapsed stacks -> number of samples (see profiling.py)
+    samples = models.JSONField(_("Samples"), default=dict)
+    # list of {"sql", "params", "duration_ms", "location"} dicts, in the order the queries were executed
+    queries = models.JSONField(_("SQL queries"), default=list)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.view}) at {self.created_at}"
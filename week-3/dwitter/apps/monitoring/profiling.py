@@ -0,0 +1,87 @@
+"""
+A small sampling profiler, used to profile single requests on demand (see ProfilerMiddleware).
+
+A background thread looks at the stack of the profiled thread every `interval` seconds (see sys._current_frames)
+and counts how many times each stack was seen. The counted stacks ("collapsed stacks", e.g. "dispatch;list;to_representation")
+are what flame graphs are drawn from (see https://www.brendangregg.com/flamegraphs.html).
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.samples = Counter()
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Start sampling the current thread, the stacks are recorded from the caller's frame down.
+        """
+        self._thread_id = threading.get_ident()
+        # the frame of the caller, stacks are cut there (the frames above it are the same for every sample)
+        self._root = sys._getframe(1)
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="dwitter-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self._started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self.samples[self._collapse(frame)] += 1
+
+    def _collapse(self, frame):
+        names = []
+        while frame is not None and frame is not self._root:
+            names.append(frame_name(frame))
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+
+def flame_graph(samples, min_width=0.001):
+    """
+    Lay out the collapsed stacks as flame graph boxes: a list of dicts with the name of the frame, its depth
+    (the row), its offset and width (as fractions of the total width) and its number of samples.
+    Boxes narrower than `min_width` are left out.
+    """
+    # build the call tree: name -> [samples, children]
+    tree = {}
+    for stack, count in samples.items():
+        children = tree
+        for name in stack.split(";"):
+            node = children.setdefault(name, [0, {}])
+            node[0] += count
+            children = node[1]
+
+    total = sum(samples.values())
+    boxes = []
+    if not total:
+        return boxes
+    # walk the tree with an explicit stack (call stacks can be deeper than python's recursion limit)
+    pending = [(tree, 0, 0.0)]
+    while pending:
+        children, depth, offset = pending.pop()
+        for name, (count, grandchildren) in sorted(children.items()):
+            width = count / total
+            if width >= min_width:
+                boxes.append({"name": name, "depth": depth, "offset": offset, "width": width, "samples": count})
+                pending.append((grandchildren, depth + 1, offset))
+            offset += width
+    return boxes
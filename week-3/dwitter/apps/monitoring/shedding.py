@@ -0,0 +1,82 @@
+"""
+Overload detection for the write paths, used by the LoadSheddingMiddleware (see middleware.py).
+
+SQLite only has a single writer, so when writes pile up they wait for each other (and for the database lock) and every
+write gets slower. We keep track of the writes being handled (the write queue depth) and of the latency of the recent
+writes (over a sliding time window), and consider the app overloaded when there are too many writes in flight,
+or when the 99th percentile of the recent write latencies is too high.
+When the app is overloaded, low priority writes are rejected right away (shed), which keeps the reads healthy.
+Before that, as the load rises, the write throttles refill their buckets more slowly (see pressure() and
+tweets/throttling.py), so that the writers are slowed down before they have to be turned away.
+See https://sre.google/sre-book/handling-overload/
+
+There is one WriteLoad per process (WRITE_LOAD below), measured by the LoadSheddingMiddleware.
+"""
+import threading
+import time
+from collections import deque
+
+
+class WriteLoad:
+    def __init__(self, window=10.0, max_samples=1000):
+        self.window = window  # seconds of latencies used for the p99
+        self.in_flight = 0
+        # (time the write ended, latency) of the recent writes
+        self._latencies = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+        # the p99 is computed at most once per second
+        self._p99 = (0.0, -1.0)  # (value, computed at)
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finished(self, latency, record=True):
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight -= 1
+            if record:
+                self._latencies.append((now, latency))
+
+    def p99(self):
+        """
+        The 99th percentile of the latencies of the writes that ended in the last `window` seconds (0 if there were none).
+        The latencies of old writes are forgotten, so that the app recovers once it stops shedding.
+        """
+        now = time.monotonic()
+        value, computed_at = self._p99
+        if now - computed_at < 1.0:
+            return value
+        with self._lock:
+            while self._latencies and self._latencies[0][0] < now - self.window:
+                self._latencies.popleft()
+            latencies = sorted(latency for _, latency in self._latencies)
+        value = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0.0
+        self._p99 = (value, now)
+        return value
+
+    def pressure(self, max_in_flight, max_p99):
+        """
+        How close the app is to being overloaded: the largest of in_flight / max_in_flight and p99 / max_p99
+        (0 when no writes are being handled, 1 or more when overloaded).
+        """
+        pressure = 0.0
+        if max_in_flight:
+            pressure = max(pressure, self.in_flight / max_in_flight)
+        if max_p99:
+            pressure = max(pressure, self.p99() / max_p99)
+        return pressure
+
+    def overload(self, max_in_flight, max_p99):
+        """
+        Return the reason the app is overloaded ("queue_depth" or "p99_latency"), or None.
+        """
+        if max_in_flight is not None and self.in_flight > max_in_flight:
+            return "queue_depth"
+        if max_p99 is not None and self.p99() > max_p99:
+            return "p99_latency"
+        return None
+
+
+# the load of the writes of this process (recorded by the LoadSheddingMiddleware, read by the write throttles too)
+WRITE_LOAD = WriteLoad()
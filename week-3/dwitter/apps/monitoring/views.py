@@ -0,0 +1,30 @@
+import hmac
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+from . import metrics
+
+
+def can_scrape(request):
+    """
+    The metrics are served to staff members, and to the scrapers that send `Authorization: Bearer <METRICS_TOKEN>`.
+    """
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    token = getattr(settings, "METRICS_TOKEN", "")
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    return bool(token) and scheme.lower() == "bearer" and hmac.compare_digest(credentials.strip(), token)
+
+
+def metrics_view(request):
+    """
+    Expose the metrics registry in the Prometheus text format (to be scraped by prometheus).
+    see https://prometheus.io/docs/instrumenting/exposition_formats/#text-based-format
+    """
+    if not getattr(settings, "METRICS", False):
+        raise Http404()
+    if not can_scrape(request):
+        # (a 404 rather than a 403, so that the endpoint isn't advertised)
+        raise Http404()
+    return HttpResponse(metrics.REGISTRY.expose(), content_type="text/plain; version=0.0.4; charset=utf-8")
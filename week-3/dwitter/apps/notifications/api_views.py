@@ -0,0 +1,76 @@
+# The notifications API: the inbox of the current user (the replies to their tweets), newest first
+# (imported lazily with the rest of the APIs, see dwitter/api_urls.py)
+
+import rest_framework
+from rest_framework import serializers as drf_serializers
+from rest_framework import viewsets as drf_viewsets
+
+from ..accounts import authentication
+from ..tweets import pagination
+from . import inbox
+from .models import Notification
+
+# (formats the dates like the other APIs)
+created_at_field = drf_serializers.DateTimeField()
+
+
+class NotificationsAPIViewSet(drf_viewsets.GenericViewSet):
+    """
+    API for the notifications of the current user (a notification for every reply to one of their tweets).
+
+    * **List** [ [index](/api/notifications/) | `GET` ]: the notifications, newest first, paginated with `cursor` (follow the `next` link) and `limit`
+    * **Unread** [ [unread](/api/notifications/unread/) | `GET` ]: the number of unread notifications
+    * **Read** [ `read/` | `POST` ]: mark all the notifications as read
+
+    The notifications of new replies are delivered in the background, a moment after the replies are posted (see notifications/inbox.py).
+    """
+
+    authentication_classes = [
+        rest_framework.authentication.SessionAuthentication,
+        authentication.TokenAuthentication,
+    ]
+    permission_classes = [rest_framework.permissions.IsAuthenticated]
+    pagination_class = pagination.TimelinePagination
+
+    # (the actions take no data, the browsable API shows them without a form)
+    def get_serializer_class(self):
+        return drf_serializers.Serializer
+
+    # the notifications are read as rows (one query, with the replies and their users joined), see inbox_idx in models.py
+    # the deleted replies are left out right away (their notifications are deleted with them, by the purge)
+    def get_queryset(self):
+        return Notification.objects.filter(recipient=self.request.user, reply__deleted_at__isnull=True).values(
+            "id", "created_at", "read", "reply_id", "reply__text", "reply__user__username", "reply__reply_to_id"
+        )
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        data = [
+            {
+                "id": row["id"],
+                "created_at": created_at_field.to_representation(row["created_at"]),
+                "read": row["read"],
+                "reply": {
+                    "id": row["reply_id"],
+                    "user": row["reply__user__username"],
+                    "text": row["reply__text"],
+                    "reply_to": row["reply__reply_to_id"],
+                },
+            }
+            for row in page
+        ]
+        return self.get_paginated_response(data)
+
+    @rest_framework.decorators.action(methods=["GET"], detail=False)
+    def unread(self, request):
+        """
+        The number of unread notifications (`unread`).
+        """
+        return rest_framework.response.Response({"unread": inbox.unread(request.user.pk)})
+
+    @rest_framework.decorators.action(methods=["POST"], detail=False)
+    def read(self, request):
+        """
+        Mark all the notifications as read, returns how many were unread (`marked`).
+        """
+        return rest_framework.response.Response({"marked": inbox.mark_read(request.user.pk), "unread": 0})
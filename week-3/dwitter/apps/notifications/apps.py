@@ -0,0 +1,7 @@
+from django.apps import AppConfig
+
+
+class NotificationsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'dwitter.apps.notifications'
+    # the inbox of every user: a notification for every reply to their tweets (see inbox.py)
@@ -0,0 +1,13 @@
+from django.utils.functional import SimpleLazyObject
+
+from . import inbox
+
+
+# the number of unread notifications of the user, for the badge in the navigation bar (see nav.html)
+# it's only read (with a primary key lookup, see inbox.unread) when a template uses it
+# see https://docs.djangoproject.com/en/4.1/ref/templates/api/#writing-your-own-context-processors
+def unread_notifications(request):
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return {}
+    return {"unread_notifications": SimpleLazyObject(lambda: inbox.unread(user.pk))}
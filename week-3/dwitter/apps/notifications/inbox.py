@@ -0,0 +1,181 @@
+"""
+The inboxes: a notification for every reply to a user's tweets, and the number of unread ones.
+
+Writing the notification (and updating the recipient's unread count) while the reply is posted would make every reply
+wait for it, and a popular tweet's author would get an UPDATE of their inbox per reply. Instead, the notifications are
+delivered in batches, by the `python manage.py deliver_notifications` command (e.g. every minute, from cron), or with
+NOTIFICATIONS_IN_BACKGROUND set to True, by a background thread of the server that posting a reply wakes up:
+
+1. the tweets posted since the last delivery (the ones after DeliveryState.last_tweet_id, which the migration creates
+   at the last tweet that existed then) are read in batches
+2. the notifications of the batch's replies are inserted at once (bulk_create), and the unread count of every recipient
+   is incremented once per batch, by the number of their new notifications
+3. the new position (last_tweet_id) is written in the same transaction, and a batch is only delivered if no other
+   delivery delivered it first, so every reply is notified once (even when the deliveries of two workers overlap)
+
+Like the trending threads (see trending.py in the tweets app), the tweets are only read once they are TWEET_COMMIT_GRACE
+seconds old, as the snowflake ids of several workers are not committed in id order (see TweetManager.settled_after).
+
+The Inbox rows keep the number of unread notifications, so showing it on every page is a primary key lookup
+(see context_processors.py). The notifications older than NOTIFICATIONS_KEEP_DAYS are deleted by compact().
+
+The unread counts can drift when a notified reply is deleted before it's read (see purging.py in the tweets app):
+marking all the notifications as read resets the count.
+"""
+import datetime
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from ..tweets.models import Tweet
+from .models import DeliveryState, Inbox, Notification
+
+logger = logging.getLogger("dwitter.notifications")
+
+# the background thread compacts the inboxes at most this often (seconds)
+COMPACT_INTERVAL = 3600
+
+
+def unread(user_id):
+    """
+    The number of unread notifications of the user (a primary key lookup).
+    """
+    return Inbox.objects.filter(pk=user_id).values_list("unread", flat=True).first() or 0
+
+
+def _add_unread(user_id, count):
+    inbox = Inbox.objects.filter(pk=user_id)
+    if inbox.update(unread=F("unread") + count):
+        return
+    try:
+        with transaction.atomic():
+            Inbox.objects.create(user_id=user_id, unread=count)
+    except IntegrityError:  # (created in the meantime)
+        inbox.update(unread=F("unread") + count)
+
+
+def deliver_batch(batch_size, now=None):
+    """
+    Deliver the notifications of the next `batch_size` new tweets, return the number of tweets read
+    (0 when there are no new ones).
+    """
+    # (the state is created by the migration, at the last tweet that existed then)
+    state, _ = DeliveryState.objects.get_or_create(pk=1)
+    fields = ("id", "user_id", "reply_to__user_id", "reply_to__deleted_at")
+    rows = Tweet.objects.settled_after(state.last_tweet_id, fields, batch_size, now or timezone.now())
+    if not rows:
+        return 0
+    notifications = [
+        Notification(recipient_id=recipient_id, reply_id=tweet_id, created_at=created_at)
+        for tweet_id, user_id, recipient_id, reply_to_deleted_at, created_at in rows
+        # (not for the tweets that are not replies, the replies to deleted tweets, and the replies to one's own tweets)
+        if recipient_id is not None and reply_to_deleted_at is None and recipient_id != user_id
+    ]
+    with transaction.atomic():
+        # move the position forward, unless another delivery already did (it delivered these notifications)
+        moved = DeliveryState.objects.filter(pk=1, last_tweet_id=state.last_tweet_id).update(last_tweet_id=rows[-1][0])
+        if not moved:
+            return 0
+        Notification.objects.bulk_create(notifications, batch_size=batch_size)
+        for recipient_id, count in Counter(notification.recipient_id for notification in notifications).items():
+            _add_unread(recipient_id, count)
+    return len(rows)
+
+
+def deliver(batch_size=None, log=None):
+    """
+    Deliver the notifications of all the new tweets, return the number of tweets read.
+    """
+    batch_size = batch_size or settings.NOTIFICATIONS_BATCH_SIZE
+    now = timezone.now()
+    delivered = 0
+    while True:
+        done = deliver_batch(batch_size, now)
+        if not done:
+            return delivered
+        delivered += done
+        if log:
+            log(f"{delivered} new tweets delivered")
+
+
+def mark_read(user_id):
+    """
+    Mark all the notifications of the user as read, return how many were unread.
+    """
+    with transaction.atomic():
+        marked = Notification.objects.filter(recipient_id=user_id, read=False).update(read=True)
+        Inbox.objects.filter(pk=user_id).update(unread=0)
+    return marked
+
+
+def compact(batch_size=None, log=None):
+    """
+    Delete the notifications older than NOTIFICATIONS_KEEP_DAYS (`batch_size` at a time, each batch in its own
+    transaction), return how many were deleted.
+    """
+    batch_size = batch_size or settings.NOTIFICATIONS_BATCH_SIZE
+    cutoff = timezone.now() - datetime.timedelta(days=settings.NOTIFICATIONS_KEEP_DAYS)
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Notification.objects.filter(created_at__lt=cutoff).values_list("id", "recipient_id", "read")[:batch_size]
+            )
+            if not rows:
+                return deleted
+            Notification.objects.filter(id__in=[row[0] for row in rows]).delete()
+            # the unread notifications that are deleted are not unread anymore
+            for recipient_id, count in Counter(recipient_id for _, recipient_id, read in rows if not read).items():
+                Inbox.objects.filter(pk=recipient_id).update(unread=Greatest(F("unread") - count, 0))
+        deleted += len(rows)
+        if log:
+            log(f"{deleted} old notifications deleted")
+
+
+# the background delivery: a single daemon thread, woken up whenever a reply is posted
+_wakeup = threading.Event()
+_thread = None
+_lock = threading.Lock()
+
+
+def _run():
+    last_compaction = time.monotonic()
+    while True:
+        _wakeup.wait()
+        # wait a little, to deliver the replies posted in the meantime in the same batch
+        # (and at least until the new replies are old enough to be read, see TweetManager.settled_after)
+        time.sleep(max(settings.NOTIFICATIONS_DELAY, settings.TWEET_COMMIT_GRACE))
+        _wakeup.clear()
+        try:
+            deliver()
+            if time.monotonic() - last_compaction > COMPACT_INTERVAL:
+                last_compaction = time.monotonic()
+                compact()
+        except Exception:  # the thread must survive errors (e.g. the database being locked), the next reply retries
+            logger.exception("delivering the notifications failed")
+        finally:
+            # the thread has its own database connection, which must not stay open between deliveries
+            connection.close()
+
+
+def schedule():
+    """
+    Deliver the notifications of the new replies in the background (once the current transaction is committed).
+    Does nothing unless NOTIFICATIONS_IN_BACKGROUND is True (by default the deliver_notifications command has to be run,
+    e.g. by cron).
+    """
+    global _thread
+    if not settings.NOTIFICATIONS_IN_BACKGROUND:
+        return
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_run, name="dwitter-notifications", daemon=True)
+            _thread.start()
+    transaction.on_commit(_wakeup.set)
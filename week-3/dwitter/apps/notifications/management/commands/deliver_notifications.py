@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ... import inbox
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver the notifications of the replies posted since the last delivery, and delete the old notifications "
+        "(see inbox.py). Run it regularly (e.g. every minute, from cron), unless NOTIFICATIONS_IN_BACKGROUND is True."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.NOTIFICATIONS_BATCH_SIZE,
+            help="number of new tweets (or old notifications) read per transaction",
+        )
+        parser.add_argument("--no-compact", action="store_true", help="don't delete the old notifications")
+
+    def handle(self, *args, **options):
+        log = self.stdout.write if options["verbosity"] > 1 else None
+        delivered = inbox.deliver(options["batch_size"], log=log)
+        deleted = 0 if options["no_compact"] else inbox.compact(options["batch_size"], log=log)
+        self.stdout.write(
+            self.style.SUCCESS(f"delivered the notifications of {delivered} new tweets, deleted {deleted} old notifications")
+        )
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:38
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_delivery_state(apps, schema_editor):
+    # the delivery starts after the tweets that already exist (their replies are not notified), every reply posted from
+    # now on is (the state has to exist before the first reply, see inbox.py)
+    Tweet = apps.get_model("tweets", "Tweet")
+    DeliveryState = apps.get_model("notifications", "DeliveryState")
+    using = schema_editor.connection.alias
+    last_tweet_id = Tweet.objects.using(using).aggregate(last=models.Max("id"))["last"] or 0
+    DeliveryState.objects.using(using).get_or_create(pk=1, defaults={"last_tweet_id": last_tweet_id})
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('tweets', '0007_trending'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_tweet_id', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Inbox',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='inbox', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created at')),
+                ('read', models.BooleanField(default=False)),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to=settings.AUTH_USER_MODEL)),
+                ('reply', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='tweets.tweet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['recipient', 'created_at', 'id'], name='notifications_inbox_idx'), models.Index(fields=['created_at'], name='notifications_created_idx')],
+            },
+        ),
+        migrations.RunPython(create_delivery_state, migrations.RunPython.noop),
+    ]
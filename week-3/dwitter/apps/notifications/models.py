@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from ..tweets.models import Tweet
+
+
+# a reply to one of the recipient's tweets (delivered in batches, see inbox.py)
+class Notification(models.Model):
+    recipient = models.ForeignKey(to=get_user_model(), on_delete=models.CASCADE, related_name="notifications")
+    reply = models.ForeignKey(to=Tweet, on_delete=models.CASCADE, related_name="notifications")
+    # (when the reply was created, the inbox is listed newest first with keyset pagination on (created_at, id))
+    created_at = models.DateTimeField(_("Created at"), default=timezone.now)
+    read = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # the inbox of a user, newest first
+            models.Index(fields=["recipient", "created_at", "id"], name="notifications_inbox_idx"),
+            # the old notifications, for the compaction (see inbox.compact)
+            models.Index(fields=["created_at"], name="notifications_created_idx"),
+        ]
+
+
+# the number of unread notifications of a user, kept up to date as the notifications are delivered and read
+# (so that showing it on every page is a single primary key lookup, instead of counting the notifications)
+class Inbox(models.Model):
+    user = models.OneToOneField(to=get_user_model(), on_delete=models.CASCADE, primary_key=True, related_name="inbox")
+    unread = models.IntegerField(default=0)
+
+
+# where the delivery got to: the id of the last tweet it delivered notifications for (a single row)
+class DeliveryState(models.Model):
+    last_tweet_id = models.BigIntegerField(default=0)
@@ -0,0 +1,40 @@
+from django.contrib.auth.decorators import login_required
+from django.http import Http404
+from django.shortcuts import redirect
+from django.urls import reverse_lazy
+from django.utils.decorators import method_decorator
+from django.views.generic import TemplateView
+
+from ..tweets import keyset  # keyset pagination (newest first), like the timelines of the users
+from . import inbox
+from .models import Notification
+
+
+# ADDITION: the notifications page of the current user (the replies to their tweets, newest first)
+# the notifications are read with a single query (with the replies and their users joined), a page at a time,
+# and posting the page marks them all as read (which resets the badge in the navigation bar, see context_processors.py)
+@method_decorator(login_required(login_url=reverse_lazy("login")), name="dispatch")
+class NotificationsView(TemplateView):
+    template_name = "notifications.html"
+    paginate_by = 20
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        position = None
+        if self.request.GET.get("cursor"):
+            try:
+                position = keyset.decode_cursor(self.request.GET["cursor"])
+            except ValueError:
+                raise Http404("Invalid cursor.")
+        # (without the deleted replies, see NotificationsAPIViewSet.get_queryset)
+        queryset = Notification.objects.filter(recipient=self.request.user, reply__deleted_at__isnull=True).values(
+            "id", "created_at", "read", "reply_id", "reply__text", "reply__user__username"
+        )
+        rows, last = keyset.page(queryset, position, self.paginate_by, newest_first=True)
+        context["notifications"] = rows
+        context["next_cursor"] = keyset.encode_cursor(last) if last is not None else None
+        return context
+
+    def post(self, request, *args, **kwargs):
+        inbox.mark_read(request.user.pk)
+        return redirect("notifications")
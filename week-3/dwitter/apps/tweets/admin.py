@@ -5,12 +5,40 @@ from django.contrib import admin
 # https://docs.djangoproject.com/en/4.1/ref/contrib/admin/
 from .models import Tweet
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.forms.models import BaseInlineFormSet
+from django.utils.functional import cached_property
 
 
+# ADDITION: the admin site should stay fast with millions of tweets
+# by default, the changelist counts all the tweets (twice: the filtered and the unfiltered count) to paginate them,
+# which means reading the whole table. Instead we only count up to a limit (older tweets can still be found with the search bar)
+# see https://docs.djangoproject.com/en/4.1/ref/contrib/admin/#django.contrib.admin.ModelAdmin.paginator
+class CappedCountPaginator(Paginator):
+    # we never count more than max_count tweets (i.e. there are at most max_count / per_page pages)
+    max_count = 10000
+
+    @cached_property
+    def count(self):
+        # counting a sliced queryset only counts the rows of the slice (SELECT COUNT(*) FROM (SELECT ... LIMIT max_count))
+        return self.object_list[: self.max_count].count()
+
+
+# the replies of a tweet are shown a page at a time (a tweet can have thousands of replies)
+class RepliesPageFormSet(BaseInlineFormSet):
+    per_page = 20
+    page_number = 1
+
+    def get_queryset(self):
+        if not hasattr(self, "page"):
+            paginator = CappedCountPaginator(super().get_queryset(), self.per_page)
+            self.page = paginator.get_page(self.page_number)
+        return self.page.object_list
+
 
 # create inline model admin for the reply_to field
 # https://docs.djangoproject.com/en/4.1/ref/contrib/admin/#django.contrib.admin.TabularInline
-class RepliesInline(admin.StackedInline):
+class RepliesInline(admin.TabularInline):
     # We specify the model that we want to create a admin inline form from
     model = Tweet
     # we want inline editing of the replies (i.e. we want to be able to edit the replies from the tweet detail page)
@@ -23,10 +51,28 @@ class RepliesInline(admin.StackedInline):
     verbose_name = "Reply"
     verbose_name_plural = "Replies"
 
-    # By default, we only show 1 inline form, we can change this by setting the extra attribute
-    # ADDITION: set extra attribute to 1
-    extra = 1
-   
+    # ADDITION: editable inline forms render a <select> with every user for every reply, and all the replies are loaded at once
+    # so the replies are read only (with a link to their own change page, where they can be edited) and paginated
+    # (see RepliesPageFormSet above, the ?replies_page= parameter selects the page of replies)
+    fields = ("user", "text", "created_at")
+    readonly_fields = ("user", "text", "created_at")
+    show_change_link = True
+    can_delete = False
+    extra = 0
+    formset = RepliesPageFormSet
+    template = "admin/tweets/tweet/replies_inline.html"
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        # the user of every reply is shown, so we join it
+        return super().get_queryset(request).select_related("user")
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.page_number = request.GET.get("replies_page", 1)
+        return formset
 
 
 # configurate the tweet list view in the admin site to show the tweet text and the username of the user who posted the tweet
@@ -39,6 +85,8 @@ class TweetAdmin(admin.ModelAdmin):
     # see https://docs.djangoproject.com/en/4.1/ref/contrib/admin/#django.contrib.admin.ModelAdmin.list_display
     # ADDITION: set list_display to "text" and "user", "uploaded_at" and "reply_to"
     list_display = ("user", "text",  "uploaded_at", "reply_to")
+    # ADDITION: when the tweet was created and edited (they can't be changed, see Tweet.created_at)
+    readonly_fields = ("created_at", "edited_at")
     
     # We can set the fields that are clickable to link to the detail view of the tweet by setting the list_display_links attribute
     # see https://docs.djangoproject.com/en/4.1/ref/contrib/admin/#django.contrib.admin.ModelAdmin.list_display_links
@@ -54,5 +102,26 @@ class TweetAdmin(admin.ModelAdmin):
     # ADDITION: set inlines to "RepliesInline"
     inlines = [RepliesInline]
 
+    # ADDITION: join the user (and the tweet that is replied to, and its user) so that the changelist doesn't
+    # query them for every row (see __str__ in models.py)
+    # see https://docs.djangoproject.com/en/4.1/ref/contrib/admin/#django.contrib.admin.ModelAdmin.list_select_related
+    list_select_related = ("user", "reply_to__user")
+
+    # ADDITION: don't render <select>s with every tweet and every user in the change form
+    # the reply_to field is a raw id input (with a lookup popup), the user field is searched as you type
+    # see https://docs.djangoproject.com/en/4.1/ref/contrib/admin/#django.contrib.admin.ModelAdmin.raw_id_fields
+    # and https://docs.djangoproject.com/en/4.1/ref/contrib/admin/#django.contrib.admin.ModelAdmin.autocomplete_fields
+    raw_id_fields = ("reply_to",)
+    autocomplete_fields = ("user",)
+
+    # ADDITION: don't count all the tweets (see CappedCountPaginator above)
+    paginator = CappedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # the change form's title shows the tweet (see __str__ in models.py), which needs its user
+        # (the changelist only applies list_select_related when the queryset doesn't select related objects yet, so we apply it here)
+        return super().get_queryset(request).select_related(*self.list_select_related)
+
 # register the TweetAdmin class with the admin site
 admin.site.register(Tweet, TweetAdmin)
\ No newline at end of file
@@ -0,0 +1,266 @@
+# Session 3: Tweet APIs
+# In this session, we will create APIs to get the list of tweets and to create a new tweet
+# (these used to live in views.py, they are imported lazily with the rest of the APIs, see dwitter/api_urls.py)
+
+import rest_framework
+from rest_framework import viewsets as drf_viewsets
+from rest_framework import mixins as drf_mixins
+from rest_framework import pagination as drf_pagination
+from rest_framework import generics as drf_generics
+from rest_framework.authtoken.serializers import AuthTokenSerializer
+import functools
+from .models import Tweet, Like, Retweet, TweetCounter, TrendingTweet
+from . import serializers, permissions, throttling, purging, threads, pagination, counters, trending
+from ..accounts import authentication
+from ..notifications import inbox
+import django
+from django.db import transaction
+from django.contrib.auth import get_user_model
+
+
+class TweetsAPIViewSet(
+    drf_viewsets.GenericViewSet,
+    drf_mixins.ListModelMixin,
+    drf_mixins.DestroyModelMixin,  # for deleting tweets
+    drf_mixins.CreateModelMixin,  # for model creation (tweet)
+    drf_mixins.RetrieveModelMixin,  # for model retrieval (view tweet)
+):
+    # the docstring is used to generate the documentation for the API
+    """
+    API for user information management and retrieval.
+
+    * **List** [ [index](/api/tweets/) | `GET`, `POST` ]: List all tweets (paginated), or create a new tweet.
+    * **Retrieve Tweet** [ `<pk>` | `GET`, `DELETE`]: obtain tweet information or delete tweet (by looking up pk)
+    * **Replies** [ `<pk>/replies/` | `GET` ]: the direct replies of a tweet, paginated with `cursor` (follow the `next` link) and `limit`
+    * **Thread** [ `<pk>/thread/` | `GET` ]: a tweet and all of its replies as a flat list, in the order of the conversation, each with its `depth` (paginated)
+    * **Context** [ `<pk>/context/` | `GET` ]: a tweet and the chain of tweets it replies to (`ancestors`, from the root of the thread down)
+    * **Trending** [ [trending](/api/tweets/trending/) | `GET` ]: the threads with the most replies lately, best first
+    * **Like** [ `<pk>/like/` | `POST`, `DELETE` ]: like a tweet, or take the like back
+    * **Retweet** [ `<pk>/retweet/` | `POST`, `DELETE` ]: retweet a tweet, or take the retweet back
+
+    Listing and retrieving tweets accept the following query parameters:
+
+    * `fields`: comma separated fields to include (`id`, `user`, `replies`, `likes`, `retweets`, `text`, `uploaded_at`, `created_at`, `edited_at`, `reply_to`), e.g. [`?fields=id,text`](/api/tweets/?fields=id,text)
+    * `expand=replies` (the default) with `depth` (levels of replies) and `replies_limit` (first replies of every tweet),
+      e.g. [`?expand=replies&depth=1&replies_limit=3`](/api/tweets/?expand=replies&depth=1&replies_limit=3); `?expand=` leaves the replies out
+
+    The replies, the thread and the context of a tweet, and the trending threads accept `fields` too, the replies' own replies are only included with `expand=replies`.
+    """
+
+    authentication_classes = [
+        rest_framework.authentication.SessionAuthentication,
+        authentication.TokenAuthentication,  # token authentication that counts token lookups (see accounts/authentication.py)
+    ]  # the authentication classes to use for this viewset
+
+    # similar to the queryset attribute in the TweetListView class, we use the queryset attribute to specify the queryset to use for this viewset
+    # we don't want to return tweets that are replies, so we filter out tweets that are replies
+    # ADDITION: filter out tweets that are replies (i.e. tweets with reply_to=None)
+    queryset = Tweet.objects.all().filter(reply_to=None)  # the queryset to use to look up tweets with no replies
+    # ADDITION: list the tweets in the order they were created (which, unlike uploaded_at, doesn't change when a tweet is edited)
+    # so that the pages don't shift when tweets are edited (see tweets_roots_idx in models.py)
+    queryset = queryset.order_by("created_at", "id")
+
+    # writes (posting and deleting tweets) are shed first when the app is overloaded (see LoadSheddingMiddleware in monitoring/middleware.py)
+    shed_under_load = True
+
+    # posting tweets is throttled per user and globally (see throttling.py), reads are not throttled
+    # see https://www.django-rest-framework.org/api-guide/throttling/
+    def get_throttles(self):
+        if self.action == "create":
+            return [throttling.WriteThrottle()]
+        return super().get_throttles()
+
+    # pagination could be handled globally in the settings.py file, we can also override the pagination class specific viewsets
+    # see https://www.django-rest-framework.org/api-guide/pagination/#setting-the-pagination-style for more information
+    # see settings.py for global pagination settings used in this project
+
+    # we override this method to use different serializers for different actions
+    def get_serializer_class(self):
+        # ADDITION: use the TweetCreateSerializer for the create action and the TweetSerializer for all other actions
+        if self.action == "create":
+            return serializers.TweetCreateSerializer
+        if self.action in ["like", "retweet"]:
+            # (these take no data, the browsable API shows them without a form)
+            return rest_framework.serializers.Serializer
+        return serializers.TweetViewSerializer
+
+    # listing and retrieving tweets (with their whole reply trees) is the hottest path of the api
+    # so instead of the TweetViewSerializer (which creates model instances for every tweet and its user)
+    # we read plain rows (with the user's fields joined) and use the TweetReadSerializer (see serializers.py)
+    # which produces the same output, much faster
+    # clients can also ask for less (see read_options in serializers.py), in which case we read less
+    def get_read_serializer(self, data, **kwargs):
+        return serializers.TweetReadSerializer(data, context={"read_options": self.read_options}, **kwargs)
+
+    def get_read_queryset(self):
+        self.read_options = serializers.read_options(self.request.query_params)
+        return self.get_queryset().values(*serializers.read_values(self.read_options["fields"]))
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_read_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_read_serializer(page, many=True).data)
+        return rest_framework.response.Response(self.get_read_serializer(queryset, many=True).data)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = drf_generics.get_object_or_404(
+            self.get_read_queryset(), **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+        return rest_framework.response.Response(self.get_read_serializer(row).data)
+
+    # ADDITION: the direct replies of a tweet (any tweet, not only the roots), a page at a time, in the order they were posted
+    # the pages are read with keyset pagination (see pagination.py), without the replies' own replies unless ?expand=replies
+    @rest_framework.decorators.action(methods=["GET"], detail=True)
+    def replies(self, request, pk=None):
+        """
+        The replies of a tweet, paginated with `cursor` (see the `next` link) and `limit`.
+        """
+        tweet_id = self.get_visible_tweet_id(pk)
+        self.read_options = serializers.read_options(request.query_params, expand_replies=False)
+        values = serializers.read_values(self.read_options["fields"])
+        if "created_at" not in values:
+            values += ("created_at",)  # (the pages are ordered by created_at)
+        paginator = pagination.KeysetPagination()
+        page = paginator.paginate_queryset(Tweet.objects.filter(reply_to_id=tweet_id).values(*values), request, self)
+        return paginator.get_paginated_response(self.get_read_serializer(page, many=True).data)
+
+    # the replies of a deleted tweet are only marked as deleted by the purge, in the background (see purging.py)
+    # so until then, the replies and threads of a reply are only shown if no tweet above it is deleted (one query)
+    def get_visible_tweet_id(self, pk):
+        try:
+            tweet_id = int(pk)
+        except ValueError:
+            raise rest_framework.exceptions.NotFound()
+        if not threads.is_visible(tweet_id):
+            raise rest_framework.exceptions.NotFound()
+        return tweet_id
+
+    # ADDITION: a whole conversation (a tweet and all of its replies, at any depth) as a flat list, a page at a time
+    # every tweet has its depth in the conversation (0 for the tweet itself), see flatten_thread in threads.py for the order
+    @rest_framework.decorators.action(methods=["GET"], detail=True)
+    def thread(self, request, pk=None):
+        """
+        A tweet and all of its replies, in the order of the conversation, each with its `depth` (paginated).
+        """
+        tweet_id = self.get_visible_tweet_id(pk)
+        fields = serializers.read_options(request.query_params, expand_replies=False)["fields"]
+        fields = tuple(field for field in fields if field != "replies")  # (the replies follow their tweet in the list)
+        flat = threads.flatten_thread(tweet_id)
+        page = self.paginate_queryset(flat)
+        entries = flat if page is None else page
+        # only the tweets of the page are read (one query, per chunk of ids)
+        rows, values = {}, serializers.read_values(fields)
+        for chunk in threads.chunks(tweet_id for tweet_id, depth in entries):
+            rows.update((row["id"], row) for row in Tweet.objects.filter(id__in=chunk).values(*values))
+        data = [{**serializers.tweet_representation(rows[tweet_id], fields), "depth": depth} for tweet_id, depth in entries]
+        serializers.fill_counts({tweet_id: tweet for (tweet_id, depth), tweet in zip(entries, data)}, fields)
+        if page is None:
+            return rest_framework.response.Response(data)
+        return self.get_paginated_response(data)
+
+    # ADDITION: the chain of tweets above a reply (the tweet it replies to, the tweet that one replies to, ... up to the root)
+    # the whole chain is read with a single (recursive) query, see fetch_ancestors in threads.py
+    @rest_framework.decorators.action(methods=["GET"], detail=True)
+    def context(self, request, pk=None):
+        """
+        A tweet (`tweet`) and the tweets it replies to (`ancestors`), from the root of its thread down to its parent.
+        """
+        fields = serializers.read_options(request.query_params, expand_replies=False)["fields"]
+        fields = tuple(field for field in fields if field != "replies")
+        try:
+            chain = threads.fetch_ancestors(int(pk), serializers.read_values(fields))
+        except ValueError:
+            chain = []
+        if not chain or chain[0]["reply_to_id"] is not None:  # (a deleted tweet above it hides the tweet)
+            raise rest_framework.exceptions.NotFound()
+        tweets = {row["id"]: serializers.tweet_representation(row, fields) for row in chain}
+        serializers.fill_counts(tweets, fields)
+        ancestors = [tweets[row["id"]] for row in chain[:-1]]
+        return rest_framework.response.Response({"ancestors": ancestors, "tweet": tweets[chain[-1]["id"]]})
+
+    # ADDITION: the trending threads, ranked in the background (see trending.py), read as they are from the TrendingTweet table
+    # (one query, by rank, with the root tweets and their users joined)
+    @rest_framework.decorators.action(methods=["GET"], detail=False)
+    def trending(self, request):
+        """
+        The threads with the most replies lately (the root tweets), best first, with their `rank`, `score`
+        and number of `recent_replies`.
+        """
+        fields = serializers.read_options(request.query_params, expand_replies=False)["fields"]
+        fields = tuple(field for field in fields if field != "replies")
+        values = serializers.read_values(fields)
+        rows = TrendingTweet.objects.filter(tweet__deleted_at__isnull=True).values(
+            "rank", "score", "replies", *(f"tweet__{value}" for value in values)
+        )
+        data, tweets = [], {}
+        for row in rows:
+            tweet = tweets[row["tweet__id"]] = serializers.tweet_representation(
+                {value: row[f"tweet__{value}"] for value in values}, fields
+            )
+            data.append({"rank": row["rank"], "score": row["score"], "recent_replies": row["replies"], "tweet": tweet})
+        serializers.fill_counts(tweets, fields)
+        return rest_framework.response.Response(data)
+
+    # ADDITION: liking and retweeting a tweet (POST), and undoing it (DELETE)
+    # the counts are not updated in the same transaction (a popular tweet's counter would be a hot row), they are added up
+    # in memory and written in the background (see counters.py), the counts in the responses are approximate
+    @rest_framework.decorators.action(methods=["POST", "DELETE"], detail=True)
+    def like(self, request, pk=None):
+        """
+        Like the tweet (`POST`) or take the like back (`DELETE`), returns the number of likes.
+        """
+        return self.engage(request, pk, Like, TweetCounter.LIKES)
+
+    @rest_framework.decorators.action(methods=["POST", "DELETE"], detail=True)
+    def retweet(self, request, pk=None):
+        """
+        Retweet the tweet (`POST`) or take the retweet back (`DELETE`), returns the number of retweets.
+        """
+        return self.engage(request, pk, Retweet, TweetCounter.RETWEETS)
+
+    def engage(self, request, pk, model, kind):
+        tweet = drf_generics.get_object_or_404(Tweet.objects.values("id"), pk=pk)
+        if request.method == "POST":
+            _, changed = model.objects.get_or_create(user=request.user, tweet_id=tweet["id"])
+            delta, active = 1, True
+        else:
+            changed = model.objects.filter(user=request.user, tweet_id=tweet["id"]).delete()[0] > 0
+            delta, active = -1, False
+        if changed:  # (liking a tweet twice counts once)
+            transaction.on_commit(functools.partial(counters.add, tweet["id"], kind, delta))
+        return rest_framework.response.Response(
+            {"id": tweet["id"], "active": active, kind: counters.counts([tweet["id"]])[tweet["id"]][kind]}
+        )
+
+    # just like form_valid in the TweetCreateView, the create serializer doesn't know about the user posting the tweet
+    # so we override perform_create (called by the CreateModelMixin) to set the user to the current user
+    # see https://www.django-rest-framework.org/api-guide/generic-views/#save-and-deletion-hooks
+    def perform_create(self, serializer):
+        tweet = serializer.save(user=self.request.user)
+        trending.schedule()  # (counts the new replies in the background, see trending.py)
+        if tweet.reply_to_id is not None:
+            inbox.schedule()  # (notifies the author of the tweet replied to, in the background, see notifications/inbox.py)
+
+    # deleting a tweet (and its whole thread) could take long, so the tweet is soft deleted, which hides it right away,
+    # and the thread is purged later, in small batches, by the purge_tweets command (see Tweet.soft_delete and purging.py)
+    def perform_destroy(self, instance):
+        instance.soft_delete()
+        purging.schedule()  # (only with TWEET_PURGE_IN_BACKGROUND, see purging.py)
+
+    # we override this function to use different permissions for different actions
+    def get_permissions(self):
+        """
+        Instantiates and returns the list of permissions that this view requires.
+        """
+        if self.action in ["destroy"]:  # if the action is update/partial_update (profile update)
+            # ADDIITON: use the IsAuthenticated permission class in addition to the IsOwnerOrAdmin permission class
+            # so that only the owner of the tweet or an admin can delete the tweet
+            # set the permission_list to [ rest_framework.permissions.IsAuthenticated, permissions.IsOwnerOrAdmin]
+            permission_list = [permissions.IsOwnerOrAdmin, rest_framework.permissions.IsAuthenticated]
+        else:
+            # ADDITION: set the permission_list to [rest_framework.permissions.IsAuthenticated] so that only authenticated
+            # users can access the rest of the tweet apis
+            permission_list = [rest_framework.permissions.IsAuthenticated]
+        return [permission() for permission in permission_list]
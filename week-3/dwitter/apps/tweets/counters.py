@@ -0,0 +1,204 @@
+"""
+The counts of likes and retweets of the tweets, without making the popular tweets hot rows.
+
+Liking a tweet inserts a Like row (a row of its own for every user, no contention there), the counts are kept apart in
+TweetCounter rows. Updating a single counter row per tweet for every like would queue all the likes of a popular tweet
+on that row, so instead:
+
+* the counts are split in TWEET_COUNTER_SHARDS rows per tweet (and kind), every update goes to a random shard,
+  and a count is the sum of its shards
+* with a TWEET_COUNTER_FLUSH_INTERVAL, the likes are not counted in the database one at a time: every process adds them
+  up in memory, and a background thread writes the totals every TWEET_COUNTER_FLUSH_INTERVAL seconds (one UPDATE per
+  tweet and kind, for all of their likes since the last flush). That thread writes alongside the requests (SQLite, with
+  its single writer, then fails some of their writes with "database table is locked"), so by default (an interval of 0)
+  every like is counted right away, in a shard.
+
+With an interval, the counts lag behind by up to the flush interval (the counts read by a process include its own
+unflushed likes), and a process that dies loses its unflushed counts: `python manage.py recount_tweets` counts the Like
+and Retweet rows again.
+"""
+import atexit
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum
+
+from .models import Like, Retweet, Tweet, TweetCounter
+
+logger = logging.getLogger("dwitter.counters")
+
+KINDS = {TweetCounter.LIKES: Like, TweetCounter.RETWEETS: Retweet}
+
+# the number of ids in a single `IN (...)` lookup (sqlite limits the number of parameters in a query)
+CHUNK_SIZE = 500
+
+_pending = Counter()  # {(tweet id, kind): the change of the count since the last flush}
+_lock = threading.Lock()
+_thread = None
+
+
+def add(tweet_id, kind, delta):
+    """
+    Count `delta` more likes (or retweets, see KINDS) of the tweet (call it once the like is committed).
+    """
+    with _lock:
+        _pending[tweet_id, kind] += delta
+    if settings.TWEET_COUNTER_FLUSH_INTERVAL <= 0:
+        flush()
+    else:
+        _start()
+
+
+def _increment(tweet_id, kind, delta, shard=None):
+    if shard is None:
+        shard = random.randrange(settings.TWEET_COUNTER_SHARDS)
+    counter = TweetCounter.objects.filter(tweet_id=tweet_id, kind=kind, shard=shard)
+    if counter.update(count=F("count") + delta):
+        return
+    try:
+        with transaction.atomic():
+            TweetCounter.objects.create(tweet_id=tweet_id, kind=kind, shard=shard, count=delta)
+    except IntegrityError:  # (another process created the shard in the meantime)
+        counter.update(count=F("count") + delta)
+
+
+def flush():
+    """
+    Write the counts added up in memory to the database (in one transaction), return how many counters were written.
+    """
+    with _lock:
+        pending = {key: delta for key, delta in _pending.items() if delta}
+        _pending.clear()
+    if not pending:
+        return 0
+    try:
+        with transaction.atomic():
+            # the tweets purged in the meantime (see purging.py) have no counters anymore
+            existing = set()
+            for chunk in _chunks({tweet_id for tweet_id, kind in pending}):
+                existing.update(Tweet.all_objects.filter(id__in=chunk).values_list("id", flat=True))
+            for (tweet_id, kind), delta in pending.items():
+                if tweet_id in existing:
+                    _increment(tweet_id, kind, delta)
+    except Exception:
+        # put the counts back, the next flush tries again
+        with _lock:
+            _pending.update(pending)
+        raise
+    return len(pending)
+
+
+def counts(tweet_ids):
+    """
+    The {tweet id: {"likes": ..., "retweets": ...}} of the tweets (one query per chunk of ids), approximate (see above).
+    """
+    result = {tweet_id: dict.fromkeys(KINDS, 0) for tweet_id in tweet_ids}
+    for chunk in _chunks(result):
+        rows = TweetCounter.objects.filter(tweet_id__in=chunk).values("tweet_id", "kind").annotate(total=Sum("count"))
+        for row in rows:
+            result[row["tweet_id"]][row["kind"]] = row["total"]
+    with _lock:
+        for (tweet_id, kind), delta in _pending.items():
+            if tweet_id in result:
+                result[tweet_id][kind] += delta
+    return result
+
+
+def fill(tweets_by_id, kinds=tuple(KINDS)):
+    """
+    Set the counts (the given kinds, "likes" and "retweets" by default) of the tweets (dicts, by id).
+    """
+    if not kinds:
+        return
+    for tweet_id, tweet_counts in counts(list(tweets_by_id)).items():
+        for kind in kinds:
+            tweets_by_id[tweet_id][kind] = tweet_counts[kind]
+
+
+def recount(log=None):
+    """
+    Count the likes and retweets of every tweet again, from the Like and Retweet rows, and correct the counters (by
+    CHUNK_SIZE tweets per transaction), return the number of counts that were off.
+
+    The counter rows are not replaced (the processes keep incrementing them in the meantime): the difference between
+    each count and the sum of its shards is added to one shard. The counts another process still holds in memory are
+    already in the Like and Retweet rows, and will be added again when it flushes them. So with a
+    TWEET_COUNTER_FLUSH_INTERVAL, recount with the servers stopped (they flush their counts when they exit).
+    """
+    flush()
+    corrected, last_id = 0, None
+    while True:
+        tweets = Tweet.all_objects.order_by("id")
+        if last_id is not None:
+            tweets = tweets.filter(id__gt=last_id)
+        tweet_ids = list(tweets.values_list("id", flat=True)[:CHUNK_SIZE])
+        if not tweet_ids:
+            break
+        last_id = tweet_ids[-1]
+        with transaction.atomic():
+            for kind, model in KINDS.items():
+                totals = Counter(
+                    dict(model.objects.filter(tweet_id__in=tweet_ids).values_list("tweet_id").annotate(Count("id")).order_by())
+                )
+                shards = TweetCounter.objects.filter(tweet_id__in=tweet_ids, kind=kind)
+                totals.subtract(dict(shards.values_list("tweet_id").annotate(Sum("count")).order_by()))
+                for tweet_id, delta in totals.items():
+                    if delta:
+                        _increment(tweet_id, kind, delta, shard=0)
+                        corrected += 1
+        if log:
+            log(f"recounted the tweets up to {last_id}, {corrected} counts corrected")
+    return corrected
+
+
+def _chunks(ids, size=CHUNK_SIZE):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start : start + size]
+
+
+# the background flush: a single daemon thread per process, started by the first like
+def _run():
+    while True:
+        time.sleep(settings.TWEET_COUNTER_FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception:  # the thread must survive errors (e.g. the database being locked), the counts are kept for the next flush
+            logger.exception("flushing the counters failed")
+        finally:
+            # the thread has its own database connection, which must not stay open between flushes
+            connection.close()
+
+
+def _start():
+    global _thread
+    if _thread is not None:
+        return
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_run, name="dwitter-counters", daemon=True)
+            _thread.start()
+
+
+def _after_fork():
+    # a forked worker starts without the parent's counts (the parent flushes them) and without its thread
+    global _thread, _lock
+    _thread, _lock = None, threading.Lock()
+    _pending.clear()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        logger.exception("flushing the counters at exit failed")
@@ -0,0 +1,50 @@
+"""
+Keyset pagination (see https://use-the-index-luke.com/no-offset) of tweets ordered by (created_at, id).
+
+With ?offset= (or ?page=) the database reads and skips all the rows before the page, so the pages get slower the further
+you go, and tweets posted in the meantime shift the pages. Instead, every page starts right after the last row of the
+previous page, which the database finds with an index ending with (created_at, id) (see Tweet.Meta.indexes): the link
+to the next page carries the (created_at, id) of that row, in an opaque cursor.
+The creation time of a tweet never changes (unlike uploaded_at, see Tweet.created_at), so the cursors stay valid when
+tweets are edited.
+
+This is used by both the APIs (see KeysetPagination in pagination.py) and the html pages, so it doesn't import rest framework.
+"""
+import base64
+import datetime
+
+from django.db.models import Q
+
+
+def encode_cursor(row):
+    position = f"{row['created_at'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(position.encode("ascii")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """
+    The (created_at, id) of an encoded cursor, raise ValueError if it is not a valid cursor.
+    """
+    try:
+        created_at, pk = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("ascii").split("|")
+        return datetime.datetime.fromisoformat(created_at), int(pk)
+    except (TypeError, UnicodeError) as error:
+        raise ValueError(cursor) from error
+
+
+def page(queryset, position, limit, newest_first=False):
+    """
+    Return the rows (dicts, from queryset.values(), which must read created_at and id) of the page after
+    `position` (the (created_at, id) of the last row of the previous page, None for the first page),
+    and the row after which the next page starts (None if this is the last page).
+    """
+    if position is not None:
+        created_at, pk = position
+        if newest_first:
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+        else:
+            queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+    ordering = ("-created_at", "-id") if newest_first else ("created_at", "id")
+    # one more row than the page, to know whether there is a next page
+    rows = list(queryset.order_by(*ordering)[: limit + 1])
+    return rows[:limit], (rows[limit - 1] if len(rows) > limit else None)
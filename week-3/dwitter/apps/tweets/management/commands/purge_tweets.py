@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ... import purging
+
+
+class Command(BaseCommand):
+    help = (
+        "Permanently delete the soft deleted tweets and their replies, in small batches (see purging.py). "
+        "Run it e.g. from a cron job (or set TWEET_PURGE_IN_BACKGROUND=True to purge in a thread of the server)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.TWEET_PURGE_BATCH_SIZE,
+            help="maximum number of tweets marked or deleted per transaction",
+        )
+        parser.add_argument(
+            "--pause", type=float, default=settings.TWEET_PURGE_PAUSE, help="seconds to sleep between batches"
+        )
+
+    def handle(self, *args, **options):
+        log = self.stdout.write if options["verbosity"] > 1 else None
+        batches = purging.purge(options["batch_size"], options["pause"], log=log)
+        self.stdout.write(self.style.SUCCESS(f"purged the deleted tweets in {batches} batches"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from ... import counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Count the likes and retweets of every tweet again from the Like and Retweet rows, and correct their counters "
+        "(see counters.py), e.g. after a worker died with counts it had not written yet. With a "
+        "TWEET_COUNTER_FLUSH_INTERVAL, run it with the servers stopped (their unwritten counts would be counted twice)."
+    )
+
+    def handle(self, *args, **options):
+        log = self.stdout.write if options["verbosity"] > 1 else None
+        corrected = counters.recount(log=log)
+        self.stdout.write(self.style.SUCCESS(f"recounted the likes and retweets, {corrected} counts corrected"))
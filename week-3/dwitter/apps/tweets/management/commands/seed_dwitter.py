@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from ... import seeding
+
+# Custom management commands let us add our own commands to manage.py
+# see https://docs.djangoproject.com/en/4.1/howto/custom-management-commands/
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with realistic synthetic users and reply trees (deterministic for a given --seed), "
+        "and optionally snapshot the result to a file, or restore a snapshot."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100, help="number of users to create")
+        parser.add_argument("--tweets", type=int, default=1000, help="number of tweets to create (roots and replies)")
+        parser.add_argument("--reply-depth", type=int, default=3, help="maximum depth of the reply trees")
+        parser.add_argument(
+            "--fanout-dist",
+            choices=seeding.FANOUT_DISTRIBUTIONS,
+            default="zipf",
+            help="how replies are spread over the tweets they reply to",
+        )
+        parser.add_argument("--root-share", type=float, default=0.2, help="share of the tweets that are not replies")
+        parser.add_argument("--seed", type=int, default=0, help="random seed (the same seed generates the same data)")
+        parser.add_argument("--batch-size", type=int, default=1000, help="number of rows per insert")
+        parser.add_argument("--password", default="dwitter-password", help="password of all the generated users")
+        parser.add_argument("--user-prefix", default="user", help="prefix of the generated usernames")
+        parser.add_argument("--snapshot", metavar="PATH", help="copy the database to PATH once it has been seeded")
+        parser.add_argument("--restore", metavar="PATH", help="restore the database from a snapshot instead of seeding")
+
+    def handle(self, *args, **options):
+        try:
+            if options["restore"]:
+                seeding.restore(options["restore"])
+                self.stdout.write(self.style.SUCCESS(f"restored the database from {options['restore']}"))
+                return
+
+            seeding.generate(
+                users=options["users"],
+                tweets=options["tweets"],
+                reply_depth=options["reply_depth"],
+                fanout_dist=options["fanout_dist"],
+                root_share=options["root_share"],
+                password=options["password"],
+                seed=options["seed"],
+                batch_size=options["batch_size"],
+                user_prefix=options["user_prefix"],
+                log=self.stdout.write if options["verbosity"] > 0 else None,
+            )
+            if options["snapshot"]:
+                seeding.snapshot(options["snapshot"])
+                self.stdout.write(self.style.SUCCESS(f"database snapshot written to {options['snapshot']}"))
+        except ValueError as error:
+            raise CommandError(error)
+        except IntegrityError as error:
+            raise CommandError(f"{error} (are there already users named {options['user_prefix']}*? see --user-prefix)")
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ... import trending
+
+
+class Command(BaseCommand):
+    help = (
+        "Count the replies of the tweets posted since the last update, and rank the trending threads (see trending.py). "
+        "The server does this in the background, unless TRENDING_IN_BACKGROUND is False."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.TRENDING_BATCH_SIZE, help="number of new tweets read per transaction"
+        )
+
+    def handle(self, *args, **options):
+        log = self.stdout.write if options["verbosity"] > 1 else None
+        counted = trending.update(options["batch_size"], log=log)
+        self.stdout.write(self.style.SUCCESS(f"counted {counted} new tweets and ranked the trending threads"))
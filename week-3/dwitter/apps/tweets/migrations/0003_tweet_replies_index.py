@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0002_tweet_deleted_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tweet',
+            index=models.Index(fields=['reply_to', 'uploaded_at', 'id'], name='tweets_replies_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0003_tweet_replies_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tweet',
+            index=models.Index(fields=['user', 'uploaded_at', 'id'], name='tweets_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tweet',
+            index=models.Index(condition=models.Q(('reply_to__isnull', True)), fields=['user', 'uploaded_at', 'id'], name='tweets_user_roots_idx'),
+        ),
+    ]
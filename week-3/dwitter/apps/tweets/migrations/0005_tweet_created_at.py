@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_created_at(apps, schema_editor):
+    # the tweets that already exist were created when they were last saved, at the latest (that's all we know)
+    Tweet = apps.get_model("tweets", "Tweet")
+    Tweet.objects.using(schema_editor.connection.alias).update(created_at=models.F("uploaded_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0004_tweet_user_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # created_at is added as a nullable column, filled from uploaded_at, and only then made required
+        migrations.AddField(
+            model_name='tweet',
+            name='created_at',
+            field=models.DateTimeField(null=True, verbose_name='Created at'),
+        ),
+        migrations.RunPython(backfill_created_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tweet',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='Created at'),
+        ),
+        migrations.AddField(
+            model_name='tweet',
+            name='edited_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Edited at'),
+        ),
+        migrations.RemoveIndex(
+            model_name='tweet',
+            name='tweets_replies_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='tweet',
+            name='tweets_user_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='tweet',
+            name='tweets_user_roots_idx',
+        ),
+        migrations.AddIndex(
+            model_name='tweet',
+            index=models.Index(fields=['reply_to', 'created_at', 'id'], name='tweets_replies_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tweet',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='tweets_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tweet',
+            index=models.Index(condition=models.Q(('reply_to__isnull', True)), fields=['user', 'created_at', 'id'], name='tweets_user_roots_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tweet',
+            index=models.Index(condition=models.Q(('reply_to__isnull', True)), fields=['created_at', 'id'], name='tweets_roots_idx'),
+        ),
+    ]
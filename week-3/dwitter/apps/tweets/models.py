@@ -1,6 +1,12 @@
+import datetime
+import itertools
+
+from django.conf import settings
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+from . import snowflake
 
 # Session 2: We wish to create a model to store the tweets that users post on Dwitter
 # We can do this by subclassing the django.db.models.Model class
@@ -17,6 +23,35 @@ from django.contrib.auth import get_user_model
 # For example, we can specify the max_length parameter to the CharField class to specify the maximum length of the string that can be stored in the field
 
 
+# ADDITION: deleting a tweet deletes all of its replies (reply_to is on_delete=CASCADE), which for a large thread means loading
+# every reply into memory (that's how django's collector cascades deletes) in one long write transaction.
+# So tweets are soft deleted instead: their deleted_at is set (which hides them at once), and the deleted threads are purged
+# later, in small batches (see purging.py). The default manager (Tweet.objects) hides the deleted tweets,
+# Tweet.all_objects sees them too.
+# see https://docs.djangoproject.com/en/4.1/topics/db/managers/#modifying-a-manager-s-initial-queryset
+class TweetManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+    # ADDITION: the tweets of a user (the ones that are not replies, unless with_replies), for their timeline
+    # read newest first with keyset pagination (see keyset.py), from the tweets_user_* indexes (see Tweet.Meta below)
+    def posted_by(self, user_id, with_replies=False):
+        queryset = self.get_queryset().filter(user_id=user_id)
+        return queryset if with_replies else queryset.filter(reply_to=None)
+
+    # ADDITION: the next (at most `limit`) tweets after a tweet id, in id order, for the jobs that follow the new tweets
+    # with a watermark (the id of the last tweet they handled, see trending.py and notifications/inbox.py)
+    # The ids are not always committed in order: snowflake ids are minted by every worker, so the tweet of a slow
+    # transaction can be committed after a tweet with a larger id, and a job that already moved past it would never see
+    # it. So a tweet is only returned once it's TWEET_COMMIT_GRACE seconds old (and none after the first one that's more
+    # recent), assuming that its transaction is committed by then.
+    # The rows are the values of `fields`, followed by the created_at of the tweet.
+    def settled_after(self, tweet_id, fields, limit, now):
+        rows = self.get_queryset().filter(id__gt=tweet_id).order_by("id").values_list(*fields, "created_at")[:limit]
+        cutoff = now - datetime.timedelta(seconds=settings.TWEET_COMMIT_GRACE)
+        return list(itertools.takewhile(lambda row: row[-1] < cutoff, rows))
+
+
 class Tweet(models.Model):
     # The user who posted the tweet (see https://docs.djangoproject.com/en/4.1/ref/models/fields/#django.db.models.ForeignKey)
     # We use the django.contrib.auth.get_user_model function to get the user model that is currently in use
@@ -50,7 +85,149 @@ class Tweet(models.Model):
     # you should set the auto_now_add parameter to True so that the time is automatically set to the current time when the tweet is created
     uploaded_at = models.DateTimeField(auto_now=True)
 
+    # ADDITION: uploaded_at is auto_now (it changes on every save, e.g. an edit in the admin site), so it can't be used
+    # to order the tweets: an edited tweet would jump to the top of the feeds, and the cursors of the pages (see keyset.py)
+    # would skip or repeat it. The tweets are ordered by when they were created instead, which never changes
+    # (auto_now_add, see https://docs.djangoproject.com/en/4.1/ref/models/fields/#django.db.models.DateField.auto_now_add)
+    # and edited_at tells when (and whether) the tweet was edited, see save() below
+    created_at = models.DateTimeField(_("Created at"), auto_now_add=True)
+    edited_at = models.DateTimeField(_("Edited at"), null=True, blank=True, editable=False)
+
+    # ADDITION: when the tweet was (soft) deleted, None if it's not deleted (see TweetManager above)
+    deleted_at = models.DateTimeField(_("Deleted at"), null=True, blank=True, editable=False)
+
+    # the first manager is the default one (used by the admin site, and by related managers like tweet.replies)
+    # see https://docs.djangoproject.com/en/4.1/topics/db/managers/#default-managers
+    objects = TweetManager()  # the tweets that are not deleted
+    all_objects = models.Manager()  # all the tweets, including the deleted ones (e.g. to purge them)
+
+    class Meta:
+        indexes = [
+            # a partial index of the deleted tweets, for the purge to find them without scanning the whole table
+            # see https://docs.djangoproject.com/en/4.1/ref/models/indexes/#condition
+            models.Index(fields=["id"], condition=models.Q(deleted_at__isnull=False), name="tweets_deleted_idx"),
+            # the replies of a tweet in the order they were posted, for the keyset pagination of the replies (see pagination.py)
+            models.Index(fields=["reply_to", "created_at", "id"], name="tweets_replies_idx"),
+            # the tweets of a user, newest first (the index is read backwards), for their timeline (see TweetManager.posted_by)
+            # and the same for the tweets that are not replies, so that listing them doesn't skip over the user's replies
+            models.Index(fields=["user", "created_at", "id"], name="tweets_user_idx"),
+            models.Index(
+                fields=["user", "created_at", "id"], condition=models.Q(reply_to__isnull=True), name="tweets_user_roots_idx"
+            ),
+            # the tweets that are not replies, in the order they were created (the home page and the tweets API list them)
+            models.Index(fields=["created_at", "id"], condition=models.Q(reply_to__isnull=True), name="tweets_roots_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        # ADDITION: new tweets get a snowflake id (known before the insert, and ordered by time), see snowflake.py
+        if self._state.adding and self.pk is None and settings.TWEET_SNOWFLAKE_IDS:
+            self.pk = snowflake.next_id()
+            kwargs["force_insert"] = True  # (the id is new, no need to try an UPDATE first)
+        # changing the text of a tweet that already exists is an edit (creating it is not, nor saving it unchanged)
+        if not self._state.adding and self.text_changed(kwargs.get("update_fields")):
+            self.edited_at = timezone.now()
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "edited_at"}
+        super().save(*args, **kwargs)
+        if kwargs.get("update_fields") is None or "text" in kwargs["update_fields"]:
+            self._loaded_text = self.text
+
+    # the text the tweet was loaded with, to tell edits from saves that don't change it
+    # see https://docs.djangoproject.com/en/4.1/ref/models/instances/#customizing-model-loading
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if "text" in field_names:
+            instance._loaded_text = values[field_names.index("text")]
+        return instance
+
+    def text_changed(self, update_fields=None):
+        if update_fields is not None and "text" not in update_fields:
+            return False
+        if not hasattr(self, "_loaded_text"):
+            # (not loaded from the database, or loaded without its text)
+            self._loaded_text = Tweet.all_objects.filter(pk=self.pk).values_list("text", flat=True).first()
+        return self.text != self._loaded_text
+
+    def soft_delete(self):
+        """
+        Hide the tweet (and so its whole thread) right away, the thread is purged later (see purging.py).
+        """
+        self.deleted_at = timezone.now()
+        Tweet.all_objects.filter(pk=self.pk).update(deleted_at=self.deleted_at)
+
     # create a __str__ method to return the text of the tweet (and username and upload time) when we print the tweet object (see https://docs.djangoproject.com/en/4.1/ref/models/instances/#str)
     # this is useful in django admin and in other places where we want to display the tweet object
     def __str__(self):
-        return f"{self.user.username} at {self.uploaded_at}: {self.text}"
+        return f"{self.user.username} at {self.created_at}: {self.text}"
+
+
+# ADDITION: likes and retweets (one row per user and tweet, so a user likes a tweet at most once)
+# the number of likes and retweets of every tweet is kept in TweetCounter rows below (counting the likes of every tweet
+# of a page on every request would read all of their rows)
+# see https://docs.djangoproject.com/en/4.1/topics/db/models/#abstract-base-classes
+class Engagement(models.Model):
+    user = models.ForeignKey(to=get_user_model(), on_delete=models.CASCADE, related_name="%(class)ss")
+    tweet = models.ForeignKey(to=Tweet, on_delete=models.CASCADE, related_name="%(class)ss")
+    created_at = models.DateTimeField(_("Created at"), auto_now_add=True)
+
+    class Meta:
+        abstract = True
+        constraints = [models.UniqueConstraint(fields=["user", "tweet"], name="%(app_label)s_%(class)s_unique")]
+
+    def __str__(self):
+        return f"{self.user} {self._meta.verbose_name} {self.tweet_id}"
+
+
+class Like(Engagement):
+    pass
+
+
+class Retweet(Engagement):
+    pass
+
+
+# ADDITION: the counts of the likes and retweets of the tweets, split in TWEET_COUNTER_SHARDS rows per tweet (and kind)
+# with a single row per tweet, every like of a popular tweet would update the same row, one at a time (each update waits
+# for the row's lock). The updates go to a random shard instead, and the count is the sum of the shards (see counters.py)
+class TweetCounter(models.Model):
+    LIKES = "likes"
+    RETWEETS = "retweets"
+    KINDS = [(LIKES, _("Likes")), (RETWEETS, _("Retweets"))]
+
+    tweet = models.ForeignKey(to=Tweet, on_delete=models.CASCADE, related_name="+")
+    kind = models.CharField(max_length=10, choices=KINDS)
+    shard = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)  # (a shard can be negative, e.g. a like counted in one shard and its unlike in another)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["tweet", "kind", "shard"], name="tweets_counter_shard_unique")]
+
+
+# ADDITION: the trending threads (see trending.py)
+# the number of replies posted in every thread (by its root tweet), per bucket of TRENDING_BUCKET_MINUTES
+class ThreadActivity(models.Model):
+    root = models.ForeignKey(to=Tweet, on_delete=models.CASCADE, related_name="+")
+    bucket = models.DateTimeField()  # the start of the bucket
+    replies = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["root", "bucket"], name="tweets_activity_unique")]
+        indexes = [models.Index(fields=["bucket"], name="tweets_activity_bucket_idx")]
+
+
+# the top TRENDING_SIZE threads, by rank (served as they are by the trending API, rebuilt by trending.update)
+class TrendingTweet(models.Model):
+    rank = models.PositiveIntegerField(primary_key=True)
+    tweet = models.ForeignKey(to=Tweet, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+    replies = models.IntegerField()  # the replies posted in the thread during the window
+
+    class Meta:
+        ordering = ["rank"]
+
+
+# where trending.update got to: the id of the last tweet it counted (a single row)
+class TrendingState(models.Model):
+    last_tweet_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(null=True)
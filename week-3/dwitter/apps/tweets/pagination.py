@@ -0,0 +1,67 @@
+"""
+Keyset pagination for the APIs (see keyset.py): the replies of a tweet, and the tweets of a user.
+"""
+from django.utils.translation import gettext_lazy as _
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from . import keyset
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    Pages of rows (dicts, from queryset.values()) ordered by (created_at, id), which must both be read.
+    """
+
+    cursor_query_param = "cursor"
+    limit_query_param = "limit"
+    max_limit = 100
+    newest_first = False
+    invalid_cursor_message = _("Invalid cursor")
+
+    def get_limit(self, request):
+        try:
+            return min(max(int(request.query_params[self.limit_query_param]), 1), self.max_limit)
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            return keyset.decode_cursor(cursor)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        rows, last = keyset.page(queryset, self.decode_cursor(request), self.get_limit(request), self.newest_first)
+        self.next_cursor = keyset.encode_cursor(last) if last is not None else None
+        return rows
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {"next": {"type": "string", "nullable": True, "format": "uri"}, "results": schema},
+        }
+
+
+class TimelinePagination(KeysetPagination):
+    """
+    The same, newest first (e.g. the tweets of a user).
+    """
+
+    newest_first = True
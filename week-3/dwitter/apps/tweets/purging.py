@@ -0,0 +1,144 @@
+"""
+Purging the soft deleted threads (see Tweet.soft_delete in models.py), in small batches.
+
+Deleting a thread with django's collector (queryset.delete()) loads every reply of the thread into memory, level by level,
+and deletes them all in one long write transaction (which locks the whole SQLite database). Instead, we purge with
+plain set-based UPDATE and DELETE statements, a bounded batch at a time, each batch in its own short transaction:
+
+1. the replies of the deleted tweets are marked as deleted too (level by level, `batch_size` tweets at a time)
+2. the deleted tweets without replies (the leaves of the deleted threads) are deleted, `batch_size` tweets at a time
+
+so the threads are deleted from their leaves up, and a reply is never left without its parent.
+
+The purge_tweets management command purges the deleted threads (e.g. from a cron job). With TWEET_PURGE_IN_BACKGROUND,
+deleting a tweet with the API schedules a purge in a background thread of the server instead (see schedule()), which
+writes alongside the requests (SQLite, with its single writer, then fails some of their writes with "database table
+is locked"), so it's off by default.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Tweet
+
+logger = logging.getLogger("dwitter.purging")
+
+
+def dependent_rows():
+    """
+    The (model, foreign key) of the rows that point to the tweets (likes, counters, notifications, ...), which the
+    plain DELETE of the tweets doesn't cascade to. They are found from the models, so that the apps that point to the
+    tweets (e.g. the notifications) don't have to be imported here.
+    """
+    return [
+        (relation.related_model, relation.field.name)
+        for relation in Tweet._meta.get_fields(include_hidden=True)  # (including the ones with related_name="+")
+        if relation.auto_created and not relation.concrete and relation.related_model is not Tweet
+        # (the replies are deleted as tweets, from the leaves up)
+    ]
+
+
+def mark_replies(batch_size):
+    """
+    Mark (at most `batch_size`) replies of deleted tweets as deleted, return how many were marked.
+    """
+    ids = list(
+        Tweet.all_objects.filter(deleted_at__isnull=True, reply_to__deleted_at__isnull=False).values_list("id", flat=True)[
+            :batch_size
+        ]
+    )
+    if ids:
+        Tweet.all_objects.filter(id__in=ids).update(deleted_at=timezone.now())
+    return len(ids)
+
+
+def delete_leaves(batch_size):
+    """
+    Delete (at most `batch_size`) deleted tweets that have no replies left, return how many were deleted.
+    """
+    has_replies = Exists(Tweet.all_objects.filter(reply_to=OuterRef("pk")))
+    ids = list(
+        Tweet.all_objects.filter(deleted_at__isnull=False)
+        .exclude(has_replies)
+        .values_list("id", flat=True)[:batch_size]
+    )
+    if ids:
+        # the plain DELETE below doesn't cascade, so the rows that point to the tweets are deleted first
+        # (these have no rows pointing to them, so their delete() is a single DELETE too)
+        for model, field in dependent_rows():
+            model.objects.filter(**{f"{field}_id__in": ids}).delete()
+        # a plain DELETE (queryset.delete() would go through the collector, which looks for the replies of every tweet)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {connection.ops.quote_name(Tweet._meta.db_table)} WHERE id IN ({', '.join(['%s'] * len(ids))})",
+                ids,
+            )
+    return len(ids)
+
+
+def purge_batch(batch_size=None):
+    """
+    Run one batch of the purge (in its own transaction), return the number of tweets marked or deleted (0 when done).
+    """
+    batch_size = batch_size or settings.TWEET_PURGE_BATCH_SIZE
+    with transaction.atomic():
+        marked = mark_replies(batch_size)
+    with transaction.atomic():
+        deleted = delete_leaves(batch_size)
+    return marked + deleted
+
+
+def purge(batch_size=None, pause=None, log=None):
+    """
+    Purge all the deleted threads, sleeping `pause` seconds between batches (to let the other writes through).
+    Return the number of batches.
+    """
+    pause = settings.TWEET_PURGE_PAUSE if pause is None else pause
+    batches = 0
+    while True:
+        done = purge_batch(batch_size)
+        if not done:
+            return batches
+        batches += 1
+        if log:
+            log(f"batch {batches}: {done} tweets marked or deleted")
+        time.sleep(pause)
+
+
+# the background purge: a single daemon thread, woken up whenever a tweet is deleted
+_wakeup = threading.Event()
+_thread = None
+_lock = threading.Lock()
+
+
+def _run():
+    while True:
+        _wakeup.wait()
+        _wakeup.clear()
+        try:
+            purge()
+        except Exception:  # the thread must survive errors (e.g. the database being locked), the next deletion retries
+            logger.exception("purging the deleted tweets failed")
+        finally:
+            # the thread has its own database connection, which must not stay open between purges
+            connection.close()
+
+
+def schedule():
+    """
+    Purge the deleted threads in the background (once the current transaction is committed).
+    Does nothing unless TWEET_PURGE_IN_BACKGROUND is True (by default the purge_tweets command has to be run, e.g. by cron).
+    """
+    global _thread
+    if not settings.TWEET_PURGE_IN_BACKGROUND:
+        return
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_run, name="dwitter-purge", daemon=True)
+            _thread.start()
+    transaction.on_commit(_wakeup.set)
@@ -0,0 +1,114 @@
+"""
+Rendering the threads (built by build_html_threads in threads.py) to html, without the template engine.
+
+Rendering a thread with a template that includes itself for every reply takes a new context (and a new level of python
+recursion) per reply, which is slow for large pages and fails on very deep threads. Instead, the cards are rendered from
+precompiled format strings, walking the threads with an explicit stack.
+
+This is the only place the markup of the tweets is defined: the pages (index.html, user_tweets.html, ...) output the html
+rendered here.
+"""
+from django.template.defaultfilters import timesince_filter
+from django.urls import reverse
+from django.utils.html import conditional_escape
+from django.utils.safestring import mark_safe
+
+# the pieces of the markup of a tweet (a bootstrap card) and of its replies
+CARD = (
+    '<div  class="col-12 card my-1">\n'
+    '    <div class="card-body p-1">\n'
+    '        <div class="mt-3">\n'
+    "            {username} \n"
+    "            {names}\n"
+    '            <span class="list-inline-item mx-2 my-0 text-muted small">\n'
+    "                {timesince} ago\n"
+    "            </span>\n"
+    '            <span class="list-inline-item mx-2 my-0 text-muted small">\n'
+    "                {likes} likes, {retweets} retweets\n"
+    "            </span>\n"
+    '            <div class="float-right">\n'
+    '                <a class="btn btn-sm btn-outline-primary" href="{reply_url}?reply_to={id}">\n'
+    "                    Reply\n"
+    "                </a>\n"
+    "            </div>\n"
+    "        </div>\n"
+    '        <div class="pb-1">\n'
+    "            {text}\n"
+    "        </div>\n"
+    "        \n"
+    "        "
+)
+NAMES = '\n            <span class="small"> ({first_name} {last_name})</span>\n            '
+REPLIES_START = '\n        <div class="ms-2">\n        '
+REPLY_START = REPLY_END = REPLIES_END = "\n        "
+# the "load more replies" link (the next replies replace it in the page, see base.html)
+LOAD_REPLIES = '<a class="btn btn-sm btn-link load-replies" href="{url}?cursor={cursor}">Load more replies</a>'
+MORE_REPLIES = "\n        " + LOAD_REPLIES + "\n\n        "
+REPLIES_CLOSE = "\n        </div>\n        "
+CARD_END = "\n    </div>\n</div>\n"
+
+
+def load_replies_url(tweet_id):
+    return reverse("tweet-replies", args=[tweet_id])
+
+
+def render_load_replies(tweet_id, cursor):
+    """
+    The "load more replies" link of a tweet, which loads its replies after the `cursor` (see keyset.py and TweetRepliesView).
+    """
+    return mark_safe(LOAD_REPLIES.format(url=load_replies_url(tweet_id), cursor=cursor))
+
+
+def render_card(tweet, reply_url):
+    user = tweet["user"]
+    names = ""
+    if user["first_name"] or user["last_name"]:
+        names = NAMES.format(
+            first_name=conditional_escape(user["first_name"]), last_name=conditional_escape(user["last_name"])
+        )
+    return CARD.format(
+        username=conditional_escape(user["username"]),
+        names=names,
+        timesince=conditional_escape(timesince_filter(tweet["created_at"])),
+        likes=tweet["likes"],
+        retweets=tweet["retweets"],
+        reply_url=reply_url,
+        id=tweet["id"],
+        text=conditional_escape(tweet["text"]),
+    )
+
+
+def render_tweet(tweet, reply_url=None):
+    """
+    Render a tweet with its thread (a node built by build_html_threads in threads.py).
+    """
+    reply_url = reply_url or reverse("tweet")
+    html = []
+    # the stack holds the threads left to render, and the markup to output between them (strings)
+    stack = [tweet]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            html.append(item)
+            continue
+        html.append(render_card(item, reply_url))
+        after = []  # what comes after the card's header, in order (pushed in reverse below)
+        if item["replies"] or item["more_replies"] is not None:
+            after.append(REPLIES_START)
+            for reply in item["replies"]:
+                after.extend((REPLY_START, reply, REPLY_END))
+            after.append(REPLIES_END)
+            if item["more_replies"] is not None:
+                after.append(MORE_REPLIES.format(url=load_replies_url(item["id"]), cursor=item["more_replies"]))
+            after.append(REPLIES_CLOSE)
+        after.append(CARD_END)
+        stack.extend(reversed(after))
+    return mark_safe("".join(html))
+
+
+def render_threads(tweets):
+    """
+    Render the tweets (with their threads), return the list of their html (safe strings, to be output in the templates).
+    """
+    reply_url = reverse("tweet")
+    return [render_tweet(tweet, reply_url) for tweet in tweets]
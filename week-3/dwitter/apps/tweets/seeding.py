@@ -0,0 +1,163 @@
+"""
+Generate realistic synthetic data (users and reply trees) in bulk, see `manage.py seed_dwitter --help`.
+
+Everything is created with bulk_create (see https://docs.djangoproject.com/en/4.1/ref/models/querysets/#bulk-create)
+in batches, level by level (replies need the ids of the tweets they reply to), and the generated data only
+depends on the given random seed.
+"""
+import os
+import random
+import sqlite3
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+
+from .models import Tweet
+
+FANOUT_DISTRIBUTIONS = ("zipf", "uniform")
+
+WORDS = (
+    "django python tweet reply thread web app model view template form query index cache server request "
+    "response user token api rest json database migration admin static page feed timeline test deploy "
+    "today great new why how love hate just really think know about with from this that what when"
+).split()
+
+
+def zipf_weights(count, exponent=1.1):
+    """
+    Cumulative weights of a zipf distribution over `count` ranks (rank 1 is the most likely).
+    """
+    return list(accumulate(1 / rank**exponent for rank in range(1, count + 1)))
+
+
+def random_text(rng, max_words=30):
+    text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, max_words)))
+    return text[:280]
+
+
+def create_users(count, password, prefix="user", batch_size=1000):
+    """
+    Create `count` users (named `prefix0`, `prefix1`, ...) sharing the same password.
+
+    The password is hashed only once, since hashing is deliberately slow (see https://docs.djangoproject.com/en/4.1/topics/auth/passwords/).
+    """
+    User = get_user_model()
+    password = make_password(password)
+    usernames = [f"{prefix}{i}" for i in range(count)]
+    User.objects.bulk_create(
+        [
+            User(username=username, first_name=f"First{i}", last_name=f"Last{i}", password=password)
+            for i, username in enumerate(usernames)
+        ],
+        batch_size=batch_size,
+    )
+    # (bulk_create does not set the primary keys on every database backend, so we read the users back)
+    return list(User.objects.filter(username__in=usernames).order_by("id"))
+
+
+def level_sizes(replies, depth):
+    """
+    Split the replies between the reply levels, halving the number of replies at every level.
+    """
+    if depth <= 0:
+        return []
+    weights = [0.5**level for level in range(depth)]
+    sizes = [int(replies * weight / sum(weights)) for weight in weights]
+    sizes[0] += replies - sum(sizes)
+    return sizes
+
+
+def generate(
+    users,
+    tweets,
+    reply_depth=3,
+    fanout_dist="zipf",
+    root_share=0.2,
+    password="dwitter-password",
+    seed=0,
+    batch_size=1000,
+    user_prefix="user",
+    log=None,
+):
+    """
+    Generate `users` users and `tweets` tweets, `root_share` of them being roots and the rest being replies
+    (up to `reply_depth` levels deep).
+
+    With the zipf fan-out distribution, a few tweets (and users) get most of the replies (tweets), like
+    popular threads do. With the uniform distribution, replies are spread evenly.
+    """
+    if fanout_dist not in FANOUT_DISTRIBUTIONS:
+        raise ValueError(f"unknown fan-out distribution {fanout_dist!r}, expected one of {FANOUT_DISTRIBUTIONS}")
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+
+    with transaction.atomic():
+        authors = create_users(users, password, prefix=user_prefix, batch_size=batch_size)
+        log(f"created {len(authors)} users")
+        # a few users write most of the tweets
+        author_weights = zipf_weights(len(authors))
+
+        roots = max(1, int(tweets * root_share)) if reply_depth > 0 else tweets
+        level = Tweet.objects.bulk_create(
+            [
+                Tweet(user=author, text=random_text(rng))
+                for author in rng.choices(authors, cum_weights=author_weights, k=roots)
+            ],
+            batch_size=batch_size,
+        )
+        log(f"created {len(level)} root tweets")
+
+        for depth, size in enumerate(level_sizes(tweets - roots, reply_depth), start=1):
+            if not level or not size:
+                break
+            if fanout_dist == "zipf":
+                # shuffle the parents so that the popular ones are not always the first created ones
+                parents = rng.sample(level, len(level))
+                parents = rng.choices(parents, cum_weights=zipf_weights(len(parents)), k=size)
+            else:
+                parents = rng.choices(level, k=size)
+            # (the replies need the primary keys of their parents, which bulk_create sets on sqlite and postgres)
+            level = Tweet.objects.bulk_create(
+                [
+                    Tweet(user=author, reply_to=parent, text=random_text(rng))
+                    for parent, author in zip(parents, rng.choices(authors, cum_weights=author_weights, k=size))
+                ],
+                batch_size=batch_size,
+            )
+            log(f"created {len(level)} replies at depth {depth}")
+    return authors
+
+
+def snapshot(path):
+    """
+    Copy the (sqlite) database to `path`, using sqlite's online backup api (see https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection.backup).
+    """
+    check_sqlite()
+    connection.ensure_connection()
+    target = sqlite3.connect(path)
+    try:
+        connection.connection.backup(target)
+    finally:
+        target.close()
+
+
+def restore(path):
+    """
+    Replace the contents of the (sqlite) database with the snapshot at `path`.
+    """
+    check_sqlite()
+    if not os.path.isfile(path):
+        raise ValueError(f"there is no snapshot at {path}")
+    connection.ensure_connection()
+    source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        source.backup(connection.connection)
+    finally:
+        source.close()
+
+
+def check_sqlite():
+    if connection.vendor != "sqlite":
+        raise ValueError(f"snapshots are only supported for sqlite databases (not {connection.vendor})")
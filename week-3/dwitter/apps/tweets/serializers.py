@@ -2,7 +2,9 @@ from rest_framework import serializers
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth import get_user_model
 from .models import Tweet
+from . import threads, counters
 from ..accounts.serializers import RestrictedUserSerializer
+from ..monitoring.instrumentation import timed
 
 
 class TweetCreateSerializer(serializers.ModelSerializer):
@@ -24,16 +26,26 @@ class TweetViewSerializer(serializers.ModelSerializer):
     # we define a serializer method field (https://www.django-rest-framework.org/api-guide/fields/#serializermethodfield)
     # and define a function that returns the serialized replies (get_replies)
     replies = serializers.SerializerMethodField()
+    # ADDITION: the (approximate) number of likes and retweets of the tweet (see counters.py)
+    likes = serializers.SerializerMethodField()
+    retweets = serializers.SerializerMethodField()
 
     class Meta:
         model = Tweet
         # ADDITION: add all fields to the serializer, you can use the "__all__" shortcut and set
         # fields = "__all__"
-        fields = "__all__"
+        # ADDITION: all the fields but deleted_at (the deleted tweets are never shown), i.e. exclude = ["deleted_at"]
+        exclude = ["deleted_at"]
         # ADDITION: make the "user" and "uploaded_at" fields read only by adding them to the "read_only_fields" list
         # by setting read_only_fields = ["user", "uploaded_at"]
         read_only_fields = ["user", "uploaded_at"]
 
+    def to_representation(self, instance):
+        # we time the serialization of tweets for the request instrumentation (see dwitter/apps/monitoring/middleware.py)
+        # nested serializations (replies) are counted as part of their root tweet
+        with timed("serialize"):
+            return super().to_representation(instance)
+
     def get_replies(self, tweet):
         # the tweet argument would be the tweet object that is being serialized
         # we use the "tweet.replies" attribute to get all replies to the tweet
@@ -41,3 +53,166 @@ class TweetViewSerializer(serializers.ModelSerializer):
         # we use the "many=True" argument to tell the serializer that we are serializing a list of objects
         # and not a single object
         return TweetViewSerializer(tweet.replies, many=True).data
+
+    def get_counts(self, tweet):
+        # (read once for both fields)
+        if not hasattr(tweet, "_counts"):
+            tweet._counts = counters.counts([tweet.id])[tweet.id]
+        return tweet._counts
+
+    def get_likes(self, tweet):
+        return self.get_counts(tweet)["likes"]
+
+    def get_retweets(self, tweet):
+        return self.get_counts(tweet)["retweets"]
+
+
+# The TweetViewSerializer creates a model instance for every tweet (and its user), and runs the to_representation
+# of every one of its fields, for every tweet in the reply tree. This is slow for large threads,
+# so for reading tweets (list/retrieve in the TweetsAPIViewSet) we use the following read-only serializer instead.
+# It works on plain rows (dicts from queryset.values(), see https://docs.djangoproject.com/en/4.1/ref/models/querysets/#values)
+# that are joined with the user, fetches the replies level by level (see threads.py), and builds the
+# output dicts straight from the rows. Its output is the same as the TweetViewSerializer's.
+# see https://www.django-rest-framework.org/api-guide/serializers/#baseserializer for more info on BaseSerializer
+
+# Clients can ask for less than the whole tweets (see read_options below and the TweetsAPIViewSet):
+# only some of the fields (?fields=id,text), and only part of the reply trees (?expand=replies&depth=1&replies_limit=3).
+# Only what's needed for the requested fields is read from the database (e.g. the user is not joined if it's not requested)
+
+# the fields of the output, in the same order as the TweetViewSerializer's fields
+FIELDS = ("id", "user", "replies", "likes", "retweets", "text", "uploaded_at", "created_at", "edited_at", "reply_to")
+
+# the values (see queryset.values()) needed for each field
+FIELD_VALUES = {
+    "id": ("id",),
+    "user": threads.USER_FIELDS,
+    "replies": ("reply_to_id",),
+    "likes": (),  # (the counts are read apart, see build_threads)
+    "retweets": (),
+    "text": ("text",),
+    "uploaded_at": ("uploaded_at",),
+    "created_at": ("created_at",),
+    "edited_at": ("edited_at",),
+    "reply_to": ("reply_to_id",),
+}
+
+# we use the same field as the TweetViewSerializer to format the dates (so that the output is the same)
+_uploaded_at_field = serializers.DateTimeField()
+
+# how each field is represented, from a row
+FIELD_REPRESENTATIONS = {
+    "id": lambda row: row["id"],
+    "user": lambda row: {
+        "username": row["user__username"],
+        "first_name": row["user__first_name"],
+        "last_name": row["user__last_name"],
+        "email": row["user__email"],
+    },
+    "replies": lambda row: [],  # filled in by build_threads
+    "likes": lambda row: 0,  # filled in by build_threads (from the counters, see counters.py)
+    "retweets": lambda row: 0,
+    "text": lambda row: row["text"],
+    "uploaded_at": lambda row: _uploaded_at_field.to_representation(row["uploaded_at"]),
+    "created_at": lambda row: _uploaded_at_field.to_representation(row["created_at"]),
+    "edited_at": lambda row: row["edited_at"] and _uploaded_at_field.to_representation(row["edited_at"]),
+    "reply_to": lambda row: row["reply_to_id"],
+}
+
+
+def read_values(fields=FIELDS):
+    """
+    The values that should be read (with queryset.values(*read_values(fields))) for the rows passed to TweetReadSerializer.
+    """
+    values = ["id"]  # the id is always needed, to attach the replies to their tweets
+    for field in fields:
+        values.extend(value for value in FIELD_VALUES[field] if value not in values)
+    return tuple(values)
+
+
+# everything, i.e. what the TweetViewSerializer outputs
+READ_VALUES = read_values()
+
+
+def _int_param(query_params, name, minimum):
+    value = query_params.get(name)
+    if value is None:
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        value = None
+    if value is None or value < minimum:
+        raise serializers.ValidationError({name: [_("Must be an integer greater than or equal to %d.") % minimum]})
+    return value
+
+
+def read_options(query_params, expand_replies=True):
+    """
+    Parse the ?fields=, ?expand=, ?depth= and ?replies_limit= query parameters into the context of the TweetReadSerializer.
+    Invalid parameters are reported as a validation error (400 Bad Request).
+    Without ?expand=, the replies are expanded when `expand_replies` is True (and left out otherwise).
+    """
+    fields = FIELDS
+    if query_params.get("fields"):
+        requested = {field.strip() for field in query_params["fields"].split(",") if field.strip()}
+        unknown = requested.difference(FIELDS)
+        if unknown:
+            raise serializers.ValidationError(
+                {"fields": [_("Unknown fields: %s. Available fields: %s.") % (", ".join(sorted(unknown)), ", ".join(FIELDS))]}
+            )
+        fields = tuple(field for field in FIELDS if field in requested)
+
+    depth = _int_param(query_params, "depth", 0)
+    replies_limit = _int_param(query_params, "replies_limit", 1)
+    if "expand" in query_params or not expand_replies:
+        expand = {name.strip() for name in query_params.get("expand", "").split(",") if name.strip()}
+        if expand.difference({"replies"}):
+            raise serializers.ValidationError({"expand": [_("Only the replies can be expanded.")]})
+        if not expand:
+            # ?expand= (nothing expanded) leaves the replies out
+            if depth is not None or replies_limit is not None:
+                raise serializers.ValidationError({"expand": [_("depth and replies_limit need expand=replies.")]})
+            fields = tuple(field for field in fields if field != "replies")
+    return {"fields": fields, "depth": depth, "replies_limit": replies_limit}
+
+
+def tweet_representation(row, fields=FIELDS):
+    return {field: FIELD_REPRESENTATIONS[field](row) for field in fields}
+
+
+def build_threads(rows, fields=FIELDS, depth=None, replies_limit=None):
+    """
+    Represent the tweets (rows) with their reply trees, down to `depth` levels of replies
+    (the whole trees when depth is None) and with at most `replies_limit` replies per tweet.
+    """
+    tweets = [tweet_representation(row, fields) for row in rows]
+    by_id = {row["id"]: tweet for row, tweet in zip(rows, tweets)}
+    if "replies" in fields and depth != 0:
+        for level, replies in threads.fetch_replies(list(by_id), read_values(fields), max_depth=depth, limit=replies_limit):
+            for row in replies:
+                reply = by_id[row["id"]] = tweet_representation(row, fields)
+                by_id[row["reply_to_id"]]["replies"].append(reply)
+    # the counts of all the tweets (and replies) are read together
+    fill_counts(by_id, fields)
+    return tweets
+
+
+def fill_counts(tweets_by_id, fields):
+    counters.fill(tweets_by_id, [kind for kind in counters.KINDS if kind in fields])
+
+
+class TweetReadListSerializer(serializers.ListSerializer):
+    # when many=True, the replies of all the tweets are fetched together
+    def to_representation(self, data):
+        with timed("serialize"):
+            return build_threads(data, **self.context.get("read_options", {}))
+
+
+class TweetReadSerializer(serializers.BaseSerializer):
+    # the context can have "read_options" (see read_options above), the rows must have been read with the matching values
+    class Meta:
+        list_serializer_class = TweetReadListSerializer
+
+    def to_representation(self, row):
+        with timed("serialize"):
+            return build_threads([row], **self.context.get("read_options", {}))[0]
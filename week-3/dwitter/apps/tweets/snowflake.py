@@ -0,0 +1,133 @@
+"""
+Time ordered 64-bit ids for the tweets ("snowflake" ids, see https://en.wikipedia.org/wiki/Snowflake_ID).
+
+The database hands out auto-increment ids on insert, one database at a time: the id of a tweet isn't known before it is
+inserted, and two databases (e.g. shards, or an archive of old tweets) hand out the same ids. A snowflake id is made of
+
+    | 41 bits: milliseconds since EPOCH | 10 bits: worker id | 12 bits: sequence number |
+
+so every worker mints its own ids (up to 4096 per millisecond), without asking the database, and the ids are ordered
+(roughly) by the time they were minted: sorting the tweets by id sorts them by creation time.
+
+They are used for new tweets when TWEET_SNOWFLAKE_IDS is True (see Tweet.save and settings.py). The ids of the existing
+tweets are much smaller than the snowflake ids, so they keep their order.
+
+Every process that mints ids needs a worker id of its own, or two processes mint the same ids. The forked workers of a
+server (gunicorn, uwsgi) all inherit the same environment, so SNOWFLAKE_WORKER_ID is only the first of the
+SNOWFLAKE_WORKER_SLOTS worker ids of a machine: every process claims the first of them that no other process of the
+machine holds, by locking a file per worker id in SNOWFLAKE_LOCK_DIR (see claim_worker_id(), the system releases the
+lock when the process exits). Every machine needs its own range of worker ids. When SNOWFLAKE_WORKER_ID isn't set, or
+all the worker ids are taken, minting an id fails (ImproperlyConfigured) instead of risking duplicate ids.
+
+Note that the ids don't fit in a javascript number (53 bits) without losing precision.
+"""
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import fcntl
+except ImportError:  # (windows)
+    fcntl = None
+
+EPOCH = 1577836800000  # 2020-01-01T00:00:00Z, in milliseconds
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+
+class SnowflakeGenerator:
+    """
+    Mints increasing ids (also when the clock goes back), safe to use from several threads.
+    """
+
+    def __init__(self, worker_id):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"the worker id must be between 0 and {MAX_WORKER_ID}, not {worker_id}")
+        self.worker_id = worker_id
+        self._lock = threading.Lock()
+        self._last = -1  # the timestamp of the last id
+        self._sequence = 0
+
+    def next_id(self):
+        with self._lock:
+            # (never before the last id, if the clock went back we keep counting from the last timestamp)
+            now = max(time.time_ns() // 1_000_000 - EPOCH, self._last)
+            if now == self._last:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    # all the ids of this millisecond were minted, take the next millisecond's (instead of waiting for it)
+                    now += 1
+            else:
+                self._sequence = 0
+            self._last = now
+            return (now << (WORKER_BITS + SEQUENCE_BITS)) | (self.worker_id << SEQUENCE_BITS) | self._sequence
+
+
+def timestamp(snowflake_id):
+    """
+    When the id was minted (seconds since the unix epoch, like time.time()).
+    """
+    return ((snowflake_id >> (WORKER_BITS + SEQUENCE_BITS)) + EPOCH) / 1000
+
+
+def claim_worker_id():
+    """
+    Claim a worker id for this process (see the docstring), return it and the locked file, which must stay open.
+    """
+    first, slots = settings.SNOWFLAKE_WORKER_ID, settings.SNOWFLAKE_WORKER_SLOTS
+    if first is None:
+        raise ImproperlyConfigured("TWEET_SNOWFLAKE_IDS needs a SNOWFLAKE_WORKER_ID (a different range on every machine)")
+    if not 0 <= first <= first + slots - 1 <= MAX_WORKER_ID:
+        raise ImproperlyConfigured(
+            f"the snowflake worker ids must be between 0 and {MAX_WORKER_ID}, "
+            f"not {first} to {first + slots - 1} (SNOWFLAKE_WORKER_ID, SNOWFLAKE_WORKER_SLOTS)"
+        )
+    if fcntl is None:
+        raise ImproperlyConfigured("claiming a snowflake worker id needs fcntl, which isn't available on this platform")
+    for worker_id in range(first, first + slots):
+        lock_file = open(os.path.join(settings.SNOWFLAKE_LOCK_DIR, f"dwitter-snowflake-{worker_id}.lock"), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:  # (held by another process)
+            lock_file.close()
+            continue
+        return worker_id, lock_file
+    raise ImproperlyConfigured(
+        f"the snowflake worker ids {first} to {first + slots - 1} are all taken by other processes of this machine, "
+        "raise SNOWFLAKE_WORKER_SLOTS to the number of processes that mint ids"
+    )
+
+
+_generator = None
+_generator_lock = threading.Lock()
+_lock_file = None  # (the file locked by the worker id of this process)
+
+
+def next_id():
+    """
+    A new id, from the generator of this process.
+    """
+    global _generator, _lock_file
+    if _generator is None:
+        with _generator_lock:
+            if _generator is None:
+                worker_id, _lock_file = claim_worker_id()
+                _generator = SnowflakeGenerator(worker_id)
+    return _generator.next_id()
+
+
+def _forget_generator():
+    # a forked worker (e.g. gunicorn with --preload) gets a generator of its own, with its own worker id
+    # (its copy of the parent's locked file is closed, the parent keeps its worker id)
+    global _generator, _generator_lock, _lock_file
+    if _lock_file is not None:
+        _lock_file.close()
+    _generator, _generator_lock, _lock_file = None, threading.Lock(), None
+
+
+os.register_at_fork(after_in_child=_forget_generator)
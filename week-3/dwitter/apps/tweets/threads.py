@@ -0,0 +1,227 @@
+"""
+Fetching reply trees (threads) without creating model instances.
+
+Instead of following `tweet.replies` for every tweet (one query per tweet), the replies are fetched level by level:
+one query for the direct replies of all the tweets of a level, then one query for the replies of those replies, and so on.
+The rows are plain dicts (see https://docs.djangoproject.com/en/4.1/ref/models/querysets/#values).
+"""
+from django.db import connections
+from django.db.models import Count, F, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from .models import Tweet
+from . import counters
+from . import keyset
+
+# the fields we read for every tweet, the user's fields are read with a join
+TWEET_FIELDS = ("id", "text", "created_at", "reply_to_id")
+USER_FIELDS = ("user__username", "user__first_name", "user__last_name", "user__email")
+
+# the databases on which the ancestors of a tweet are found with a recursive query (`WITH RECURSIVE`, which
+# oracle spells differently), on the others fetch_ancestors walks up the thread with one query per level
+RECURSIVE_VENDORS = ("sqlite", "postgresql", "mysql")
+
+# the number of ids in a single `IN (...)` lookup (sqlite limits the number of parameters in a query)
+CHUNK_SIZE = 500
+
+
+def chunks(ids, size=CHUNK_SIZE):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start : start + size]
+
+
+def fetch_replies(parent_ids, fields=TWEET_FIELDS + USER_FIELDS, queryset=None, max_depth=None, limit=None):
+    """
+    Yield (depth, rows) for every level of replies below the given tweets: depth 1 are the direct replies
+    of `parent_ids`, depth 2 their replies, and so on. The rows of a level are ordered by (created_at, id), the order
+    in which the replies were posted (like the pages of the replies, see keyset.py: the ids are not always in that order,
+    e.g. the snowflake ids of several workers).
+    Levels deeper than `max_depth` are not fetched, and when `limit` is given only the first `limit` replies
+    of every tweet are fetched (add "siblings" to the fields to get the number of replies of their parent).
+    """
+    queryset = Tweet.objects.all() if queryset is None else queryset
+    fields = tuple(fields) if "reply_to_id" in fields else tuple(fields) + ("reply_to_id",)
+    if limit is not None:
+        # number the replies of every tweet (in the order they were posted, by (created_at, id)) and only keep the first
+        # `limit` ones,
+        # so the database never sends us the rest of them (filtering on window functions needs django 4.2+)
+        # see https://docs.djangoproject.com/en/4.2/ref/models/expressions/#window-functions
+        queryset = queryset.annotate(
+            position=Window(RowNumber(), partition_by=[F("reply_to_id")], order_by=[F("created_at").asc(), F("id").asc()])
+        )
+        if "siblings" in fields:
+            # the number of replies of the parent, counted before the filter (to tell whether some were left out)
+            queryset = queryset.annotate(siblings=Window(Count("id"), partition_by=[F("reply_to_id")]))
+        queryset = queryset.filter(position__lte=limit)
+    depth = 0
+    while parent_ids and (max_depth is None or depth < max_depth):
+        depth += 1
+        rows = []
+        for chunk in chunks(parent_ids):
+            rows.extend(queryset.filter(reply_to_id__in=chunk).order_by("created_at", "id").values(*fields))
+        if not rows:
+            return
+        yield depth, rows
+        parent_ids = [row["id"] for row in rows]
+
+
+def flatten_thread(tweet_id):
+    """
+    Return the [(id, depth)] of a tweet (depth 0) and all of its replies, in the order of the conversation:
+    every reply comes right after the tweet it replies to (and that tweet's earlier replies, and their replies...),
+    the replies of a tweet are ordered by (created_at, id). Only the ids are read (one query per level).
+    """
+    children = {}
+    for depth, rows in fetch_replies([tweet_id], ("id", "reply_to_id", "created_at")):
+        for row in rows:
+            children.setdefault(row["reply_to_id"], []).append((row["created_at"], row["id"]))
+    flat = []
+    stack = [(tweet_id, 0)]  # (an explicit stack, the threads can be deeper than python's recursion limit)
+    while stack:
+        tweet_id, depth = stack.pop()
+        flat.append((tweet_id, depth))
+        stack.extend((reply_id, depth + 1) for created_at, reply_id in sorted(children.get(tweet_id, ()), reverse=True))
+    return flat
+
+
+def ancestors_query(tweet_ids, using):
+    """
+    The ids of the tweets and all of their ancestors (the tweet they reply to, the tweet that one replies to, ...),
+    as a recursive common table expression (see https://www.sqlite.org/lang_with.html#recursive_common_table_expressions).
+    The ancestors that the tweets share are only read once.
+    """
+    quote = connections[using].ops.quote_name
+    table, reply_to = quote(Tweet._meta.db_table), quote(Tweet._meta.get_field("reply_to").column)
+    # (UNION rather than UNION ALL: a row that was already found is not followed again)
+    sql = (
+        f"WITH RECURSIVE ancestors(id, parent_id) AS ("
+        f"SELECT id, {reply_to} FROM {table} WHERE id IN ({', '.join(['%s'] * len(tweet_ids))}) "
+        f"UNION SELECT tweet.id, tweet.{reply_to} FROM {table} tweet INNER JOIN ancestors ON tweet.id = ancestors.parent_id"
+        f") SELECT id FROM ancestors"
+    )
+    return RawSQL(sql, tuple(tweet_ids))
+
+
+def fetch_ancestors(tweet_id, fields=TWEET_FIELDS + USER_FIELDS, queryset=None):
+    """
+    Return the rows of a tweet's ancestors, from the root of its thread down to the tweet itself (the last row),
+    or an empty list when the tweet doesn't exist.
+    The whole chain (with the users' fields, joined) is read with one query, whatever its length. A deleted ancestor
+    cuts the chain (the rows above it are left out).
+    """
+    queryset = Tweet.objects.all() if queryset is None else queryset
+    fields = tuple(fields) if "reply_to_id" in fields else tuple(fields) + ("reply_to_id",)
+    # (the raw query's parameters are not range checked like the ORM's lookups, and an id out of the range of the ids
+    # can't be a tweet's: the database would fail to bind it, e.g. SQLite's integers are 64-bit)
+    low, high = connections[queryset.db].ops.integer_field_range(Tweet._meta.pk.get_internal_type())
+    if (low is not None and tweet_id < low) or (high is not None and tweet_id > high):
+        return []
+    if connections[queryset.db].vendor in RECURSIVE_VENDORS:
+        rows = queryset.filter(id__in=ancestors_query([tweet_id], queryset.db)).values(*fields)
+        by_id = {row["id"]: row for row in rows}
+    else:
+        by_id, parent_id = {}, tweet_id
+        while parent_id is not None and parent_id not in by_id:
+            row = queryset.filter(id=parent_id).values(*fields).first()
+            if row is None:
+                break
+            by_id[parent_id], parent_id = row, row["reply_to_id"]
+    # the rows come in no particular order, follow the chain up from the tweet
+    chain, row = [], by_id.get(tweet_id)
+    while row is not None and len(chain) < len(by_id):  # (each row at most once, should reply_to ever loop)
+        chain.append(row)
+        row = by_id.get(row["reply_to_id"])
+    chain.reverse()
+    return chain
+
+
+def is_visible(tweet_id):
+    """
+    Whether the tweet exists and is shown: neither the tweet nor any of the tweets above it is deleted. (The replies of a
+    deleted tweet are only marked as deleted later, by the purge, see purging.py, until then this hides them.)
+    The chain is read with one query (see fetch_ancestors), which stops at the first deleted tweet above this one.
+    """
+    chain = fetch_ancestors(tweet_id, ("id",))
+    return bool(chain) and chain[0]["reply_to_id"] is None
+
+
+def fetch_roots(tweet_ids, queryset=None):
+    """
+    Return the {id: id of the root of its thread} of the tweets (a tweet that is not a reply is its own root).
+    The ancestors of the tweets are read with one query per chunk of ids (see ancestors_query), or one query per level
+    on the databases without recursive queries. The deleted tweets are followed too.
+    """
+    queryset = Tweet.all_objects.all() if queryset is None else queryset
+    parents = {}  # {id: reply_to_id} of the tweets and their ancestors
+    for chunk in chunks(tweet_ids):
+        if connections[queryset.db].vendor in RECURSIVE_VENDORS:
+            parents.update(queryset.filter(id__in=ancestors_query(chunk, queryset.db)).values_list("id", "reply_to_id"))
+            continue
+        while chunk:
+            rows = {}
+            for ids in chunks(chunk):
+                rows.update(queryset.filter(id__in=ids).values_list("id", "reply_to_id"))
+            parents.update(rows)
+            chunk = [parent_id for parent_id in set(rows.values()) if parent_id is not None and parent_id not in parents]
+    roots = {}
+    for tweet_id in tweet_ids:
+        path = []  # the tweets on the way up to the root (or to a tweet whose root we already know)
+        while tweet_id not in roots and parents.get(tweet_id) is not None and len(path) <= len(parents):
+            path.append(tweet_id)
+            tweet_id = parents[tweet_id]
+        root = roots.get(tweet_id, tweet_id)
+        for ancestor_id in path + [tweet_id]:
+            roots[ancestor_id] = root
+    return {tweet_id: roots[tweet_id] for tweet_id in tweet_ids}
+
+
+def thread_node(row):
+    """
+    A tweet of a thread, as rendered by rendering.py (from a row with the TWEET_FIELDS and USER_FIELDS).
+    """
+    return {
+        "id": row["id"],
+        "text": row["text"],
+        "created_at": row["created_at"],
+        "user": {
+            "username": row["user__username"],
+            "first_name": row["user__first_name"],
+            "last_name": row["user__last_name"],
+        },
+        # the (approximate) number of likes and retweets, see counters.py
+        "likes": 0,
+        "retweets": 0,
+        "replies": [],
+        # when some replies are not shown: the cursor after which the next replies start ("" for all of them), else None
+        "more_replies": None,
+    }
+
+
+def build_html_threads(rows, max_depth, max_replies):
+    """
+    Build the threads of the tweets (rows) for the html pages: at most `max_depth` levels of replies,
+    and at most `max_replies` replies per tweet. The tweets with replies left out get a "more_replies"
+    (see thread_node), from which the next replies are loaded on demand (see TweetRepliesView in views.py).
+    """
+    nodes = [thread_node(row) for row in rows]
+    by_id = {node["id"]: node for node in nodes}
+    deepest, last_level = 0, nodes
+    fields = TWEET_FIELDS + USER_FIELDS + ("siblings",)
+    for depth, replies in fetch_replies(list(by_id), fields, max_depth=max_depth, limit=max_replies):
+        deepest, last_level = depth, []
+        for row in replies:
+            node, parent = thread_node(row), by_id[row["reply_to_id"]]
+            parent["replies"].append(node)
+            if row["siblings"] > max_replies:
+                # the position of the last reply shown (the rows are ordered by (created_at, id), like the pages of replies)
+                parent["more_replies"] = keyset.encode_cursor(row)
+            by_id[node["id"]] = node
+            last_level.append(node)
+    if deepest == max_depth and last_level:
+        # the replies of the deepest tweets were not fetched, find out which of them have some (with one query per chunk)
+        for chunk in chunks(node["id"] for node in last_level):
+            for parent_id in Tweet.objects.filter(reply_to_id__in=chunk).values_list("reply_to_id", flat=True).distinct():
+                by_id[parent_id]["more_replies"] = ""
+    counters.fill(by_id)  # (the counts of all the tweets of the page, together)
+    return nodes
@@ -0,0 +1,171 @@
+"""
+Token bucket throttles for the write paths (posting tweets with the API or the tweet form).
+
+Every user has a bucket of tokens (e.g. "30/min": up to 30 tokens, refilled at 30 tokens per minute), and posting
+a tweet takes a token; when the bucket is empty the request is rejected with `429 Too Many Requests` and a `Retry-After`
+header telling the client when the next token will be there. A global bucket (shared by all the users) protects
+the database from many users writing at once. See https://en.wikipedia.org/wiki/Token_bucket
+
+The throttles adapt to the load: when the writes start piling up (see WriteLoad.pressure in monitoring/shedding.py,
+which the LoadSheddingMiddleware measures), the buckets are refilled more slowly, down to WRITE_THROTTLE_MIN_FACTOR
+times their rate when the app is about to shed writes, so the heaviest writers are slowed down first and the app rarely
+has to turn everyone away. Bursts (the capacity of the buckets) are not changed.
+
+The buckets live in the memory of the process (a dict behind a lock, so taking a token costs a few microseconds
+and no database or cache round trip). With several worker processes, every process has its own buckets.
+
+The rates are set in the WRITE_THROTTLE_RATES setting, see settings.py.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from rest_framework import throttling
+
+from ..monitoring import metrics
+from ..monitoring.shedding import WRITE_LOAD
+
+# the load pressure (see WriteLoad.pressure) under which the buckets are refilled at their full rate, above it the rate
+# goes down linearly, to WRITE_THROTTLE_MIN_FACTOR times the rate at a pressure of 1 (where the writes are shed)
+FULL_RATE_PRESSURE = 0.5
+
+# the durations that can be used in rates (e.g. "30/min", "5/s")
+PERIODS = {"s": 1, "sec": 1, "m": 60, "min": 60, "h": 3600, "hour": 3600, "d": 86400, "day": 86400}
+
+
+def parse_rate(rate):
+    """
+    Parse a rate like "30/min" into (number of requests, period in seconds), None means no limit.
+    """
+    if rate is None:
+        return None
+    count, period = rate.split("/")
+    return int(count), PERIODS[period]
+
+
+class TokenBuckets:
+    """
+    A token bucket per key, all with the same capacity and refill rate.
+    """
+
+    def __init__(self, count, period, max_keys=10000):
+        self.capacity = count
+        self.refill_rate = count / period  # tokens per second
+        self.max_keys = max_keys
+        # key -> (tokens, time of the last update)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, now=None, factor=1.0):
+        """
+        Take a token from the bucket of `key`: return 0 if there was one, else the seconds until there will be one.
+        The bucket is refilled at `factor` times its rate (since its last update).
+        """
+        now = time.monotonic() if now is None else now
+        refill_rate = self.refill_rate * factor
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * refill_rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1 - tokens) / refill_rate
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+        return wait
+
+    def give_back(self, key):
+        # return a token that was taken for a request that was rejected by another bucket
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.capacity, time.monotonic()))
+            self._buckets[key] = (min(self.capacity, tokens + 1), updated)
+
+    def _prune(self, now):
+        # forget the buckets that are full again (a missing bucket is a full bucket)
+        for key, (tokens, updated) in list(self._buckets.items()):
+            if tokens + (now - updated) * self.refill_rate >= self.capacity:
+                del self._buckets[key]
+
+
+# scope -> (rate, buckets), the buckets are created on first use (and again if the rate setting changes)
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def buckets(scope):
+    """
+    The buckets of a scope ("user" or "global") in WRITE_THROTTLE_RATES, or None if the scope is not throttled.
+    """
+    rate = getattr(settings, "WRITE_THROTTLE_RATES", {}).get(scope)
+    cached = _buckets.get(scope)
+    if cached is None or cached[0] != rate:
+        parsed = parse_rate(rate)
+        with _buckets_lock:
+            cached = _buckets[scope] = (rate, TokenBuckets(*parsed) if parsed else None)
+    return cached[1]
+
+
+def refill_factor():
+    """
+    The factor of the refill rates of the buckets under the current load (1 when the app is healthy), see the docstring.
+    """
+    pressure = WRITE_LOAD.pressure(
+        getattr(settings, "LOAD_SHEDDING_MAX_WRITES_IN_FLIGHT", None), getattr(settings, "LOAD_SHEDDING_MAX_WRITE_P99", None)
+    )
+    if pressure <= FULL_RATE_PRESSURE:
+        return 1.0
+    min_factor = getattr(settings, "WRITE_THROTTLE_MIN_FACTOR", 1.0)
+    slowdown = min(1.0, (pressure - FULL_RATE_PRESSURE) / (1 - FULL_RATE_PRESSURE))
+    return 1.0 - slowdown * (1.0 - min_factor)
+
+
+def user_key(request):
+    # authenticated users have their own bucket, anonymous clients are throttled by ip address
+    if request.user and request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    return f"ip:{request.META.get('REMOTE_ADDR')}"
+
+
+def take_write_token(request):
+    """
+    Take a token for a write from the user's bucket and the global bucket.
+    Return 0 if the write is allowed, else the seconds the client should wait before retrying.
+    """
+    user_buckets, global_buckets = buckets("user"), buckets("global")
+    key = user_key(request)
+    factor = refill_factor()
+    if user_buckets is not None:
+        wait = user_buckets.take(key, factor=factor)
+        if wait:
+            metrics.throttled_requests.inc("user")
+            return wait
+    if global_buckets is not None:
+        wait = global_buckets.take("global", factor=factor)
+        if wait:
+            if user_buckets is not None:
+                user_buckets.give_back(key)
+            metrics.throttled_requests.inc("global")
+            return wait
+    return 0.0
+
+
+def retry_after(wait):
+    # Retry-After is a whole number of seconds (see https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Retry-After)
+    return str(max(1, math.ceil(wait)))
+
+
+class WriteThrottle(throttling.BaseThrottle):
+    """
+    Rest framework throttle for the write actions (see https://www.django-rest-framework.org/api-guide/throttling/#custom-throttles),
+    rest framework responds with 429 and a Retry-After header when the throttle doesn't allow the request.
+    """
+
+    def allow_request(self, request, view):
+        self._wait = take_write_token(request)
+        return not self._wait
+
+    def wait(self):
+        return math.ceil(self._wait)
@@ -0,0 +1,158 @@
+"""
+The trending threads: the threads with the most replies lately, kept up to date incrementally.
+
+Ranking the threads on demand would count the recent replies of every thread on every request (finding the root of
+every reply on the way). Instead, the replies are counted once, as they come in:
+
+1. the tweets posted since the last update (the ones after TrendingState.last_tweet_id) are read in batches, and the
+   replies are added to the ThreadActivity of their thread's root, in buckets of TRENDING_BUCKET_MINUTES
+2. the buckets older than TRENDING_WINDOW_HOURS are dropped, and the threads are ranked by the replies of the buckets
+   of the window (older buckets count less: their weight halves every TRENDING_HALF_LIFE_HOURS)
+3. the top TRENDING_SIZE threads are written to the TrendingTweet table, which the trending API reads as it is
+
+A batch and the new position (last_tweet_id) are written in the same transaction, and a batch only counts if no other
+update counted it first, so the replies are counted once even when updates overlap (e.g. the background thread of two
+workers, or a cron job). The position assumes that the tweets are committed in id order, which the snowflake ids of
+several workers are not: the tweets are only counted once they are TWEET_COMMIT_GRACE seconds old, a tweet whose
+transaction takes longer than that to commit is never counted.
+
+The update runs with the `python manage.py update_trending` command (e.g. every minute, from cron), or with
+TRENDING_IN_BACKGROUND set to True, in a background thread of the server every TRENDING_INTERVAL seconds (which writes
+to the database alongside the requests, SQLite fails some of their writes then).
+"""
+import datetime
+import heapq
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import threads
+from .models import ThreadActivity, TrendingState, TrendingTweet, Tweet
+
+logger = logging.getLogger("dwitter.trending")
+
+
+def bucket_start(moment):
+    """
+    The start of the bucket (of TRENDING_BUCKET_MINUTES) of a moment.
+    """
+    size = settings.TRENDING_BUCKET_MINUTES * 60
+    return datetime.datetime.fromtimestamp(int(moment.timestamp()) // size * size, tz=datetime.timezone.utc)
+
+
+def window_start(now):
+    return bucket_start(now - datetime.timedelta(hours=settings.TRENDING_WINDOW_HOURS))
+
+
+def _add_activity(root_id, bucket, replies):
+    activity = ThreadActivity.objects.filter(root_id=root_id, bucket=bucket)
+    if activity.update(replies=F("replies") + replies):
+        return
+    try:
+        with transaction.atomic():
+            ThreadActivity.objects.create(root_id=root_id, bucket=bucket, replies=replies)
+    except IntegrityError:  # (created in the meantime)
+        activity.update(replies=F("replies") + replies)
+
+
+def count_batch(batch_size, now):
+    """
+    Count the replies of the next `batch_size` new tweets, return the number of tweets read (0 when there are no new ones).
+    """
+    state, _ = TrendingState.objects.get_or_create(pk=1)
+    # (only the tweets whose transactions are surely committed, see TweetManager.settled_after)
+    rows = Tweet.objects.settled_after(state.last_tweet_id, ("id", "reply_to_id"), batch_size, now)
+    if not rows:
+        return 0
+    start = window_start(now)
+    replies = [(tweet_id, created_at) for tweet_id, reply_to_id, created_at in rows if reply_to_id is not None]
+    replies = [(tweet_id, created_at) for tweet_id, created_at in replies if created_at >= start]
+    roots = threads.fetch_roots([tweet_id for tweet_id, created_at in replies])
+    activity = Counter((roots[tweet_id], bucket_start(created_at)) for tweet_id, created_at in replies)
+    with transaction.atomic():
+        # move the position forward, unless another update already did (it counted these tweets)
+        moved = TrendingState.objects.filter(pk=1, last_tweet_id=state.last_tweet_id).update(last_tweet_id=rows[-1][0])
+        if not moved:
+            return 0
+        for (root_id, bucket), count in activity.items():
+            _add_activity(root_id, bucket, count)
+    return len(rows)
+
+
+def rank(now):
+    """
+    Drop the buckets that left the window, rank the threads and write the top TRENDING_SIZE ones.
+    """
+    start = window_start(now)
+    ThreadActivity.objects.filter(bucket__lt=start).delete()
+    scores, replies = defaultdict(float), Counter()
+    for root_id, bucket, count in ThreadActivity.objects.filter(bucket__gte=start).values_list("root_id", "bucket", "replies"):
+        age = max((now - bucket).total_seconds(), 0) / 3600
+        scores[root_id] += count * 0.5 ** (age / settings.TRENDING_HALF_LIFE_HOURS)
+        replies[root_id] += count
+    top = heapq.nlargest(settings.TRENDING_SIZE, scores.items(), key=lambda item: (item[1], item[0]))
+    with transaction.atomic():
+        TrendingTweet.objects.all().delete()
+        TrendingTweet.objects.bulk_create(
+            TrendingTweet(rank=rank, tweet_id=root_id, score=round(score, 3), replies=replies[root_id])
+            for rank, (root_id, score) in enumerate(top, start=1)
+        )
+        TrendingState.objects.filter(pk=1).update(updated_at=now)
+    return len(top)
+
+
+def update(batch_size=None, log=None):
+    """
+    Count the replies of the new tweets and rank the threads again (see the module's docstring).
+    """
+    batch_size = batch_size or settings.TRENDING_BATCH_SIZE
+    now = timezone.now()
+    counted = 0
+    while True:
+        done = count_batch(batch_size, now)
+        if not done:
+            break
+        counted += done
+        if log:
+            log(f"{counted} new tweets counted")
+    ranked = rank(now)
+    if log:
+        log(f"{ranked} trending threads")
+    return counted
+
+
+# the background updates: a single daemon thread per process, started by schedule()
+_thread = None
+_lock = threading.Lock()
+
+
+def _run():
+    while True:
+        try:
+            update()
+        except Exception:  # the thread must survive errors (e.g. the database being locked), the next update retries
+            logger.exception("updating the trending threads failed")
+        finally:
+            # the thread has its own database connection, which must not stay open between updates
+            connection.close()
+        time.sleep(settings.TRENDING_INTERVAL)
+
+
+def schedule():
+    """
+    Keep the trending threads up to date in the background (does nothing unless TRENDING_IN_BACKGROUND is True,
+    by default the update_trending command has to be run, e.g. by cron).
+    """
+    global _thread
+    if not settings.TRENDING_IN_BACKGROUND or _thread is not None:
+        return
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_run, name="dwitter-trending", daemon=True)
+            _thread.start()
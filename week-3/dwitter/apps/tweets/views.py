@@ -48,8 +48,19 @@ from django.urls import reverse_lazy
 # The index template is already implemented for you (in templates/index.html), you just need to pass the tweets and the form to the template
 from django.views.generic import ListView  # We use the ListView generic view to render a list of objects
 from django.views.generic.edit import FormView  # We use the FormView generic view to render a form
+from django.views.generic import TemplateView  # for the html fragments (e.g. more replies)
+from django.conf import settings
+from django.http import Http404
 from .models import Tweet  # We import the Tweet model
 from .forms import TweetForm  # We import the TweetForm form
+from . import throttling  # token bucket throttles for posting tweets
+from . import threads  # the reply trees of the tweets
+from . import rendering  # renders the reply trees to html
+from . import keyset  # keyset pagination (newest first) for the timelines of the users
+from . import counters  # the counts of likes and retweets
+from . import trending  # the trending threads, updated in the background
+from ..notifications import inbox  # the notifications of the replies, delivered in the background
+from django.contrib.auth import get_user_model
 from django.shortcuts import (
     get_object_or_404,
 )  # We use this function to get a tweet object from the database, or return a 404 error if the tweet does not exist
@@ -80,7 +91,9 @@ class TweetsListView(ListView):
     # (e.g. ordering = ["-uploaded_at", "+id"] will sort by uploaded_at first (descending), and if there are multiple tweets with the same uploaded_at, it will sort by id (ascending))
     # see https://docs.djangoproject.com/en/4.1/ref/models/querysets/#django.db.models.query.QuerySet.order_by for more details
     # ADDITION: order by uploaded_at in a descending order
-    ordering = ["-uploaded_at"]
+    # ADDITION: uploaded_at changes when a tweet is edited, so the tweets are ordered by created_at (which never changes)
+    # and then by id, so that tweets created at the same time are always in the same order (see tweets_roots_idx in models.py)
+    ordering = ["-created_at", "-id"]
 
     # not to clutter up the response, we only return a limited number of tweets in each response
     # in order to do this, we use "pagination" (see https://docs.djangoproject.com/en/4.1/topics/pagination/)
@@ -91,7 +104,81 @@ class TweetsListView(ListView):
     # override queryset to filter out tweets that are replies
     def get_queryset(self):
         # ADDITION: filter out the original queryset results to only return tweets that are not replies (i.e. tweets with reply_to=None)
-        return super().get_queryset().filter(reply_to=None)
+        # the tweets are read as plain rows (with their user's fields), their threads are built in get_context_data
+        return super().get_queryset().filter(reply_to=None).values(*threads.TWEET_FIELDS, *threads.USER_FIELDS)
+
+    # ADDITION: rendering every reply of every thread makes the page as large as the largest thread, so only the first
+    # THREAD_MAX_REPLIES replies of every tweet, THREAD_MAX_DEPTH levels deep, are rendered (see build_html_threads in threads.py)
+    # the rest are loaded on demand, with the "load more replies" links (see TweetRepliesView below)
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # the threads are rendered by the renderer in rendering.py (much faster than including a template for every reply)
+        context["tweets"] = rendering.render_threads(
+            threads.build_html_threads(context["tweets"], settings.THREAD_MAX_DEPTH, settings.THREAD_MAX_REPLIES)
+        )
+        return context
+
+
+# ADDITION: the "load more replies" links of the threads load the next replies of a tweet from this view
+# it renders a slice of replies (THREAD_MAX_REPLIES replies after the `cursor`, with their own threads), the replies are
+# paged through by (created_at, id) with keyset pagination (see keyset.py), in the order of the threads (see threads.py)
+# as a fragment of html (see tweet_replies.html), which replaces the link in the page
+@method_decorator(login_required(login_url=reverse_lazy("login")), name="dispatch")
+class TweetRepliesView(TemplateView):
+    template_name = "tweet_replies.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        position = None
+        if self.request.GET.get("cursor"):
+            try:
+                position = keyset.decode_cursor(self.request.GET["cursor"])
+            except ValueError:
+                raise Http404("Invalid cursor.")
+        # (a reply is hidden while a tweet above it is deleted, until the purge marks it deleted too, see threads.is_visible)
+        if not threads.is_visible(self.kwargs["pk"]):
+            raise Http404("No tweet matches the given query.")
+        tweet = {"id": self.kwargs["pk"]}
+        max_replies = settings.THREAD_MAX_REPLIES
+        queryset = Tweet.objects.filter(reply_to_id=tweet["id"]).values(*threads.TWEET_FIELDS, *threads.USER_FIELDS)
+        rows, last = keyset.page(queryset, position, max_replies)
+        context["replies"] = rendering.render_threads(
+            threads.build_html_threads(rows, settings.THREAD_MAX_DEPTH, max_replies)
+        )
+        if last is not None:
+            context["load_replies"] = rendering.render_load_replies(tweet["id"], keyset.encode_cursor(last))
+        return context
+
+
+# ADDITION: the profile page of a user, with their tweets (newest first, with their threads like on the home page)
+# it reads the tweets with the same query as the API's accounts/<username>/tweets/ (see TweetManager.posted_by in models.py)
+# and pages through them with keyset pagination (the "older tweets" link carries a cursor, see keyset.py)
+@method_decorator(login_required(login_url=reverse_lazy("login")), name="dispatch")
+class UserTweetsView(TemplateView):
+    template_name = "user_tweets.html"
+    paginate_by = 10
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        profile = get_object_or_404(
+            get_user_model().objects.values("id", "username", "first_name", "last_name"), username=self.kwargs["username"]
+        )
+        with_replies = self.request.GET.get("with_replies") == "1"
+        position = None
+        if self.request.GET.get("cursor"):
+            try:
+                position = keyset.decode_cursor(self.request.GET["cursor"])
+            except ValueError:
+                raise Http404("Invalid cursor.")
+        queryset = Tweet.objects.posted_by(profile["id"], with_replies).values(*threads.TWEET_FIELDS, *threads.USER_FIELDS)
+        rows, last = keyset.page(queryset, position, self.paginate_by, newest_first=True)
+        context["profile"] = profile
+        context["with_replies"] = with_replies
+        context["tweets"] = rendering.render_threads(
+            threads.build_html_threads(rows, settings.THREAD_MAX_DEPTH, settings.THREAD_MAX_REPLIES)
+        )
+        context["next_cursor"] = keyset.encode_cursor(last) if last is not None else None
+        return context
 
 
 class TweetCreateView(FormView):
@@ -102,6 +189,23 @@ class TweetCreateView(FormView):
     # we want to redirect the user to the index page after they submit the form
     success_url = reverse_lazy("index")
 
+    # posting tweets is shed first when the app is overloaded (see LoadSheddingMiddleware in monitoring/middleware.py)
+    shed_under_load = True
+
+    # ADDITION: throttle posting tweets (see throttling.py), the API does the same with the WriteThrottle
+    def post(self, request, *args, **kwargs):
+        wait = throttling.take_write_token(request)
+        if wait:
+            response = render(
+                request,
+                "generic_message.html",
+                {"content": "You are tweeting too fast, please wait a moment before tweeting again."},
+                status=429,
+            )
+            response["Retry-After"] = throttling.retry_after(wait)
+            return response
+        return super().post(request, *args, **kwargs)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # we want to pass the id of the tweet we are replying to to the template (if we are replying to a tweet)
@@ -117,10 +221,20 @@ class TweetCreateView(FormView):
 
         # To customize the title of the form, we pass the title to the template as a context variable
         if self.request.GET.get("reply_to"):
+            # ADDITION: show the conversation the reply goes into (the tweet and the tweets above it) above the form
+            # the whole chain is read with a single query (see fetch_ancestors in threads.py, the API's tweets/<pk>/context/ uses it too)
+            reply_to = self.request.GET.get("reply_to")
+            chain = threads.fetch_ancestors(int(reply_to)) if reply_to.isdigit() else []
+            if not chain or chain[0]["reply_to_id"] is not None:  # (a deleted tweet above it hides the tweet)
+                raise Http404("No tweet matches the given query.")
+            tweet = chain[-1]
             context["form_header"] = "Reply to tweet"
-            context["form_description"] = "post a reply to the tweet: [{}]".format(
-                get_object_or_404(Tweet, id=self.request.GET.get("reply_to"))
+            context["form_description"] = "post a reply to the tweet: [{} at {}: {}]".format(
+                tweet["user__username"], tweet["created_at"], tweet["text"]
             )
+            nodes = {row["id"]: threads.thread_node(row) for row in chain}
+            counters.fill(nodes)
+            context["form_context"] = rendering.render_threads(list(nodes.values()))
         else:
             context["form_header"] = "Post a tweet"
             context["form_description"] = "Post a tweet to Dwitter"
@@ -146,70 +260,11 @@ class TweetCreateView(FormView):
         tweet = form.save(commit=False)
         tweet.user = self.request.user  # set the user of the tweet to the current user
         tweet.save()
+        trending.schedule()  # (counts the new replies in the background, see trending.py)
+        if tweet.reply_to_id is not None:
+            inbox.schedule()  # (notifies the author of the tweet replied to, in the background, see notifications/inbox.py)
         return super().form_valid(form)
 
 
-# Session 3: Tweet APIs
-# In this session, we will create APIs to get the list of tweets and to create a new tweet
-
-import rest_framework
-from rest_framework import viewsets as drf_viewsets
-from rest_framework import mixins as drf_mixins
-from rest_framework import pagination as drf_pagination
-from rest_framework.authtoken.serializers import AuthTokenSerializer
-from . import serializers, permissions
-import django
-from django.contrib.auth import get_user_model
-
-
-class TweetsAPIViewSet(
-    drf_viewsets.GenericViewSet,
-    drf_mixins.ListModelMixin,
-    drf_mixins.DestroyModelMixin,  # for deleting tweets
-    drf_mixins.CreateModelMixin,  # for model creation (tweet)
-    drf_mixins.RetrieveModelMixin,  # for model retrieval (view tweet)
-):
-    # the docstring is used to generate the documentation for the API
-    """
-    API for user information management and retrieval.
-
-    * **List** [ [index](/api/tweets/) | `GET`, `POST` ]: List all tweets (paginated), or create a new tweet.
-    * **Retrieve Tweet** [ `<pk>` | `GET`, `DELETE`]: obtain tweet information or delete tweet (by looking up pk)
-    """
-
-    authentication_classes = [
-        rest_framework.authentication.SessionAuthentication,
-        rest_framework.authentication.TokenAuthentication,
-    ]  # the authentication classes to use for this viewset
-
-    # similar to the queryset attribute in the TweetListView class, we use the queryset attribute to specify the queryset to use for this viewset
-    # we don't want to return tweets that are replies, so we filter out tweets that are replies
-    # ADDITION: filter out tweets that are replies (i.e. tweets with reply_to=None)
-    queryset = Tweet.objects.all().filter(reply_to=None)  # the queryset to use to look up tweets with no replies
-
-    # pagination could be handled globally in the settings.py file, we can also override the pagination class specific viewsets
-    # see https://www.django-rest-framework.org/api-guide/pagination/#setting-the-pagination-style for more information
-    # see settings.py for global pagination settings used in this project
-
-    # we override this method to use different serializers for different actions
-    def get_serializer_class(self):
-        # ADDITION: use the TweetCreateSerializer for the create action and the TweetSerializer for all other actions
-        if self.action == "create":
-            return serializers.TweetCreateSerializer
-        return serializers.TweetViewSerializer
-
-    # we override this function to use different permissions for different actions
-    def get_permissions(self):
-        """
-        Instantiates and returns the list of permissions that this view requires.
-        """
-        if self.action in ["destroy"]:  # if the action is update/partial_update (profile update)
-            # ADDIITON: use the IsAuthenticated permission class in addition to the IsOwnerOrAdmin permission class
-            # so that only the owner of the tweet or an admin can delete the tweet
-            # set the permission_list to [ rest_framework.permissions.IsAuthenticated, permissions.IsOwnerOrAdmin]
-            permission_list = [permissions.IsOwnerOrAdmin, rest_framework.permissions.IsAuthenticated]
-        else:
-            # ADDITION: set the permission_list to [rest_framework.permissions.IsAuthenticated] so that only authenticated
-            # users can access the rest of the tweet apis
-            permission_list = [rest_framework.permissions.IsAuthenticated]
-        return [permission() for permission in permission_list]
+# Session 3: the tweets APIs (rest framework viewsets) are in api_views.py
+# the html pages don't need rest framework, so it's only imported with the APIs (on the first request to /api/, see dwitter/urls.py)
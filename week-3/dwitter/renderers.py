@@ -0,0 +1,63 @@
+"""
+Project renderers for the APIs (see https://www.django-rest-framework.org/api-guide/renderers/).
+
+Rest framework's JSONRenderer uses python's json module, which spends a lot of time encoding the nested tweet trees.
+So we render JSON with orjson (https://github.com/ijl/orjson) when it's installed, and also offer MessagePack
+(https://msgpack.org/, a binary format that is smaller and faster to decode than JSON) when msgpack is installed.
+Which renderer is used for a request is chosen by content negotiation (the Accept header, or the ?format= parameter),
+see REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"] in settings.py.
+"""
+from rest_framework import renderers
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, we fall back to rest framework's JSONRenderer
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, the MessagePackRenderer is only enabled if it is installed
+    msgpack = None
+
+# rest framework's JSON encoder knows how to encode lazy translation strings, decimals, querysets, ...
+# we use it for the types that orjson and msgpack don't know about, so that the output stays the same
+_default = encoders.JSONEncoder().default
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    Renders exactly what rest framework's JSONRenderer renders (compact JSON), but much faster (with orjson).
+    """
+
+    if orjson is not None:
+        # datetimes are left to rest framework's encoder (which formats UTC as "Z" rather than "+00:00")
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b""
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            # pretty printed JSON (e.g. `Accept: application/json; indent=4`) is not worth optimizing
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(data, default=_default, option=self.options)
+        # just like rest framework, we escape U+2028 and U+2029 so that the output is a strict javascript subset
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    """
+    Renders MessagePack, for clients that send `Accept: application/msgpack` (or use ?format=msgpack).
+    """
+
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None  # binary
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=_default, use_bin_type=True)
@@ -12,12 +12,12 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 
 from pathlib import Path
 import os  # ADDITION: to read environment variables
+from importlib.util import find_spec  # ADDITION: to check for optional dependencies
+import tempfile  # ADDITION: for the default directory of the snowflake worker id locks
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-print("base dir", BASE_DIR) 
-
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.0/howto/deployment/checklist/
 
@@ -49,25 +49,121 @@ INSTALLED_APPS = [
     # ADD local apps here (like in the future we will add 'tweets')
     "dwitter.apps.accounts",  # ADDITION
     "dwitter.apps.tweets",  # ADDITION
+    "dwitter.apps.monitoring",  # ADDITION: request instrumentation
+    "dwitter.apps.notifications",  # ADDITION: the users' inboxes (replies to their tweets)
 ]
 
 LOGIN_REDIRECT_URL = '/' # ADDITION: redirect to home page after login
 
 MIDDLEWARE = [
+    # ADDITION: the monitoring middlewares should come first, so that everything done by the other middlewares is measured as well
+    # per view latency and query metrics, exposed at /metrics (only used when METRICS is True)
+    "dwitter.apps.monitoring.middleware.MetricsMiddleware",
+    # measure queries, serialization and rendering times per request (only used when INSTRUMENTATION is True)
+    "dwitter.apps.monitoring.middleware.InstrumentationMiddleware",
+    # shed low priority writes (e.g. posting tweets) with 503 when the writes pile up (only used when LOAD_SHEDDING is True)
+    "dwitter.apps.monitoring.middleware.LoadSheddingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    # ADDITION: on demand profiling of requests for staff members (needs request.user, so it comes after the authentication middleware)
+    "dwitter.apps.monitoring.middleware.ProfilerMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# ADDITION: get the instrumentation setting from the environment (adds Server-Timing headers and logs query stats per request)
+INSTRUMENTATION = os.environ.get("INSTRUMENTATION", "False") == "True"
+
+# ADDITION: get the metrics setting from the environment (collects per view metrics, exposed in the prometheus format at /metrics)
+# off by default: /metrics tells a lot about the app, it's only served to staff members and to scrapers that send the
+# METRICS_TOKEN (as `Authorization: Bearer <token>`)
+METRICS = os.environ.get("METRICS", "False") == "True"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# ADDITION: get the profiler setting from the environment (lets staff members profile requests with ?profile=1)
+# off by default, like the metrics: turn it on where it's needed (e.g. in development, or to investigate a slow page)
+PROFILER = os.environ.get("PROFILER", "False") == "True"
+PROFILER_INTERVAL = 0.002  # seconds between two samples of the profiled request's stack
+PROFILER_MAX_PROFILES = 100  # only the latest profiles are kept
+
+# ADDITION: token bucket throttles for posting tweets (see dwitter/apps/tweets/throttling.py), per user and for all users together
+# a rate of "30/min" allows bursts of up to 30 tweets, refilled at 30 tweets per minute (set the environment variable to "None" to disable)
+WRITE_THROTTLE_RATES = {
+    "user": os.environ.get("WRITE_THROTTLE_USER_RATE", "30/min"),
+    "global": os.environ.get("WRITE_THROTTLE_GLOBAL_RATE", "100/s"),
+}
+WRITE_THROTTLE_RATES = {scope: None if rate == "None" else rate for scope, rate in WRITE_THROTTLE_RATES.items()}
+# as the writes pile up (see LOAD_SHEDDING below), the buckets are refilled more slowly, down to this factor of their rate
+WRITE_THROTTLE_MIN_FACTOR = float(os.environ.get("WRITE_THROTTLE_MIN_FACTOR", 0.1))
+
+# ADDITION: get the load shedding setting from the environment (sheds low priority writes when the app is overloaded)
+LOAD_SHEDDING = os.environ.get("LOAD_SHEDDING", "True") == "True"
+LOAD_SHEDDING_MAX_WRITES_IN_FLIGHT = int(os.environ.get("LOAD_SHEDDING_MAX_WRITES_IN_FLIGHT", 16))  # write queue depth
+LOAD_SHEDDING_MAX_WRITE_P99 = float(os.environ.get("LOAD_SHEDDING_MAX_WRITE_P99", 2.0))  # seconds, over the last 10 seconds
+LOAD_SHEDDING_RETRY_AFTER = 1  # seconds, sent in the Retry-After header of shed requests
+
+# ADDITION: the html pages render at most THREAD_MAX_REPLIES replies per tweet, THREAD_MAX_DEPTH levels deep
+# the rest of the threads are loaded on demand (see TweetRepliesView in dwitter/apps/tweets/views.py)
+THREAD_MAX_DEPTH = int(os.environ.get("THREAD_MAX_DEPTH", 3))
+THREAD_MAX_REPLIES = int(os.environ.get("THREAD_MAX_REPLIES", 5))
+
+# ADDITION: deleted tweets are purged (with their replies) in batches (see dwitter/apps/tweets/purging.py)
+# by running `python manage.py purge_tweets` (e.g. from a cron job), or (with TWEET_PURGE_IN_BACKGROUND=True) in a background
+# thread of the server, which writes alongside the requests (like the trending thread, only with a database that handles it)
+TWEET_PURGE_IN_BACKGROUND = os.environ.get("TWEET_PURGE_IN_BACKGROUND", "False") == "True"
+TWEET_PURGE_BATCH_SIZE = int(os.environ.get("TWEET_PURGE_BATCH_SIZE", 500))  # tweets marked or deleted per transaction
+TWEET_PURGE_PAUSE = float(os.environ.get("TWEET_PURGE_PAUSE", 0.05))  # seconds between two batches
+
+# ADDITION: new tweets get time ordered 64-bit ids minted by the app instead of the database's auto-increment ids
+# (see dwitter/apps/tweets/snowflake.py), every process claims one of the SNOWFLAKE_WORKER_SLOTS worker ids (0 to 1023)
+# of its machine from SNOWFLAKE_WORKER_ID on (required, a different range on every machine), by locking a file per id
+TWEET_SNOWFLAKE_IDS = os.environ.get("TWEET_SNOWFLAKE_IDS", "False") == "True"
+SNOWFLAKE_WORKER_ID = int(os.environ["SNOWFLAKE_WORKER_ID"]) if os.environ.get("SNOWFLAKE_WORKER_ID") else None
+SNOWFLAKE_WORKER_SLOTS = int(os.environ.get("SNOWFLAKE_WORKER_SLOTS", 1))  # at least the number of processes that mint ids
+SNOWFLAKE_LOCK_DIR = os.environ.get("SNOWFLAKE_LOCK_DIR", tempfile.gettempdir())
+# the jobs that follow the new tweets by id (the trending threads, the notifications) wait until the tweets are this many
+# seconds old: the snowflake ids of several workers are not committed in id order (see TweetManager.settled_after),
+# while SQLite hands out its auto-increment ids in commit order (it has a single writer)
+TWEET_COMMIT_GRACE = float(os.environ.get("TWEET_COMMIT_GRACE", 5 if TWEET_SNOWFLAKE_IDS else 0))
+
+# ADDITION: the counts of likes and retweets are split in TWEET_COUNTER_SHARDS rows per tweet, and every process
+# writes every count right away (TWEET_COUNTER_FLUSH_INTERVAL=0), or adds them up in memory and writes them every
+# TWEET_COUNTER_FLUSH_INTERVAL seconds in a background thread, which writes alongside the requests (like the trending
+# thread, only with a database that handles it), see dwitter/apps/tweets/counters.py
+TWEET_COUNTER_SHARDS = int(os.environ.get("TWEET_COUNTER_SHARDS", 8))
+TWEET_COUNTER_FLUSH_INTERVAL = float(os.environ.get("TWEET_COUNTER_FLUSH_INTERVAL", 0))
+
+# ADDITION: the trending threads (the most replied lately) are updated from the new tweets
+# by running `python manage.py update_trending` (e.g. from a cron job), or (with TRENDING_IN_BACKGROUND=True) in a background
+# thread of the server, which writes to the database alongside the requests (SQLite, with its single writer, then fails
+# some of the requests' writes with "database table is locked", so only turn it on with a database that handles it)
+# see dwitter/apps/tweets/trending.py
+TRENDING_IN_BACKGROUND = os.environ.get("TRENDING_IN_BACKGROUND", "False") == "True"
+TRENDING_INTERVAL = float(os.environ.get("TRENDING_INTERVAL", 60))  # seconds between two updates
+TRENDING_BATCH_SIZE = int(os.environ.get("TRENDING_BATCH_SIZE", 1000))  # new tweets read per transaction
+TRENDING_WINDOW_HOURS = int(os.environ.get("TRENDING_WINDOW_HOURS", 24))  # only the replies of the last hours count
+TRENDING_BUCKET_MINUTES = int(os.environ.get("TRENDING_BUCKET_MINUTES", 60))  # the replies are counted per bucket
+TRENDING_HALF_LIFE_HOURS = float(os.environ.get("TRENDING_HALF_LIFE_HOURS", 6))  # the weight of a bucket halves every ...
+TRENDING_SIZE = int(os.environ.get("TRENDING_SIZE", 50))  # number of trending threads
+
+# ADDITION: the notifications of the replies are delivered to the inboxes in batches (see dwitter/apps/notifications/inbox.py)
+# by running `python manage.py deliver_notifications` (e.g. from a cron job), or (with NOTIFICATIONS_IN_BACKGROUND=True)
+# by a background thread of the server, NOTIFICATIONS_DELAY seconds after a reply is posted (to batch the replies posted
+# in the meantime), which writes alongside the requests (like the trending thread, only with a database that handles it)
+NOTIFICATIONS_IN_BACKGROUND = os.environ.get("NOTIFICATIONS_IN_BACKGROUND", "False") == "True"
+NOTIFICATIONS_DELAY = float(os.environ.get("NOTIFICATIONS_DELAY", 1.0))
+NOTIFICATIONS_BATCH_SIZE = int(os.environ.get("NOTIFICATIONS_BATCH_SIZE", 500))  # tweets read per transaction
+NOTIFICATIONS_KEEP_DAYS = int(os.environ.get("NOTIFICATIONS_KEEP_DAYS", 30))  # older notifications are deleted
+
 ROOT_URLCONF = "dwitter.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # ADDITION: django's backend, which imports the template tag libraries on first use (see dwitter/template_backend.py)
+        "BACKEND": "dwitter.template_backend.DjangoTemplates",
         "DIRS": [os.path.join(BASE_DIR, "templates")],  # ADDITION: add the templates directory
         "APP_DIRS": True,
         "OPTIONS": {
@@ -76,11 +172,16 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                # ADDITION: the number of unread notifications, for the badge in the navigation bar
+                "dwitter.apps.notifications.context_processors.unread_notifications",
             ],
         },
     },
 ]
 
+# ADDITION: the forms' widgets are rendered with the same backend (see dwitter/template_backend.py)
+FORM_RENDERER = "dwitter.template_backend.FormRenderer"
+
 WSGI_APPLICATION = "dwitter.wsgi.application"
 
 
@@ -97,6 +198,8 @@ DATABASES = {
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
+# (django creates the validators once per process, so e.g. the common passwords list is only read from disk by the first signup,
+# see get_default_password_validators in django/contrib/auth/password_validation.py)
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -114,6 +217,13 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# ADDITION: passwords are hashed (on login and signup) in a pool of worker processes, off the request thread (see dwitter/apps/accounts/hashing.py)
+# at most PASSWORD_HASHING_WORKERS passwords are hashed at the same time, and at most PASSWORD_HASHING_MAX_QUEUE wait for a worker
+# (0 workers hashes the passwords in the request thread)
+PASSWORD_HASHING_WORKERS = int(os.environ.get("PASSWORD_HASHING_WORKERS", min(4, os.cpu_count() or 1)))
+PASSWORD_HASHING_MAX_QUEUE = int(os.environ.get("PASSWORD_HASHING_MAX_QUEUE", 64))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.0/topics/i18n/
 
@@ -132,6 +242,15 @@ USE_TZ = True
 STATIC_URL = "static/"
 STATIC_ROOT = os.path.join(BASE_DIR, "static/")  # ADDITION: read static root from environment
 
+# ADDITION: in production (DEBUG = False), collectstatic writes hashed copies and precompressed variants of the static files
+# which are served by dwitter.staticfiles.serve (see dwitter/staticfiles.py and dwitter/urls.py) with far-future caching
+# see https://docs.djangoproject.com/en/4.2/ref/settings/#storages
+if not DEBUG:
+    STORAGES = {
+        "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+        "staticfiles": {"BACKEND": "dwitter.staticfiles.CompressedManifestStaticFilesStorage"},
+    }
+
 MEDIA_URL = "/media/"  # ADDITION: media url
 MEDIA_ROOT = os.path.join(BASE_DIR, "media/")  # ADDITION: read media root from environment
 
@@ -143,14 +262,34 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # ADDITION: add email backend settings
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
+# ADDITION: logging settings, the request instrumentation logs one (JSON) line per request
+# see https://docs.djangoproject.com/en/4.1/topics/logging/
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "dwitter": {"handlers": ["console"], "level": os.environ.get("DWITTER_LOG_LEVEL", "INFO")},
+    },
+}
+
 # ADDITION: Rest Framework settings (we will add them later)
 CORS_ALLOW_ALL_ORIGINS = True # allow all origins for now (not recommended for production)
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework.authentication.SessionAuthentication", # for viewing the browsable API in the browser
-        "rest_framework.authentication.TokenAuthentication", # for using the API with a token
+        "dwitter.apps.accounts.authentication.TokenAuthentication", # for using the API with a token (counts token lookups for /metrics)
     ),
+    # ADDITION: render the APIs with our faster renderers (see dwitter/renderers.py), the renderer is chosen by content negotiation:
+    # JSON by default, MessagePack for "Accept: application/msgpack" (if msgpack is installed), and the browsable API for HTML clients (browsers)
+    "DEFAULT_RENDERER_CLASSES": [
+        "dwitter.renderers.FastJSONRenderer",
+        *(["dwitter.renderers.MessagePackRenderer"] if find_spec("msgpack") else []),
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 5
 }
\ No newline at end of file
@@ -0,0 +1,179 @@
+"""
+Static files with hashed names, precompressed variants and far-future caching.
+
+`python manage.py collectstatic` copies the static files (of the admin, the browsable API, ...) to STATIC_ROOT.
+With the CompressedManifestStaticFilesStorage (used when DEBUG is False, see STORAGES in settings.py) it also:
+
+* writes a copy of every file with a hash of its content in its name (e.g. `base.5af66c1b1797.css`), and {% static %}
+  links to those copies, see https://docs.djangoproject.com/en/4.2/ref/contrib/staticfiles/#manifeststaticfilesstorage
+* writes gzip (`.gz`) and brotli (`.br`, when the brotli package is installed) variants of the compressible files
+
+Since a hashed file never changes (a new version gets a new name), the serve view below lets the browsers cache them
+forever (`Cache-Control: immutable`), so pages don't revalidate their css and js. It serves the precompressed variant
+the browser accepts (Accept-Encoding), reads the large files through mmap, and answers Range requests.
+"""
+import gzip
+import mimetypes
+import mmap
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import parse_etags
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, the static files are only precompressed with gzip without it
+    brotli = None
+
+# the encodings we precompress the static files with, in order of preference
+ENCODINGS = {"br": ".br", "gzip": ".gz"} if brotli is not None else {"gzip": ".gz"}
+# files smaller than this are not worth compressing
+COMPRESS_MIN_SIZE = 256
+COMPRESSIBLE_TYPES = re.compile(r"^(text/.*|application/(javascript|json|xml|.*\+xml|.*\+json)|image/svg\+xml)$")
+# the names of the files hashed by the ManifestStaticFilesStorage (e.g. `css/base.5af66c1b1797.css`)
+HASHED_NAME = re.compile(r"\.[0-9a-f]{12}(\.[^./]+)?$")
+IMMUTABLE = "public, max-age=31536000, immutable"  # a year, see https://developer.mozilla.org/docs/Web/HTTP/Headers/Cache-Control
+# files up to this size are read at once, larger files are memory mapped and streamed in chunks of this size
+CHUNK_SIZE = 256 * 1024
+
+
+def compressible(name):
+    content_type, encoding = mimetypes.guess_type(name)
+    return encoding is None and content_type is not None and COMPRESSIBLE_TYPES.match(content_type) is not None
+
+
+def compress(path):
+    """
+    Write the precompressed variants of the file, unless they already exist or are not smaller than the file.
+    """
+    with open(path, "rb") as file:
+        content = file.read()
+    if len(content) < COMPRESS_MIN_SIZE:
+        return
+    for encoding, suffix in ENCODINGS.items():
+        if os.path.exists(path + suffix) and os.path.getmtime(path + suffix) >= os.path.getmtime(path):
+            continue
+        if encoding == "br":
+            compressed = brotli.compress(content, quality=11)
+        else:
+            compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        if len(compressed) >= len(content):
+            continue
+        # write to a temporary file first, so that the server never serves a half written variant
+        with open(path + suffix + ".tmp", "wb") as file:
+            file.write(compressed)
+        os.replace(path + suffix + ".tmp", path + suffix)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    The ManifestStaticFilesStorage, which also writes precompressed variants of the hashed files.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()):
+            if compressible(name) and self.exists(name):
+                compress(self.path(name))
+
+
+def accepted_encodings(request):
+    # the encodings of the Accept-Encoding header (without the ones refused with q=0)
+    accepted = set()
+    for item in request.headers.get("Accept-Encoding", "").split(","):
+        encoding, _, params = item.partition(";")
+        if re.match(r"^\s*q\s*=\s*0(\.0*)?\s*$", params):
+            continue
+        accepted.add(encoding.strip().lower())
+    return accepted
+
+
+def parse_range(header, size):
+    """
+    Return the (start, end) (end excluded) of a single `bytes=` range, None to serve the whole file
+    (no range, or several ranges), or raise ValueError when the range can't be satisfied.
+    """
+    match = re.match(r"^bytes=(\d*)-(\d*)$", header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":  # the last `last` bytes
+        start, end = max(0, size - int(last)), size
+    else:
+        start, end = int(first), size if last == "" else min(size, int(last) + 1)
+    if start >= end:
+        raise ValueError(header)
+    return start, end
+
+
+def read(path, start, end):
+    # an iterator over the bytes of the file from start to end, memory mapped (the pages are shared with the os's cache)
+    with open(path, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for offset in range(start, end, CHUNK_SIZE):
+                yield mapped[offset : min(end, offset + CHUNK_SIZE)]
+
+
+def serve(request, path):
+    """
+    Serve a static file from STATIC_ROOT (collected with collectstatic), see the module's docstring.
+    """
+    if request.method not in ("GET", "HEAD"):
+        return HttpResponseNotAllowed(["GET", "HEAD"])
+    try:
+        filename = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Invalid path.")
+    if not os.path.isfile(filename):
+        raise Http404("File not found.")
+
+    headers = {
+        "Cache-Control": IMMUTABLE if HASHED_NAME.search(path) else "no-cache",
+        "Vary": "Accept-Encoding",
+        "Accept-Ranges": "bytes",
+    }
+    content_type, encoding = mimetypes.guess_type(filename)
+    range_header = request.headers.get("Range")
+    if not range_header and encoding is None:
+        # the precompressed variant the browser accepts (byte ranges are ranges of the file, so they are served uncompressed)
+        accepted = accepted_encodings(request)
+        for encoding, suffix in ENCODINGS.items():
+            if encoding in accepted and os.path.isfile(filename + suffix):
+                filename = filename + suffix
+                headers["Content-Encoding"] = encoding
+                break
+    stat = os.stat(filename)
+    size = stat.st_size
+    headers["Content-Type"] = content_type or "application/octet-stream"
+    headers["ETag"] = '"{:x}-{:x}{}"'.format(stat.st_mtime_ns, size, headers.get("Content-Encoding", ""))
+
+    # the header can list several tags, weak ones (W/"..."), or be "*" (see https://httpwg.org/specs/rfc9110.html#field.if-none-match)
+    # and If-None-Match compares them weakly: W/"x" matches "x"
+    if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+    if "*" in if_none_match or headers["ETag"] in (tag.removeprefix("W/") for tag in if_none_match):
+        return HttpResponse(status=304, headers=headers)
+    status, start, end = 200, 0, size
+    if range_header and request.headers.get("If-Range", headers["ETag"]) == headers["ETag"]:
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            return HttpResponse(status=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if byte_range is not None:
+            status, (start, end) = 206, byte_range
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    headers["Content-Length"] = str(end - start)
+
+    if request.method == "HEAD" or start == end:
+        return HttpResponse(status=status, headers=headers)
+    if end - start <= CHUNK_SIZE:
+        with open(filename, "rb") as file:
+            file.seek(start)
+            return HttpResponse(file.read(end - start), status=status, headers=headers)
+    return StreamingHttpResponse(read(filename, start, end), status=status, headers=headers)
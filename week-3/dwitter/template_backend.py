@@ -0,0 +1,74 @@
+"""
+Django's template backend, with the template tag libraries loaded on first use.
+
+Django imports the template tag libraries of every installed app when it creates the template engine (i.e. when the
+first template is rendered), whether the templates use them or not. Rest framework's library (used by the browsable
+API's templates) imports most of rest framework, markdown and pygments, which takes tens of milliseconds: every worker
+would pay for it on its first html page, even if it never renders the browsable API.
+
+With this backend (see TEMPLATES and FORM_RENDERER in settings.py), a library is imported when a template first loads
+it ({% load ... %}).
+See https://docs.djangoproject.com/en/4.1/howto/custom-template-tags/#code-layout for where the libraries are found.
+"""
+import pkgutil
+from collections.abc import Mapping
+from importlib import import_module
+
+from django.apps import apps
+from django.forms import renderers
+from django.template.backends import django as django_backend
+from django.template.library import import_library
+
+
+def installed_libraries():
+    """
+    The {name: module} of the template tag libraries of the installed apps (like django's get_installed_libraries),
+    found without importing them.
+    """
+    libraries = {}
+    for package in ["django.templatetags"] + [f"{app.name}.templatetags" for app in apps.get_app_configs()]:
+        try:
+            module = import_module(package)  # (the templatetags packages themselves are usually empty)
+        except ImportError:
+            continue
+        for info in pkgutil.iter_modules(getattr(module, "__path__", [])):
+            libraries[info.name] = f"{package}.{info.name}"
+    return libraries
+
+
+class LazyLibraries(Mapping):
+    """
+    The engine's {name: Library}, where the libraries are imported on first access.
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.loaded = {}
+
+    def __getitem__(self, name):
+        if name not in self.loaded:
+            self.loaded[name] = import_library(self.paths[name])
+        return self.loaded[name]
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    def get_templatetag_libraries(self, custom_libraries):
+        # the engine is created without libraries (so it doesn't import them), they are given to it lazily in __init__
+        self.library_paths = {**installed_libraries(), **custom_libraries}
+        return {}
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.engine.libraries = self.library_paths
+        self.engine.template_libraries = LazyLibraries(self.library_paths)
+
+
+class FormRenderer(renderers.DjangoTemplates):
+    # the forms render their widgets with an engine of their own (see https://docs.djangoproject.com/en/4.1/ref/forms/renderers/)
+    backend = DjangoTemplates
@@ -16,9 +16,14 @@ Including another URLconf
 
 from django.contrib import admin
 from django.urls import path
-from django.urls import include  # ADDITION
+import re  # ADDITION
+from django.conf import settings  # ADDITION
+from django.urls import include, re_path  # ADDITION
+from dwitter import staticfiles  # ADDITION
 from dwitter.apps.accounts import views as accounts_views  # ADDITION
 from dwitter.apps.tweets import views as tweets_views  # ADDITION
+from dwitter.apps.monitoring import views as monitoring_views  # ADDITION
+from dwitter.apps.notifications import views as notifications_views  # ADDITION
 
 # we can use the include function to include the urls from another app
 # we connect the urls from django's authentication system to our app by including the urls from django.contrib.auth.urls
@@ -38,22 +43,7 @@ from dwitter.apps.tweets import views as tweets_views  # ADDITION
 #     path("admin/", admin.site.urls),
 # admin configurations are definend in dwitter/apps/*/admin.py files
 
-# Session 3: adding a base router for the APIs and connecting APIs to our django app urls (at /api/)
-from rest_framework import routers
-
-# Routers provide an easy way of automatically determining the URL conf.
-# we can use the DefaultRouter to create a default router that will register all our viewsets with it
-# see https://www.django-rest-framework.org/api-guide/routers/#defaultrouter for more info
-#
-router = routers.DefaultRouter()
-router.get_api_root_view().cls.__name__ = (
-    "Dwitter API"  # customize the name of the root view (shown in the browsable API)
-)
-router.get_api_root_view().cls.__doc__ = "Fully browsable API for the Dwitter project."  # customize the description of the root view (shown in the browsable API)
-
-# ADDITION: connect the rest viewsets to the router using router.register
-router.register("accounts", accounts_views.AccountsAPIViewSet, basename="accounts")
-router.register("tweets", tweets_views.TweetsAPIViewSet, basename="tweets")
+# Session 3: the APIs' urls (the rest framework router) are in dwitter/api_urls.py, included at /api/
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -63,10 +53,25 @@ urlpatterns = [
     # tweet urls
     path("", tweets_views.TweetsListView.as_view(), name="index"),  # ADDITION: add the index url
     path("tweet/", tweets_views.TweetCreateView.as_view(), name="tweet"),  # ADDITION: add the tweet url
-    # rest framework urls
     path(
-        "api/auth/", include("rest_framework.urls", namespace="rest_framework")
-    ),  # ADDITION: include the rest framework urls (e.g.: for session auth in browsable api)
+        "tweet/<int:pk>/replies/", tweets_views.TweetRepliesView.as_view(), name="tweet-replies"
+    ),  # ADDITION: the next replies of a tweet (html fragment, for the "load more replies" links)
+    path(
+        "users/<str:username>/", tweets_views.UserTweetsView.as_view(), name="user-tweets"
+    ),  # ADDITION: the profile page of a user, with their tweets
+    # notification urls
+    path(
+        "notifications/", notifications_views.NotificationsView.as_view(), name="notifications"
+    ),  # ADDITION: the notifications of the current user (the replies to their tweets)
     # api urls
-    path("api/", include(router.urls)),  # ADDITION: include the api urls
+    path("api/", include("dwitter.api_urls")),  # ADDITION: include the api urls
+    # monitoring urls
+    path("metrics", monitoring_views.metrics_view, name="metrics"),  # ADDITION: prometheus metrics
 ]
+
+# ADDITION: in development, runserver serves the static files (see https://docs.djangoproject.com/en/4.1/howto/static-files/)
+# in production, the collected static files are served by our view, with caching and precompression (see dwitter/staticfiles.py)
+if not settings.DEBUG:
+    urlpatterns.append(
+        re_path(rf"^{re.escape(settings.STATIC_URL.lstrip('/'))}(?P<path>.+)$", staticfiles.serve, name="static")
+    )